@@ -0,0 +1,107 @@
+"""
+Concurrent /ask latency benchmark for the RAG service.
+
+Fires `--requests` /ask calls with `--concurrency` in flight while probing
+/health in the background, then prints p50/p95/p99 for both. A blocked event
+loop shows up as /health latency tracking /ask latency.
+
+Run it against a build before and after a change and compare the JSON output:
+
+    python -m benchmarks.ask_concurrency --url http://localhost:8001 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+import httpx
+
+QUERIES = [
+    "I feel lost and don't know what my purpose is",
+    "How do I deal with anxiety about exam results?",
+    "Why should I keep working when I see no reward?",
+    "How can I control my anger towards my family?",
+    "What does the Gita say about fear of death?",
+    "I keep comparing myself with my friends, how do I stop?",
+]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+def summarize(samples: List[float], errors: int = 0) -> Dict:
+    return {
+        "count": len(samples),
+        "errors": errors,
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "max_ms": round(max(samples) * 1000, 2) if samples else 0.0,
+    }
+
+
+async def run(url: str, total: int, concurrency: int, health_interval: float, timeout: float) -> Dict:
+    ask_latencies: List[float] = []
+    health_latencies: List[float] = []
+    ask_errors = 0
+    done = asyncio.Event()
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency + 2)
+
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        async def ask(i: int):
+            nonlocal ask_errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/ask", json={"query": QUERIES[i % len(QUERIES)]})
+                    response.raise_for_status()
+                    ask_latencies.append(time.perf_counter() - started)
+                except httpx.HTTPError:
+                    ask_errors += 1
+
+        async def probe_health():
+            while not done.is_set():
+                started = time.perf_counter()
+                try:
+                    await client.get("/health")
+                    health_latencies.append(time.perf_counter() - started)
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(health_interval)
+
+        prober = asyncio.create_task(probe_health())
+        started = time.perf_counter()
+        await asyncio.gather(*(ask(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await prober
+
+    return {
+        "url": url,
+        "requests": total,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(ask_latencies) / elapsed, 2) if elapsed else 0.0,
+        "ask": summarize(ask_latencies, ask_errors),
+        "health": summarize(health_latencies),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--health-interval", type=float, default=0.05, help="seconds between /health probes")
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.url, args.requests, args.concurrency, args.health_interval, args.timeout))
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,83 @@
+"""
+Parity check and latency/throughput benchmark for the embedding backends.
+
+Parity: every backend embeds the Gita corpus and the sample questions; the
+query-verse cosine similarity matrix must match the torch reference within
+--tolerance (max absolute difference), and top-1 retrieval should agree.
+
+    python -m benchmarks.embedding_backends --backends torch torch-int8 onnx onnx-int8 --threads 2
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.ask_concurrency import QUERIES, percentile
+from rag_service.corpus import load_gita_dataframe
+from rag_service.embedding_backends import EMBEDDING_BACKENDS, load_embedding_model
+from rag_service.local_index import normalize_rows
+from shared.config import EMBEDDING_MODEL
+
+
+def measure(model, corpus: List[str], batch_size: int, single_runs: int) -> Dict:
+    model.encode(QUERIES[:2])  # warm-up
+    single = []
+    for i in range(single_runs):
+        started = time.perf_counter()
+        model.encode(QUERIES[i % len(QUERIES)])
+        single.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    corpus_vectors = model.encode(corpus, batch_size=batch_size, convert_to_numpy=True)
+    elapsed = time.perf_counter() - started
+    return {
+        "single_query_p50_ms": round(percentile(single, 50) * 1000, 2),
+        "single_query_p99_ms": round(percentile(single, 99) * 1000, 2),
+        "batch_throughput_per_s": round(len(corpus) / elapsed, 1),
+        "corpus_vectors": normalize_rows(corpus_vectors),
+        "query_vectors": normalize_rows(model.encode(QUERIES, convert_to_numpy=True)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--single-runs", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=0, help="embed only the first N verses")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="max allowed |cosine difference|")
+    args = parser.parse_args()
+
+    corpus = load_gita_dataframe()["EngMeaning"].tolist()
+    if args.limit:
+        corpus = corpus[:args.limit]
+
+    reference = None
+    report, failed = {"model": args.model, "verses": len(corpus), "threads": args.threads, "backends": {}}, False
+    for backend in ["torch"] + [b for b in args.backends if b != "torch"]:
+        started = time.perf_counter()
+        model = load_embedding_model(args.model, backend=backend, threads=args.threads)
+        result = measure(model, corpus, args.batch_size, args.single_runs)
+        result["load_s"] = round(time.perf_counter() - started, 2)
+        similarities = result.pop("query_vectors") @ result.pop("corpus_vectors").T
+        if reference is None:
+            reference = similarities
+        else:
+            diff = np.abs(similarities - reference)
+            top1_agreement = float(np.mean(similarities.argmax(axis=1) == reference.argmax(axis=1)))
+            result["parity"] = {
+                "max_abs_cosine_diff": round(float(diff.max()), 5),
+                "mean_abs_cosine_diff": round(float(diff.mean()), 5),
+                "top1_agreement": round(top1_agreement, 4),
+                "passed": bool(diff.max() <= args.tolerance),
+            }
+            failed |= not result["parity"]["passed"]
+        if backend in args.backends:
+            report["backends"][backend] = result
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failed else 0)
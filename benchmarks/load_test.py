@@ -0,0 +1,292 @@
+"""
+Open-loop load test of the gateway's /ask and /speak paths.
+
+Requests arrive as a Poisson process at `--rate` per second for `--duration`
+seconds, whether or not earlier ones have finished, so queueing shows up as
+latency and errors instead of silently lowering the offered load. Each arrival
+is one scenario from the mix:
+
+    greeting  - small talk that takes the is_conversational shortcut
+    single    - a first-turn question (retrieval + LLM)
+    multi     - a follow-up with conversation history and a previous summary
+    verse     - a question naming a verse ("BG 2.47", "chapter 3 verse 19")
+    speak     - /speak with an answer-sized text
+
+With --spawn the four services are started locally on --base-port.. with
+stand-ins for the external dependencies (benchmarks/stand_ins.py): the simulated
+LLM backend for Gemini, the numpy index for Qdrant (build it first with
+`python -m rag_service.client --local-index`) and a fake gTTS. Otherwise --url
+points at a running gateway.
+
+The JSON report (per-scenario throughput, p50/p95/p99, status codes, error
+rate, plus the commit and settings) is printed and can be saved for comparison:
+
+    python -m benchmarks.load_test --spawn --rate 5 --duration 60 > before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.ask_concurrency import QUERIES, summarize
+
+SCENARIOS = ("greeting", "single", "multi", "verse", "speak")
+DEFAULT_MIX = "greeting=0.2,single=0.35,multi=0.2,verse=0.1,speak=0.15"
+SERVICES = ("llm", "rag", "t2s", "gateway")
+
+GREETINGS = ["hi", "hello there", "good morning", "hey, how are you?", "thank you so much", "ok bye", "thanks!"]
+OPENERS = ["", "Lately ", "Honestly, ", "Since my exams, ", "At work ", "After the breakup, "]
+FOLLOW_UPS = [
+    "Can you explain that differently?",
+    "But how do I actually practise that every day?",
+    "What if I fail even after trying my best?",
+    "Can you simplify the meaning of that verse?",
+    "How does this apply to my family situation?",
+]
+REFERENCES = ["What does BG {c}.{v} mean?", "Explain chapter {c} verse {v}", "Gita {c}.{v} in simple words"]
+# Verses that exist in every chapter, so references always resolve
+MAX_SAFE_VERSE = 20
+USER_TYPES = ["genz", "mature", "neutral"]
+SPEAK_SENTENCES = [
+    "Dear friend, what you are feeling is human.",
+    "Krishna reminds Arjuna that the mind settles through steady practice.",
+    "Do the work in front of you, and let go of the need to control the outcome.",
+    "Small, sincere actions repeated every day carry great strength.",
+    "You are not your failures, nor your successes.",
+]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario '{name}', expected one of {SCENARIOS}")
+        mix[name] = float(weight)
+    return mix
+
+
+def build_request(scenario: str, rng: random.Random):
+    """(path, JSON body) for one arrival of `scenario`."""
+    if scenario == "greeting":
+        return "/ask", {"query": rng.choice(GREETINGS), "user_type": rng.choice(USER_TYPES)}
+    if scenario == "single":
+        query = rng.choice(OPENERS) + rng.choice(QUERIES)
+        return "/ask", {"query": query, "user_type": rng.choice(USER_TYPES)}
+    if scenario == "multi":
+        history = []
+        for _ in range(rng.randint(1, 4)):
+            history.append({"role": "user", "content": rng.choice(QUERIES)})
+            history.append({"role": "assistant", "content": " ".join(rng.sample(SPEAK_SENTENCES, 3))})
+        return "/ask", {
+            "query": rng.choice(FOLLOW_UPS),
+            "user_type": rng.choice(USER_TYPES),
+            "history": history,
+            "previous_summary": "The user is struggling with " + rng.choice(QUERIES).lower(),
+        }
+    if scenario == "verse":
+        query = rng.choice(REFERENCES).format(c=rng.randint(1, 18), v=rng.randint(1, MAX_SAFE_VERSE))
+        return "/ask", {"query": query, "user_type": rng.choice(USER_TYPES)}
+    text = " ".join(rng.choice(SPEAK_SENTENCES) for _ in range(rng.randint(3, 12)))
+    return "/speak", {"text": text, "lang": rng.choice(["en", "en", "hi"])}
+
+
+async def run(url: str, rate: float, duration: float, mix: Dict[str, float], seed: int,
+              timeout: float, max_connections: int) -> Dict:
+    rng = random.Random(seed)
+    names, weights = list(mix), [mix[name] for name in mix]
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, Counter] = defaultdict(Counter)
+    cache: Dict[str, Counter] = defaultdict(Counter)
+    in_flight, peak_in_flight = 0, 0
+
+    limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        async def fire(scenario: str, path: str, body: Dict):
+            nonlocal in_flight, peak_in_flight
+            in_flight += 1
+            peak_in_flight = max(peak_in_flight, in_flight)
+            started = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                await response.aread()
+                statuses[scenario][str(response.status_code)] += 1
+                if response.is_success:
+                    latencies[scenario].append(time.perf_counter() - started)
+                if "x-cache" in response.headers:
+                    cache[scenario][response.headers["x-cache"]] += 1
+            except httpx.TimeoutException:
+                statuses[scenario]["timeout"] += 1
+            except httpx.HTTPError as e:
+                statuses[scenario][type(e).__name__] += 1
+            finally:
+                in_flight -= 1
+
+        tasks = []
+        started = time.perf_counter()
+        next_arrival = started
+        while True:
+            next_arrival += rng.expovariate(rate)
+            if next_arrival - started >= duration:
+                break
+            scenario = rng.choices(names, weights)[0]
+            path, body = build_request(scenario, rng)
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            tasks.append(asyncio.create_task(fire(scenario, path, body)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    report = {}
+    for scenario in names:
+        count = sum(statuses[scenario].values())
+        errors = count - len(latencies[scenario])
+        report[scenario] = {
+            **summarize(latencies[scenario], errors),
+            "requests": count,
+            "error_rate": round(errors / count, 4) if count else 0.0,
+            "throughput_rps": round(len(latencies[scenario]) / elapsed, 3),
+            "status_codes": dict(statuses[scenario]),
+        }
+        if cache[scenario]:
+            report[scenario]["x_cache"] = dict(cache[scenario])
+    total = sum(r["requests"] for r in report.values())
+    succeeded = sum(r["count"] for r in report.values())
+    return {
+        "offered_rps": rate,
+        "elapsed_s": round(elapsed, 3),
+        "requests": total,
+        "throughput_rps": round(succeeded / elapsed, 3) if elapsed else 0.0,
+        "error_rate": round((total - succeeded) / total, 4) if total else 0.0,
+        "peak_in_flight": peak_in_flight,
+        "scenarios": report,
+    }
+
+
+class LocalStack:
+    """The four services as subprocesses with stand-in upstreams, torn down on exit."""
+
+    def __init__(self, base_port: int, env: Dict[str, str], t2s_latency_ms: float, log_dir: str):
+        self.ports = {name: base_port + i for i, name in enumerate(SERVICES)}
+        self.env = {
+            **os.environ,
+            "LLM_BACKEND": "simulated",
+            "RETRIEVER_BACKEND": "numpy",
+            **{f"{name.upper()}_SERVICE_URL": f"http://127.0.0.1:{port}" for name, port in self.ports.items()},
+            **{f"{name.upper()}_SERVICE_PORT": str(port) for name, port in self.ports.items()},
+            **env,
+        }
+        self.t2s_latency_ms = t2s_latency_ms
+        self.log_dir = log_dir
+        self.processes: Dict[str, subprocess.Popen] = {}
+
+    @property
+    def gateway_url(self) -> str:
+        return f"http://127.0.0.1:{self.ports['gateway']}"
+
+    def start(self):
+        for name, port in self.ports.items():
+            command = [sys.executable, "-m", "benchmarks.stand_ins", name, "--port", str(port)]
+            if name == "t2s":
+                command += ["--t2s-latency-ms", str(self.t2s_latency_ms)]
+            log = open(os.path.join(self.log_dir, f"{name}.log"), "w")
+            self.processes[name] = subprocess.Popen(command, env=self.env, stdout=log, stderr=subprocess.STDOUT)
+
+    async def wait_ready(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient(timeout=5) as client:
+            for name, port in self.ports.items():
+                while True:
+                    if self.processes[name].poll() is not None:
+                        raise RuntimeError(f"{name} exited during startup, see {self.log_dir}/{name}.log")
+                    try:
+                        if (await client.get(f"http://127.0.0.1:{port}/ready")).status_code == 200:
+                            break
+                    except httpx.HTTPError:
+                        pass
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"{name} not ready after {timeout}s, see {self.log_dir}/{name}.log")
+                    await asyncio.sleep(0.5)
+
+    def stop(self):
+        for process in self.processes.values():
+            process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args) -> Dict:
+    mix = parse_mix(args.mix)
+    stack, url = None, args.url
+    if args.spawn:
+        env = {
+            "SIM_LATENCY_MODEL": args.sim_latency_model,
+            "SIM_TTFT_MS": str(args.sim_ttft_ms),
+            "SIM_TOKENS_PER_SECOND": str(args.sim_tokens_per_second),
+            "SIM_ERROR_RATE": str(args.sim_error_rate),
+            "SIM_TRACE_PATH": args.sim_trace or "",
+            "SIM_SEED": str(args.seed),
+        }
+        if args.no_cache:
+            env.update({"GATEWAY_CACHE_SIZE": "0", "RESPONSE_CACHE_SIZE": "0"})
+        stack = LocalStack(args.base_port, env, args.t2s_latency_ms, tempfile.mkdtemp(prefix="divinegpt-load-"))
+        stack.start()
+        url = stack.gateway_url
+    try:
+        if stack:
+            await stack.wait_ready(args.ready_timeout)
+        results = await run(url, args.rate, args.duration, mix, args.seed, args.timeout, args.max_connections)
+    finally:
+        if stack:
+            stack.stop()
+    return {
+        "commit": current_commit(),
+        "url": url,
+        "spawned": bool(stack),
+        "settings": {k: v for k, v in vars(args).items() if k not in ("url", "spawn")},
+        **results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8002", help="gateway to drive (ignored with --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="start all services locally with stand-in upstreams")
+    parser.add_argument("--base-port", type=int, default=8100, help="with --spawn: llm, rag, t2s, gateway ports")
+    parser.add_argument("--rate", type=float, default=5, help="offered load, requests per second")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of arrivals")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario weights")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout, seconds")
+    parser.add_argument("--max-connections", type=int, default=1000)
+    parser.add_argument("--ready-timeout", type=float, default=300, help="with --spawn: wait for /ready")
+    parser.add_argument("--no-cache", action="store_true", help="with --spawn: disable gateway and semantic caches")
+    parser.add_argument("--sim-latency-model", default="lognormal", choices=("fixed", "lognormal", "trace"))
+    parser.add_argument("--sim-ttft-ms", type=float, default=400)
+    parser.add_argument("--sim-trace", help="timings recorded with LLM_TRACE_PATH, for --sim-latency-model trace")
+    parser.add_argument("--sim-tokens-per-second", type=float, default=80)
+    parser.add_argument("--sim-error-rate", type=float, default=0.0)
+    parser.add_argument("--t2s-latency-ms", type=float, default=300)
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(main(args)), indent=2))
@@ -0,0 +1,91 @@
+"""
+Recall@k and latency of compressed first-pass search vs exact float32 cosine.
+
+Ground truth is exact float32 cosine over the whole bundle, which is the
+ranking the Qdrant collection (Distance.COSINE) returns for this corpus size.
+Queries are the sample questions below encoded with the bundle's model, or,
+with --synthetic, verse vectors perturbed with Gaussian noise (no model needed).
+
+    python -m rag_service.client --local-index
+    python -m benchmarks.quantization_recall --k 1 3 10
+"""
+import argparse
+import json
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.ask_concurrency import QUERIES
+from rag_service.local_index import LocalGitaIndex, normalize_rows
+from shared.config import LOCAL_INDEX_DIR
+
+CONFIGS = [
+    {"quantization": "none"},
+    {"quantization": "int8"},
+    {"quantization": "binary"},
+    {"quantization": "none", "truncate_dim": 128},
+    {"quantization": "int8", "truncate_dim": 128},
+    {"quantization": "binary", "truncate_dim": 256},
+]
+
+
+def load_queries(index: LocalGitaIndex, synthetic: int, noise: float) -> np.ndarray:
+    if synthetic:
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(index), size=min(synthetic, len(index)), replace=False)
+        base = np.asarray(index.embeddings[np.sort(rows)], dtype=np.float32)
+        return normalize_rows(base + rng.normal(0, noise, base.shape).astype(np.float32))
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(index.meta["embedding_model"])
+    return normalize_rows(model.encode(QUERIES, convert_to_numpy=True))
+
+
+def evaluate(index_dir: str, queries: np.ndarray, ks: List[int], rescore_multiplier: int, repeats: int) -> Dict:
+    exact = LocalGitaIndex.load(index_dir)
+    max_k = max(ks)
+    truth_by_k = {k: [set(exact.search_ids(q, top_k=k)) for q in queries] for k in ks}
+    results = []
+    for config in CONFIGS:
+        index = LocalGitaIndex.load(index_dir, rescore_multiplier=rescore_multiplier, **config)
+        for rescore in ([False, True] if index.codes is not None else [False]):
+            recall = {}
+            for k in ks:
+                hits = [len(set(index.search_ids(q, top_k=k, rescore=rescore)) & truth_by_k[k][i]) / k
+                        for i, q in enumerate(queries)]
+                recall[f"recall@{k}"] = round(float(np.mean(hits)), 4)
+            started = time.perf_counter()
+            for _ in range(repeats):
+                for q in queries:
+                    index.search_ids(q, top_k=max_k, rescore=rescore)
+            latency_us = (time.perf_counter() - started) / (repeats * len(queries)) * 1e6
+            results.append({
+                **config,
+                "rescore": rescore,
+                **recall,
+                "latency_us": round(latency_us, 1),
+                "resident_bytes": index.memory_bytes()["codes"] or index.memory_bytes()["full_precision"],
+            })
+    return {
+        "verses": len(exact),
+        "dimension": exact.dimension,
+        "queries": len(queries),
+        "float32_bytes": exact.memory_bytes()["full_precision"],
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-dir", default=LOCAL_INDEX_DIR)
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 10])
+    parser.add_argument("--rescore-multiplier", type=int, default=4)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--synthetic", type=int, default=0, metavar="N",
+                        help="use N noisy verse vectors as queries instead of encoding sample questions")
+    parser.add_argument("--noise", type=float, default=0.02)
+    args = parser.parse_args()
+
+    index = LocalGitaIndex.load(args.index_dir)
+    queries = load_queries(index, args.synthetic, args.noise)
+    print(json.dumps(evaluate(args.index_dir, queries, args.k, args.rescore_multiplier, args.repeats), indent=2))
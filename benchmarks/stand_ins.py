@@ -0,0 +1,53 @@
+"""
+Runs one service with its external dependency replaced by a local stand-in, for load tests.
+
+    llm      - LLM_BACKEND=simulated (set by the caller's environment; see llm_service/simulated.py)
+    rag      - RETRIEVER_BACKEND=numpy, the in-process index instead of Qdrant (set by the caller)
+    t2s      - gTTS replaced by a fake that blocks like the real network call and returns MP3-sized bytes
+    gateway  - no external dependency
+
+    python -m benchmarks.stand_ins t2s --port 8103 --t2s-latency-ms 300
+"""
+import argparse
+import importlib
+import time
+
+import uvicorn
+
+APPS = {
+    "llm": "llm_service.main",
+    "rag": "rag_service.main",
+    "t2s": "t2s_service.main",
+    "gateway": "gateway_service.main",
+}
+
+# gTTS returns roughly 1 KB of 32 kbps MP3 per 15 characters of text
+MP3_BYTES_PER_CHAR = 70
+
+
+def fake_gtts(latency_ms: float, per_char_ms: float):
+    class FakeGTTS:
+        def __init__(self, text: str, lang: str = "en", **kwargs):
+            self.text = text
+            self.lang = lang
+
+        def write_to_fp(self, fp):
+            # Blocking on purpose: gTTS does a synchronous HTTP round trip per sentence
+            time.sleep((latency_ms + per_char_ms * len(self.text)) / 1000)
+            fp.write(b"\xff\xf3" + bytes(MP3_BYTES_PER_CHAR * len(self.text)))
+
+    return FakeGTTS
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("service", choices=sorted(APPS))
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--t2s-latency-ms", type=float, default=300, help="fixed cost of one fake gTTS call")
+    parser.add_argument("--t2s-per-char-ms", type=float, default=0.5, help="added fake gTTS cost per character")
+    args = parser.parse_args()
+
+    module = importlib.import_module(APPS[args.service])
+    if args.service == "t2s":
+        module.gTTS = fake_gtts(args.t2s_latency_ms, args.t2s_per_char_ms)
+    uvicorn.run(module.app, host="127.0.0.1", port=args.port, log_level="warning")
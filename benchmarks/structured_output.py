@@ -0,0 +1,135 @@
+"""
+Recovery rate and cost of the incremental structured-output parser vs the legacy path
+(greedy `re.search(r'\\{.*\\}', re.DOTALL)` + `json.loads`, as parse_llm_response used to do).
+
+The built-in corpus reproduces the failure modes seen from Gemini with the RAG prompt:
+markdown fences, the missing comma copied from the prompt's example object, trailing
+commas, unquoted values, raw newlines in strings, trailing prose with braces, and
+output cut off by max_output_tokens. Captured outputs can be added with
+--corpus file.jsonl (one {"output": "..."} per line).
+
+    python -m benchmarks.structured_output --repeats 200 --chunk-size 8
+"""
+import argparse
+import json
+import re
+import time
+from typing import Dict, List
+
+from benchmarks.ask_concurrency import percentile
+from rag_service.structured_output import StructuredOutputParser, parse_structured_output
+
+FIELDS = ["shloka", "meaning", "shloka_summary", "response", "reflection", "emotion", "new_summary"]
+
+_RESPONSE = ("Dear friend, the restlessness you feel is not a flaw. It is the mind doing what minds do. "
+             "Krishna reminds Arjuna that the mind can be trained through steady practice and detachment. ") * 3
+
+
+def _answer(**overrides) -> Dict:
+    answer = {
+        "shloka": "असंशयं महाबाहो मनो दुर्निग्रहं चलम्। अभ्यासेन तु कौन्तेय वैराग्येण च गृह्यते॥",
+        "meaning": "Undoubtedly, O mighty-armed, the mind is restless and hard to control; "
+                   "but it is restrained by practice and detachment.",
+        "shloka_summary": "Steady practice calms a restless mind.",
+        "response": _RESPONSE,
+        "reflection": "What is one small practice you could return to every morning this week?",
+        "emotion": "Anxious",
+        "new_summary": "The user feels restless; Krishna suggests practice and detachment.",
+    }
+    answer.update(overrides)
+    return answer
+
+
+def _json(answer: Dict, indent=None) -> str:
+    return json.dumps(answer, ensure_ascii=False, indent=indent)
+
+
+def builtin_corpus() -> List[str]:
+    clean = _json(_answer(), indent=2)
+    return [
+        clean,
+        f"```json\n{clean}\n```",
+        f"Here is your answer:\n```json\n{clean}\n```\nI hope this helps {{with love}}.",
+        clean.replace('"Anxious",', '"Anxious"'),  # missing comma, as in the prompt's example
+        clean[:-2] + ",\n}",  # trailing comma
+        clean.replace('"Anxious"', "Anxious"),  # unquoted value
+        clean.replace("the mind doing what minds do. ", "the mind doing\nwhat minds do.\n"),  # raw newlines
+        clean.replace('"new_summary": "', '"new_summary": <').replace('detachment."\n}', 'detachment.>"\n}'),
+        clean[: len(clean) * 2 // 3],  # truncated inside "response"
+        clean[: len(clean) - 60],  # truncated inside "new_summary"
+        _json(_answer(response=_RESPONSE.replace("Krishna", "Krishna 🙏"))).encode("unicode_escape").decode("ascii")
+        .replace("\\\\u", "\\u"),
+        "My friend, I could not shape that into the right format, but know that you are not alone.",
+    ]
+
+
+def legacy_parse(text: str) -> Dict:
+    match = re.search(r'\{.*\}', text, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        return json.loads(match.group(0))
+    except Exception:
+        return {}
+
+
+def incremental_parse(text: str) -> Dict:
+    return parse_structured_output(text)[0]
+
+
+def fields_recovered(parsed: Dict) -> int:
+    return sum(1 for f in FIELDS if isinstance(parsed.get(f), str) and parsed.get(f))
+
+
+def time_per_parse(parse, corpus: List[str], repeats: int) -> List[float]:
+    timings = []
+    for text in corpus:
+        started = time.perf_counter()
+        for _ in range(repeats):
+            parse(text)
+        timings.append((time.perf_counter() - started) / repeats)
+    return timings
+
+
+def streaming_profile(text: str, chunk_size: int) -> Dict:
+    """Chunks until the first `response` text is available, vs waiting for the whole output."""
+    chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    parser, first_response_chunk, feed_seconds = StructuredOutputParser(), None, 0.0
+    for index, chunk in enumerate(chunks):
+        started = time.perf_counter()
+        parser.feed(chunk)
+        name, delta = parser.take_delta()
+        feed_seconds += time.perf_counter() - started
+        if first_response_chunk is None and name == "response" and delta:
+            first_response_chunk = index + 1
+    return {
+        "chunks": len(chunks),
+        "first_response_text_at_chunk": first_response_chunk,
+        "feed_us_per_chunk": round(feed_seconds / max(len(chunks), 1) * 1e6, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="JSONL file of captured outputs, one {\"output\": ...} per line")
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, default=8, help="characters per simulated stream chunk")
+    args = parser.parse_args()
+
+    corpus = builtin_corpus()
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus += [json.loads(line)["output"] for line in f if line.strip()]
+
+    report = {"outputs": len(corpus), "fields_per_output": len(FIELDS), "parsers": {}}
+    for name, parse in (("legacy", legacy_parse), ("incremental", incremental_parse)):
+        recovered = [fields_recovered(parse(text)) for text in corpus]
+        timings = time_per_parse(parse, corpus, args.repeats)
+        report["parsers"][name] = {
+            "fully_parsed_outputs": sum(r == len(FIELDS) for r in recovered),
+            "fields_recovered": sum(recovered),
+            "parse_us_p50": round(percentile(timings, 50) * 1e6, 2),
+            "parse_us_max": round(max(timings) * 1e6, 2),
+        }
+    report["streaming"] = streaming_profile(corpus[0], args.chunk_size)
+    print(json.dumps(report, indent=2))
@@ -1,21 +1,76 @@
+from shared.startup import StartupState, readiness_response
+
+startup = StartupState("Gateway Service")
+
 import json
-import random
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException, Response
-from shared.config import RAG_SERVICE_URL, T2S_SERVICE_URL, LLM_SERVICE_URL, GATEWAY_SERVICE_PORT
+from shared.config import (
+    RAG_SERVICE_URLS, T2S_SERVICE_URLS, LLM_SERVICE_URLS, GATEWAY_SERVICE_PORT, GATEWAY_CACHE_SIZE, GATEWAY_CACHE_TTL,
+    RAG_UPSTREAM_TIMEOUT, T2S_UPSTREAM_TIMEOUT, STATUS_PROBE_TIMEOUT, HEALTH_CHECK_TIMEOUT, RAG_MAX_IN_FLIGHT,
+    T2S_MAX_IN_FLIGHT, REQUEST_DEADLINE_SECONDS,
+)
+from shared import deadline
+from shared.deadline import install_deadlines
+from shared.http_clients import UpstreamClients
+from shared.instrumentation import install_instrumentation, note_upstream_timings, stage
+from shared.metrics import REGISTRY
+from shared.resilience import UpstreamGuard, UpstreamUnavailable, guard_stats, is_failure, retry_after_headers
 from shared.schema import AskRequest, GatewayResposne, RAGServiceQuery, AudioResponse, T2SRequest
 from shared.logger import get_logger
+from gateway_service.registry import ServiceRegistry, parse_urls
+from gateway_service.response_cache import HIT, CoalescingResponseCache, request_key
 import httpx
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, List
-from fastapi.responses import JSONResponse
-from circuitbreaker import circuit
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from shared.sse import SSE_HEADERS, SSE_MEDIA_TYPE, sse_event
 import demjson3
 import re
 
 
-app = FastAPI(title="DivineGPT - Gateway Service")
+# Long-lived pooled clients, one per upstream service
+upstreams = UpstreamClients()
+# Replicas of each upstream; requests are balanced across the healthy ones
+service_registry = ServiceRegistry({
+    "rag": parse_urls(RAG_SERVICE_URLS),
+    "t2s": parse_urls(T2S_SERVICE_URLS),
+    "llm": parse_urls(LLM_SERVICE_URLS),
+})
+# Circuit breaker + bulkhead per upstream: a dead or saturated service fails requests fast with 503
+guards = {
+    "rag": UpstreamGuard("rag", RAG_MAX_IN_FLIGHT),
+    "t2s": UpstreamGuard("t2s", T2S_MAX_IN_FLIGHT),
+}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing heavy to load; the gateway is ready as soon as it is bound
+    startup.record("app import")
+    upstreams.start("rag", timeout=RAG_UPSTREAM_TIMEOUT)
+    upstreams.start("t2s", timeout=T2S_UPSTREAM_TIMEOUT)
+    # Only used for /status probes
+    upstreams.start("llm", timeout=STATUS_PROBE_TIMEOUT, max_connections=4, max_keepalive=2)
+    # Health probes get their own small pool so they never queue behind user traffic
+    service_registry.start(upstreams.start("probes", timeout=HEALTH_CHECK_TIMEOUT, max_connections=8, max_keepalive=8))
+    startup.mark_ready()
+    yield
+    await service_registry.aclose()
+    await upstreams.aclose()
+
+
+app = FastAPI(title="DivineGPT - Gateway Service", lifespan=lifespan)
 logger = get_logger("Gateway Service")
+# Degraded fallback answers are passed on but not cached, so the next caller gets a real answer once the LLM recovers
+response_cache = CoalescingResponseCache(
+    max_size=GATEWAY_CACHE_SIZE, ttl_seconds=GATEWAY_CACHE_TTL, cacheable=lambda body: not body.get("degraded"),
+)
+response_cache_requests = REGISTRY.counter("gateway_response_cache_requests_total", "/ask cache lookups by outcome")
 
+# Every request gets an end-to-end budget; the remainder is passed on to the services it calls
+install_deadlines(app, default_budget=REQUEST_DEADLINE_SECONDS)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow all origins for CORS
@@ -23,6 +78,7 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all methods
     allow_headers=["*"],  # Allow all headers
 )
+install_instrumentation(app, "gateway")
 
 
 
@@ -76,9 +132,10 @@ FALLBACK_RESPONSE = {
 
 
 @app.post("/ask", response_model=GatewayResposne)
-async def gateway_ask(request: AskRequest):
+async def gateway_ask(request: AskRequest, response: Response):
     """
     Gateway endpoint to forward requests to the RAG service.
+    Identical requests share one upstream call and its cached result (X-Cache: HIT | COALESCED | MISS).
     """
     # body = await request.json()
     # user_query = RAGServiceQuery(**body)
@@ -87,18 +144,31 @@ async def gateway_ask(request: AskRequest):
     logger.info(f"History Length: {len(request.history or [])}")
     logger.info(f"Prev summary: {'Yes' if request.previous_summary else 'No'}")
 
+    body = request.model_dump(exclude_none=True)
+
+    async def forward_to_rag():
+        # Shared by every coalesced waiter, so it gets the full budget rather than the first caller's;
+        # each caller still gives up at its own deadline
+        with deadline.budget(REQUEST_DEADLINE_SECONDS), stage("rag"):
+            async with guards["rag"].call(), service_registry.route("rag") as replica:
+                rag_response = await upstreams["rag"].post(
+                    f"{replica.url}/ask",
+                    json=body,
+                )
+                note_upstream_timings("rag", rag_response.headers.get("server-timing"))
+                rag_response.raise_for_status()
+        logger.info("Received successful response from RAG service.")
+        return rag_response.json()
+
     try:
-        async with httpx.AsyncClient(timeout=270) as client:
-            rag_response = await client.post(
-                f"{RAG_SERVICE_URL}/ask",
-                json=request.model_dump(exclude_none=True),
-                timeout=270,
-            )
-            rag_response.raise_for_status()
-            response_data = rag_response.json()
-            logger.info("Received successful response from RAG service.")
-            return response_data
-     
+        response_data, outcome, age = await response_cache.get_or_fetch(request_key(body), forward_to_rag)
+        response.headers["X-Cache"] = outcome
+        response_cache_requests.inc(outcome=outcome)
+        if outcome == HIT:
+            response.headers["Age"] = str(int(age))
+        logger.info(f"Gateway response cache: {outcome}")
+        return response_data
+
         # # Check if RAG service returned a complete response (fallback case)
         # if "llm_response" in rag_data:
         #     logger.info("RAG service returned complete response (fallback case)")
@@ -129,6 +199,9 @@ async def gateway_ask(request: AskRequest):
         # print(final_response)
         # return final_response
                 
+    except UpstreamUnavailable as exc:
+        logger.warning(f"RAG call failed fast: {exc}")
+        raise HTTPException(status_code=503, detail="RAG service unavailable", headers=retry_after_headers(exc))
     except httpx.RequestError as exc:
         logger.error(f"Error connecting to RAG service: {exc}")
         raise HTTPException(status_code=503, detail="RAG service unavailable")
@@ -148,6 +221,112 @@ async def gateway_ask(request: AskRequest):
     # logger.info(f"Gateway returning response to client.")
     # return response_data
 
+class GuardedStreamingResponse(StreamingResponse):
+    """
+    Runs its background task however the response ends: also when the client disconnects or the
+    deadline cancels it, where Starlette skips the task and a body generator that never started
+    never runs its `finally`.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        except BaseException:
+            if self.background is not None:
+                await self.background()
+            raise
+
+
+@app.post("/ask/stream")
+async def gateway_ask_stream(request: AskRequest):
+    """
+    Proxies the RAG service's Server-Sent Events stream (shlokas, token, final) byte for byte.
+    Streams are not cached or coalesced; a stream that breaks off ends with an `error` event.
+    """
+    logger.info(f"Gateway received streaming query: {request.query}")
+    client = upstreams["rag"]
+    guard = guards["rag"]
+    try:
+        await guard.enter()
+    except UpstreamUnavailable as exc:
+        logger.warning(f"RAG call failed fast: {exc}")
+        raise HTTPException(status_code=503, detail="RAG service unavailable", headers=retry_after_headers(exc))
+
+    # The stream holds its bulkhead slot and counts as outstanding on its replica until the response
+    # is done, however it ends; the replica's latency is time to headers. The guard's verdict stays
+    # None (no evidence either way) unless the upstream answered or failed.
+    replica = upstream = None
+    outcome = {"replica_failed": False, "guard_failed": None}
+    released = False
+
+    async def release():
+        nonlocal released
+        if released:
+            return
+        released = True
+        if replica is not None:
+            replica.release(failed=outcome["replica_failed"])
+        guard.exit(outcome["guard_failed"])
+        if upstream is not None:
+            await upstream.aclose()
+
+    try:
+        replica = service_registry.pick("rag")
+        replica.acquire()
+        started = time.perf_counter()
+        try:
+            upstream = await client.send(
+                client.build_request("POST", f"{replica.url}/ask/stream", json=request.model_dump(exclude_none=True)),
+                stream=True,
+            )
+        except BaseException as exc:
+            if isinstance(exc, httpx.ConnectError):
+                replica.eject(f"connect failed: {exc}")
+            outcome.update(replica_failed=isinstance(exc, Exception), guard_failed=is_failure(exc))
+            if not isinstance(exc, httpx.RequestError):
+                raise
+            logger.error(f"Error connecting to RAG service: {exc}")
+            raise HTTPException(status_code=503, detail="RAG service unavailable")
+        replica.observe_latency(time.perf_counter() - started)
+
+        if upstream.status_code != 200:
+            body = await upstream.aread()
+            failed = upstream.status_code >= 500 or upstream.status_code == 429
+            # A 504 for our own budget running out is no verdict on the upstream
+            outcome.update(replica_failed=failed,
+                           guard_failed=None if upstream.headers.get(deadline.EXCEEDED_HEADER) else failed)
+            logger.error(f"RAG service returned error {upstream.status_code}: {body[:500]}")
+            detail = body.decode("utf-8", errors="replace")
+            try:
+                detail = json.loads(detail).get("detail", detail)
+            except Exception:
+                pass
+            raise HTTPException(status_code=upstream.status_code, detail=detail)
+    except BaseException:
+        await release()
+        raise
+
+    async def relay():
+        ended_cleanly = True
+        try:
+            # aiter_raw forwards chunks as they arrive, without re-buffering into lines
+            async for chunk in upstream.aiter_raw():
+                ended_cleanly = chunk.endswith(b"\n\n")
+                yield chunk
+        except httpx.HTTPError as exc:
+            outcome.update(replica_failed=True, guard_failed=True)
+            logger.error(f"RAG stream interrupted: {exc}")
+            # Close off any half-relayed event so the error event parses on its own
+            yield (b"" if ended_cleanly else b"\n\n") + sse_event(
+                "error", {"detail": "RAG stream interrupted, the answer is incomplete."}
+            ).encode("utf-8")
+            return
+        outcome["guard_failed"] = False
+
+    return GuardedStreamingResponse(
+        relay(), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS, background=BackgroundTask(release),
+    )
+
 @app.post("/speak")
 async def gateway_speak(request: Request):
     """
@@ -158,12 +337,13 @@ async def gateway_speak(request: Request):
         t2s_request_data = T2SRequest(**body) # Validate against Pydantic model
         logger.info(f"Gateway received T2S request for lang: {t2s_request_data.lang}")
         
-        async with httpx.AsyncClient(timeout=60) as client:
-            t2s_response = await client.post(
-                f"{T2S_SERVICE_URL}/speak",
-                json=t2s_request_data.model_dump(), # Send validated data
-            )
-            t2s_response.raise_for_status() # Check for HTTP errors (4xx, 5xx)
+        with stage("t2s"):
+            async with guards["t2s"].call(), service_registry.route("t2s") as replica:
+                t2s_response = await upstreams["t2s"].post(
+                    f"{replica.url}/speak",
+                    json=t2s_request_data.model_dump(), # Send validated data
+                )
+                t2s_response.raise_for_status() # Check for HTTP errors (4xx, 5xx)
             
         # Return the binary audio data with proper headers
         # Get the content type from the T2S service response
@@ -175,6 +355,9 @@ async def gateway_speak(request: Request):
             media_type=content_type
         )
     
+    except UpstreamUnavailable as exc:
+        logger.warning(f"T2S call failed fast: {exc}")
+        raise HTTPException(status_code=503, detail="T2S service unavailable", headers=retry_after_headers(exc))
     except httpx.RequestError as exc:
         logger.error(f"Error connecting to T2S service: {exc}")
         raise HTTPException(status_code=503, detail=f"T2S service unavailable: {str(exc)}")
@@ -248,22 +431,25 @@ async def get_status():
         "gateway": {
             "service": "Gateway Service",
             "port": GATEWAY_SERVICE_PORT,
-            "status": "running"
+            "status": "running",
+            "response_cache": response_cache.stats(),
+            "upstream_pools": upstreams.stats(),
+            "replicas": service_registry.stats(),
+            "resilience": guard_stats(guards),
         }
     }
     
     # Check RAG service status
     try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            response = await client.get(f"{RAG_SERVICE_URL}/status")
-            if response.status_code == 200:
-                services_status["rag"] = response.json()
-            else:
-                services_status["rag"] = {
-                    "service": "RAG Service",
-                    "status": "error",
-                    "details": f"Status code: {response.status_code}"
-                }
+        response = await upstreams["rag"].get(f"{service_registry.get_service('rag')}/status", timeout=STATUS_PROBE_TIMEOUT)
+        if response.status_code == 200:
+            services_status["rag"] = response.json()
+        else:
+            services_status["rag"] = {
+                "service": "RAG Service",
+                "status": "error",
+                "details": f"Status code: {response.status_code}"
+            }
     except Exception as e:
         services_status["rag"] = {
             "service": "RAG Service",
@@ -273,16 +459,15 @@ async def get_status():
     
     # Check T2S service status
     try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            response = await client.get(f"{T2S_SERVICE_URL}/status")
-            if response.status_code == 200:
-                services_status["t2s"] = response.json()
-            else:
-                services_status["t2s"] = {
-                    "service": "Text-to-Speech Service",
-                    "status": "error",
-                    "details": f"Status code: {response.status_code}"
-                }
+        response = await upstreams["t2s"].get(f"{service_registry.get_service('t2s')}/status", timeout=STATUS_PROBE_TIMEOUT)
+        if response.status_code == 200:
+            services_status["t2s"] = response.json()
+        else:
+            services_status["t2s"] = {
+                "service": "Text-to-Speech Service",
+                "status": "error",
+                "details": f"Status code: {response.status_code}"
+            }
     except Exception as e:
         services_status["t2s"] = {
             "service": "Text-to-Speech Service",
@@ -292,17 +477,16 @@ async def get_status():
     
     # Check LLM service status
     try:
-        async with httpx.AsyncClient(timeout=5) as client:
-            # Assuming LLM service also has a /status endpoint
-            response = await client.get(f"{LLM_SERVICE_URL}/status")
-            if response.status_code == 200:
-                services_status["llm"] = response.json()
-            else:
-                services_status["llm"] = {
-                    "service": "LLM Service",
-                    "status": "error",
-                    "details": f"Status code: {response.status_code}"
-                }
+        # Assuming LLM service also has a /status endpoint
+        response = await upstreams["llm"].get(f"{service_registry.get_service('llm')}/status", timeout=STATUS_PROBE_TIMEOUT)
+        if response.status_code == 200:
+            services_status["llm"] = response.json()
+        else:
+            services_status["llm"] = {
+                "service": "LLM Service",
+                "status": "error",
+                "details": f"Status code: {response.status_code}"
+            }
     except Exception as e:
         services_status["llm"] = {
             "service": "LLM Service",
@@ -345,21 +529,6 @@ async def read_root():
 #         logger.error(f"LLM service returned error: {exc.response.text}")
 #         raise HTTPException(status_code=exc.response.status_code, detail=exc.response.text)
 
-class ServiceRegistry:
-    def __init__(self):
-        self.services: Dict[str, List[str]] = {
-            "llm": [LLM_SERVICE_URL],
-            "rag": [RAG_SERVICE_URL],
-            "t2s": [T2S_SERVICE_URL]
-        }
-    
-    def get_service(self, name: str) -> str:
-        if not self.services.get(name):
-            raise HTTPException(status_code=404, detail="Service not found")
-        return random.choice(self.services[name])
-
-service_registry = ServiceRegistry()
-
 @app.middleware("http")
 async def circuit_breaker_middleware(request: Request, call_next):
     try:
@@ -375,10 +544,11 @@ async def circuit_breaker_middleware(request: Request, call_next):
             content={"message": "Service unavailable"}
         )
 
-@circuit(failure_threshold=3, recovery_timeout=30)
-async def call_service(client, url, data):
-    return await client.post(url, json=data)
-
 @app.get("/health")
+@app.get("/live")
 async def health_check():
-    return {"status": "ok", "service": "Gateway Service", "port": GATEWAY_SERVICE_PORT}
\ No newline at end of file
+    return {"status": "ok", "service": "Gateway Service", "port": GATEWAY_SERVICE_PORT}
+
+@app.get("/ready")
+async def readiness_check():
+    return readiness_response(startup, GATEWAY_SERVICE_PORT)
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""
+Replicas of each upstream service, with client-side load balancing and active health checks.
+
+Every service can run several replicas (RAG_SERVICE_URLS="http://rag-1:8001,http://rag-2:8001").
+Each request goes to the healthy replica with the lowest score:
+
+    least_outstanding  - fewest requests in flight from this gateway
+    ewma               - latency EWMA x (requests in flight + 1), so a slow replica
+                         gets less traffic before it is slow enough to fail probes
+
+Ties are broken at random. A background task probes GET /ready on every replica;
+HEALTH_UNHEALTHY_THRESHOLD failed probes in a row eject it, HEALTH_HEALTHY_THRESHOLD
+good ones bring it back. A refused connection ejects a replica straight away. If
+every replica of a service is ejected, all of them are tried again rather than
+failing every request on what may be a probe problem.
+"""
+import asyncio
+import math
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import httpx
+
+from shared.config import (
+    LB_POLICY, LB_EWMA_DECAY_SECONDS, HEALTH_CHECK_INTERVAL, HEALTH_CHECK_TIMEOUT, HEALTH_UNHEALTHY_THRESHOLD,
+    HEALTH_HEALTHY_THRESHOLD,
+)
+from shared.logger import get_logger
+from shared.metrics import REGISTRY
+
+logger = get_logger("Service Registry")
+
+LB_POLICIES = ("least_outstanding", "ewma")
+HEALTH_CHECK_PATH = "/ready"
+
+upstream_requests = REGISTRY.counter("gateway_upstream_requests_total", "Upstream calls by service, replica and outcome")
+health_transitions = REGISTRY.counter("gateway_replica_health_transitions_total",
+                                      "Replicas ejected or restored, by service and replica")
+
+
+def parse_urls(value: str) -> List[str]:
+    """Comma-separated base URLs, without trailing slashes."""
+    return [url.strip().rstrip("/") for url in value.split(",") if url.strip()]
+
+
+class Replica:
+    def __init__(self, service: str, url: str):
+        self.service = service
+        self.url = url
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        # Seconds; None until the first response
+        self.ewma: Optional[float] = None
+        self._ewma_at = 0.0
+        self._probe_failures = 0
+        self._probe_successes = 0
+        self.last_probe: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def acquire(self):
+        self.outstanding += 1
+        self.requests += 1
+
+    def release(self, failed: bool = False):
+        self.outstanding -= 1
+        if failed:
+            self.errors += 1
+        upstream_requests.inc(service=self.service, replica=self.url, outcome="error" if failed else "ok")
+
+    def observe_latency(self, seconds: float):
+        """Time-decayed EWMA: a sample counts for more the longer it has been since the previous one."""
+        now = time.monotonic()
+        if self.ewma is None:
+            self.ewma = seconds
+        else:
+            weight = math.exp(-(now - self._ewma_at) / LB_EWMA_DECAY_SECONDS)
+            self.ewma = self.ewma * weight + seconds * (1 - weight)
+        self._ewma_at = now
+
+    def eject(self, reason: str):
+        self.last_error = reason
+        self._probe_successes = 0
+        if self.healthy:
+            self.healthy = False
+            self.ejections += 1
+            health_transitions.inc(service=self.service, replica=self.url, state="ejected")
+            logger.warning(f"Ejected {self.service} replica {self.url}: {reason}")
+
+    def probe_result(self, error: Optional[str]):
+        self.last_probe = time.time()
+        if error is None:
+            self._probe_failures = 0
+            self._probe_successes += 1
+            if not self.healthy and self._probe_successes >= HEALTH_HEALTHY_THRESHOLD:
+                self.healthy = True
+                self.last_error = None
+                health_transitions.inc(service=self.service, replica=self.url, state="restored")
+                logger.info(f"Restored {self.service} replica {self.url}")
+        else:
+            self._probe_successes = 0
+            self._probe_failures += 1
+            self.last_error = error
+            if self._probe_failures >= HEALTH_UNHEALTHY_THRESHOLD:
+                self.eject(error)
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+            "ewma_latency_ms": round(self.ewma * 1000, 1) if self.ewma is not None else None,
+            "last_probe_age_seconds": round(time.time() - self.last_probe, 1) if self.last_probe else None,
+            "last_error": self.last_error,
+        }
+
+
+class ServiceRegistry:
+    """Replicas by service name. Everything runs on the event loop, so no locking."""
+
+    def __init__(self, services: Dict[str, List[str]], policy: str = LB_POLICY):
+        if policy not in LB_POLICIES:
+            raise ValueError(f"Unknown LB_POLICY '{policy}', expected one of {LB_POLICIES}")
+        self.policy = policy
+        self.services: Dict[str, List[Replica]] = {
+            name: [Replica(name, url) for url in urls] for name, urls in services.items()
+        }
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def _score(self, replica: Replica, default_latency: float) -> float:
+        if self.policy == "ewma":
+            latency = replica.ewma if replica.ewma is not None else default_latency
+            return latency * (replica.outstanding + 1)
+        return replica.outstanding
+
+    def pick(self, name: str) -> Replica:
+        replicas = self.services.get(name)
+        if not replicas:
+            raise KeyError(f"No replicas configured for service '{name}'")
+        candidates = [r for r in replicas if r.healthy] or replicas
+        # Replicas without a latency sample yet are scored as average ones
+        known = [r.ewma for r in candidates if r.ewma is not None]
+        default_latency = sum(known) / len(known) if known else 1.0
+        return min(candidates, key=lambda r: (self._score(r, default_latency), random.random()))
+
+    def get_service(self, name: str) -> str:
+        return self.pick(name).url
+
+    @asynccontextmanager
+    async def route(self, name: str):
+        """
+        Picks a replica and counts the call against it until the block exits:
+
+            async with service_registry.route("rag") as replica:
+                response = await client.post(f"{replica.url}/ask", json=body)
+        """
+        replica = self.pick(name)
+        replica.acquire()
+        started = time.perf_counter()
+        failed = cancelled = False
+        try:
+            yield replica
+        except asyncio.CancelledError:
+            # The client went away; says nothing about the replica
+            cancelled = True
+            raise
+        except httpx.HTTPStatusError as e:
+            # A 4xx is the caller's problem, not the replica's
+            failed = e.response.status_code >= 500
+            raise
+        except httpx.ConnectError as e:
+            failed = True
+            replica.eject(f"connect failed: {e}")
+            raise
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            if not (failed or cancelled):
+                replica.observe_latency(time.perf_counter() - started)
+            replica.release(failed)
+
+    async def _probe(self, client: httpx.AsyncClient, replica: Replica):
+        try:
+            response = await client.get(f"{replica.url}{HEALTH_CHECK_PATH}", timeout=HEALTH_CHECK_TIMEOUT)
+            error = None if response.status_code == 200 else f"{HEALTH_CHECK_PATH} returned {response.status_code}"
+        except httpx.HTTPError as e:
+            error = f"{type(e).__name__}: {e}"
+        replica.probe_result(error)
+
+    async def probe_all(self, client: httpx.AsyncClient):
+        replicas = [r for rs in self.services.values() for r in rs]
+        await asyncio.gather(*(self._probe(client, r) for r in replicas))
+
+    async def _probe_loop(self, client: httpx.AsyncClient):
+        while True:
+            try:
+                await self.probe_all(client)
+            except Exception as e:
+                logger.error(f"Health probe round failed: {e}")
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+    def start(self, client: httpx.AsyncClient):
+        """Starts the background health probes; called from the app lifespan."""
+        if HEALTH_CHECK_INTERVAL > 0 and self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe_loop(client))
+
+    async def aclose(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+
+    def stats(self) -> Dict:
+        return {
+            "policy": self.policy,
+            "health_check": {"path": HEALTH_CHECK_PATH, "interval_seconds": HEALTH_CHECK_INTERVAL},
+            "services": {
+                name: {
+                    "healthy": sum(1 for r in replicas if r.healthy),
+                    "replicas": [r.stats() for r in replicas],
+                }
+                for name, replicas in self.services.items()
+            },
+        }
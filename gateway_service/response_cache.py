@@ -0,0 +1,120 @@
+"""
+Exact-match cache of /ask responses with in-flight request coalescing.
+
+Requests are keyed by a hash of their canonical JSON body. A completed response
+is served from a bounded TTL/LRU cache; while one is still being computed,
+identical requests wait on the same upstream call instead of issuing their own
+(singleflight). Failures are shared with the waiters but never cached, and neither
+are values the `cacheable` predicate rejects (degraded fallback answers).
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from shared.logger import get_logger
+
+logger = get_logger("Gateway Cache")
+
+HIT, COALESCED, MISS = "HIT", "COALESCED", "MISS"
+
+
+def request_key(body: Dict) -> str:
+    """sha256 of the body with sorted keys and no insignificant whitespace."""
+    canonical = json.dumps(body, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CoalescingResponseCache:
+    def __init__(
+            self,
+            max_size: int = 2048,
+            ttl_seconds: float = 300,
+            cacheable: Optional[Callable[[Any], bool]] = None,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.cacheable = cacheable
+        # key -> (value, stored_at); monotonic time since entries never outlive the process
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self.uncacheable = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key: str, value: Any):
+        if self.max_size <= 0 or self.ttl_seconds <= 0:
+            return
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _finish(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            self.errors += 1
+            return
+        if self.cacheable is not None and not self.cacheable(task.result()):
+            self.uncacheable += 1
+            return
+        self._put(key, task.result())
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, str, float]:
+        """Returns (value, HIT | COALESCED | MISS, age in seconds of a cached value)."""
+        entry = self._get(key)
+        if entry is not None:
+            self.hits += 1
+            value, stored_at = entry
+            return value, HIT, time.monotonic() - stored_at
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            outcome = COALESCED
+        else:
+            self.misses += 1
+            outcome = MISS
+            # Its own task, so one caller disconnecting does not cancel the call the others wait on
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task), outcome, 0.0
+
+    def stats(self) -> Dict:
+        requests = self.hits + self.coalesced + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "upstream_errors": self.errors,
+            "uncacheable": self.uncacheable,
+            "hit_rate": round(self.hits / requests, 4) if requests else 0.0,
+            "upstream_saved_rate": round((self.hits + self.coalesced) / requests, 4) if requests else 0.0,
+        }
@@ -0,0 +1,145 @@
+"""
+Selectable text generation backends for the LLM service.
+
+    gemini     - Google Gemini via google.generativeai (needs GEMINI_API_KEY)
+    simulated  - local stand-in with configurable latency and failures, for
+                 load tests without network or API quota (llm_service/simulated.py)
+
+Backends only generate. Concurrency limits, usage totals and traces are applied
+around them in llm_service/inference.py, so every backend is measured the same way.
+"""
+import asyncio
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from shared import deadline
+from shared.config import (
+    GEMINI_API_KEY, GEMINI_MODEL, GEMINI_CONTEXT_CACHE, GEMINI_CONTEXT_CACHE_TTL, GEMINI_CONTEXT_CACHE_MIN_TOKENS,
+)
+from .prefix_cache import GeminiPrefixCache
+
+LLM_BACKENDS = ("gemini", "simulated")
+
+
+class LLMBackend:
+    name = "base"
+
+    def warm_up(self):
+        """Blocking setup (imports, clients); runs in a thread after the service binds."""
+
+    async def generate(self, prompt: str, prefix_chars: int = 0) -> Tuple[str, Dict[str, int]]:
+        """The full generated text and its token usage. Errors are raised."""
+        raise NotImplementedError
+
+    def stream(self, prompt: str, prefix_chars: int = 0, usage: Dict[str, int] = None) -> AsyncIterator[str]:
+        """Yields text chunks as they are produced; token usage is written into `usage` at the end."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {"backend": self.name}
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, model_name: str = GEMINI_MODEL):
+        self.model_name = model_name
+        self.prefix_cache = GeminiPrefixCache(
+            model_name, ttl_seconds=GEMINI_CONTEXT_CACHE_TTL, min_tokens=GEMINI_CONTEXT_CACHE_MIN_TOKENS,
+        ) if GEMINI_CONTEXT_CACHE else None
+        # Built once by warm_up() and shared by all requests
+        self.genai = None
+        self.config = None
+        self.model = None
+        # CachedContent name -> model bound to it; a cached prefix is renewed hourly, so this stays small
+        self._prefix_models: Dict[str, object] = {}
+
+    def warm_up(self):
+        # google.generativeai takes seconds to import, so it is not imported at module load
+        import google.generativeai as genai
+        genai.configure(api_key=GEMINI_API_KEY)
+        self.config = genai.GenerationConfig(
+            temperature=0.7,
+            max_output_tokens=4000,
+            top_p=0.92,
+            top_k=50,
+        )
+        self.model = genai.GenerativeModel(self.model_name, generation_config=self.config)
+        self.genai = genai
+
+    def _prefix_model(self, cached_prefix):
+        model = self._prefix_models.get(cached_prefix.name)
+        if model is None:
+            if len(self._prefix_models) >= 16:
+                self._prefix_models.clear()
+            model = self.genai.GenerativeModel.from_cached_content(cached_prefix, generation_config=self.config)
+            self._prefix_models[cached_prefix.name] = model
+        return model
+
+    async def _request(self, prompt: str, prefix_chars: int):
+        """Model and contents for a prompt, reusing a cached prefix when there is one."""
+        if self.genai is None:
+            await asyncio.to_thread(self.warm_up)
+
+        cached_prefix = None
+        if self.prefix_cache and prefix_chars:
+            # Usually a dict lookup, but creating/renewing the cache is a blocking API call
+            cached_prefix = await asyncio.to_thread(self.prefix_cache.get, self.genai, prompt[:prefix_chars])
+        if cached_prefix is not None:
+            # The prefix already lives server-side; only the per-request tail is sent
+            return self._prefix_model(cached_prefix), prompt[prefix_chars:]
+        # Full prompt: a stable prefix can still hit Gemini's implicit cache
+        return self.model, prompt
+
+    @staticmethod
+    def _request_options() -> Optional[Dict]:
+        # Gemini stops working on the request once the caller's budget is gone
+        timeout = deadline.timeout_for(None)
+        return {"timeout": timeout} if timeout is not None else None
+
+    async def generate(self, prompt: str, prefix_chars: int = 0) -> Tuple[str, Dict[str, int]]:
+        model, contents = await self._request(prompt, prefix_chars)
+        response = await model.generate_content_async(contents, request_options=self._request_options())
+        return response.text, gemini_usage(response)
+
+    async def stream(self, prompt: str, prefix_chars: int = 0, usage: Dict[str, int] = None) -> AsyncIterator[str]:
+        model, contents = await self._request(prompt, prefix_chars)
+        response = await model.generate_content_async(contents, stream=True, request_options=self._request_options())
+        async for chunk in response:
+            # Chunks without text parts (e.g. a trailing safety/finish chunk) raise on .text
+            if chunk.parts:
+                yield chunk.text
+        if usage is not None:
+            usage.update(gemini_usage(response))
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.name,
+            "model": self.model_name,
+            "prefix_cache": self.prefix_cache.stats() if self.prefix_cache else None,
+        }
+
+
+def gemini_usage(response) -> Dict[str, int]:
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is None:
+        return {}
+    prompt_tokens = int(getattr(metadata, "prompt_token_count", 0) or 0)
+    cached = int(getattr(metadata, "cached_content_token_count", 0) or 0)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_prefix_tokens": cached,
+        "fresh_prompt_tokens": prompt_tokens - cached,
+        "output_tokens": int(getattr(metadata, "candidates_token_count", 0) or 0),
+    }
+
+
+def load_backend(name: str) -> LLMBackend:
+    if not name:
+        raise ValueError("No LLM backend configured: USE_GEMINI is false and LLM_BACKEND is unset "
+                         "(LLM_BACKEND=simulated serves canned answers for offline testing)")
+    if name not in LLM_BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}', expected one of {LLM_BACKENDS}")
+    if name == "gemini":
+        return GeminiBackend()
+    from .simulated import SimulatedBackend
+    return SimulatedBackend()
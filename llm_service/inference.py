@@ -1,68 +1,147 @@
 """
 Handles logic (using model pipeline)
 """
-# import requests
-from shared.config import GEMINI_API_KEY, USE_GEMINI, GEMINI_MODEL
-from .model import load_model_and_pipeline
-import google.generativeai as genai
+import asyncio
+import json
+import threading
+import time
+from typing import AsyncIterator, Dict, Optional, Tuple
 
+from shared.config import LLM_BACKEND, LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_TRACE_PATH
+from shared.logger import get_logger
+from shared.metrics import REGISTRY
+from .backends import LLMBackend, load_backend
+from .limiter import ProviderLimiter
 
-print("Initializing LLM pipeline...")
-generator = load_model_and_pipeline() if not USE_GEMINI else None
-print("LLM pipeline initialized.")
+logger = get_logger("LLM Inference")
 
-def generate_response(prompt: str) -> str:
+limiter = ProviderLimiter(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE)
+REGISTRY.register_histogram("llm_queue_wait_seconds", "Wait for a provider slot", limiter.queue_wait_histogram)
+REGISTRY.register_histogram("llm_provider_seconds", "Provider call duration", limiter.provider_latency_histogram)
+REGISTRY.register_histogram("llm_first_token_seconds", "Provider time to first streamed chunk",
+                            limiter.first_token_histogram)
+REGISTRY.gauge("llm_provider_in_flight", "Provider calls in flight", lambda: limiter.in_flight)
+REGISTRY.gauge("llm_provider_waiting", "Requests waiting for a provider slot", lambda: limiter.waiting)
+generation_errors = REGISTRY.counter("llm_generation_errors_total", "Failed generations by backend")
+
+# Running totals of prompt tokens served from a cached prefix vs sent fresh
+_usage_lock = threading.Lock()
+usage_totals = {"requests": 0, "prompt_tokens": 0, "cached_prefix_tokens": 0, "fresh_prompt_tokens": 0, "output_tokens": 0}
+_trace_lock = threading.Lock()
+# Opened on the first trace, line-buffered, like the span exporter's JSONL file
+_trace_file = None
+
+class GenerationFailed(Exception):
+    """The backend raised; the message says which backend and why."""
+
+
+# Populated by warm_up(); backends may import heavy client libraries, so nothing is built at module load
+backend: Optional[LLMBackend] = None
+
+
+def warm_up():
+    """Creates and sets up the generation backend. Runs in the background after the service binds."""
+    global backend
+    selected = load_backend(LLM_BACKEND)
+    selected.warm_up()
+    backend = selected
+    logger.info(f"LLM pipeline initialized ({backend.name} backend).")
+
+
+async def _backend() -> LLMBackend:
+    if backend is None:
+        await asyncio.to_thread(warm_up)
+    return backend
+
+
+def record_usage(usage: Dict[str, int]):
+    with _usage_lock:
+        usage_totals["requests"] += 1
+        for key, value in usage.items():
+            usage_totals[key] += value
+
+
+def record_trace(duration: float, usage: Dict[str, int], first_token: Optional[float] = None):
+    """Appends the call's timings to LLM_TRACE_PATH, in the format the simulated backend replays. Blocking."""
+    global _trace_file
+    if not LLM_TRACE_PATH:
+        return
+    entry = {"duration_ms": round(duration * 1000, 1), "output_tokens": usage.get("output_tokens", 0)}
+    if first_token is not None:
+        entry["ttft_ms"] = round(first_token * 1000, 1)
+    with _trace_lock:
+        if _trace_file is None:
+            _trace_file = open(LLM_TRACE_PATH, "a", encoding="utf-8", buffering=1)
+        _trace_file.write(json.dumps(entry) + "\n")
+
+
+async def save_trace(duration: float, usage: Dict[str, int], first_token: Optional[float] = None):
+    """`record_trace` in a worker thread, so file I/O never stalls the event loop."""
+    if LLM_TRACE_PATH:
+        await asyncio.to_thread(record_trace, duration, usage, first_token)
+
+
+def usage_stats() -> Dict:
+    with _usage_lock:
+        totals = dict(usage_totals)
+    reused = totals["cached_prefix_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0
+    return {
+        **totals,
+        "prefix_reuse_ratio": round(reused, 4),
+        "backend": backend.stats() if backend else None,
+    }
+
+
+async def generate_response(prompt: str, prefix_chars: int = 0) -> Tuple[str, Dict[str, int]]:
     """
-    Generates a response using GeminiAPI or local LLM model
+    Generates a response using the configured backend (LLM_BACKEND)
 
     Args:
         prompt: The input prompt string.
+        prefix_chars: How many leading characters of the prompt are a stable, cacheable prefix.
 
     Returns:
-        The generated text string, excluding the input prompt.
+        The generated text string, excluding the input prompt, and its token usage.
+
+    Raises:
+        ProviderOverloaded: too many requests are already waiting for a provider slot.
+        GenerationFailed: the backend call failed.
+    """
+    async with limiter.slot():
+        try:
+            generator = await _backend()
+            started = time.perf_counter()
+            text, usage = await generator.generate(prompt, prefix_chars)
+            duration = time.perf_counter() - started
+            limiter.observe_latency(duration)
+            record_usage(usage)
+        except Exception as e:
+            generation_errors.inc(backend=LLM_BACKEND)
+            raise GenerationFailed(f"LLM generation failed ({LLM_BACKEND}). Details: {str(e)}") from e
+    # After the provider slot is released; a trace write should not hold up the next request
+    await save_trace(duration, usage)
+    return text, usage
+
+
+async def stream_response(prompt: str, prefix_chars: int = 0, usage: Dict[str, int] = None) -> AsyncIterator[str]:
+    """
+    Yields the generated text chunk by chunk as the model produces it.
+    Token usage is written into `usage` once the stream is exhausted. Errors are raised.
+    The provider slot is held until the stream ends.
     """
-    if USE_GEMINI:
-        return call_gemini(prompt)
-    else:
-        return "ERROR: Fallback local model removed"
-    #
-    # if not generator:
-    #     return "Error: LLM pipeline not ready."
-    #
-    # try:
-    #     outputs = generator(
-    #         prompt,
-    #         max_new_tokens=4000,
-    #         do_sample=True,
-    #         temperature=0.7,
-    #         top_p=0.92,
-    #         top_k=50,
-    #         repetition_penalty=1.2,
-    #         return_full_text=False,
-    #         clean_up_tokenization_spaces=True
-    #     )
-    #
-    #     return outputs[0]['generated_text'].strip()
-    #
-    # except Exception as e:
-    #     return f"Error: LLM generation failed. Details: {str(e)}"
-
-def call_gemini(prompt: str) -> str:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel(GEMINI_MODEL)
-
-        gemini_config = genai.GenerationConfig(
-            temperature=0.7,
-            max_output_tokens=4000,
-            top_p=0.92,
-            top_k=50,
-        )
-
-        response = model.generate_content(
-            prompt,
-            generation_config=gemini_config,
-        )
-        return response.text
-    except Exception as e:
-        return f"Error: Gemini Generation failed. Details: {str(e)}"
\ No newline at end of file
+    stream_usage = {}
+    async with limiter.slot():
+        generator = await _backend()
+        started = time.perf_counter()
+        first_token = None
+        async for text in generator.stream(prompt, prefix_chars, stream_usage):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+                limiter.observe_first_token(first_token)
+            yield text
+        duration = time.perf_counter() - started
+        limiter.observe_latency(duration)
+    record_usage(stream_usage)
+    await save_trace(duration, stream_usage, first_token)
+    if usage is not None:
+        usage.update(stream_usage)
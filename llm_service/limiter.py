@@ -0,0 +1,79 @@
+"""
+Concurrency limit for calls to the generation provider.
+
+At most `max_concurrency` provider calls run at once; later requests wait their
+turn on the event loop (asyncio.Semaphore wakes waiters in FIFO order) instead of
+each holding a threadpool thread. When `max_queue` requests are already waiting
+new ones are rejected, so a burst sheds load rather than piling up timeouts.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from shared.instrumentation import note_timing
+from shared.metrics import Histogram
+
+QUEUE_WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+PROVIDER_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+
+
+class ProviderOverloaded(Exception):
+    """Raised when too many requests are already waiting for a provider slot."""
+
+
+class ProviderLimiter:
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 64):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.queue_wait_histogram = Histogram(QUEUE_WAIT_BUCKETS)
+        self.provider_latency_histogram = Histogram(PROVIDER_LATENCY_BUCKETS)
+        self.first_token_histogram = Histogram(PROVIDER_LATENCY_BUCKETS)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds one provider slot for the duration of the block; the time spent waiting for it is recorded."""
+        if self._semaphore is None:
+            # Created lazily so it binds to the running loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.waiting >= self.max_queue and self._semaphore.locked():
+            self.rejected += 1
+            raise ProviderOverloaded(f"{self.waiting} requests already waiting for the provider")
+        self.waiting += 1
+        queued_at = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - queued_at
+        self.queue_wait_histogram.observe(waited)
+        note_timing("queue_wait", waited)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def observe_latency(self, seconds: float):
+        self.provider_latency_histogram.observe(seconds)
+        note_timing("provider", seconds)
+
+    def observe_first_token(self, seconds: float):
+        self.first_token_histogram.observe(seconds)
+
+    def stats(self) -> Dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "queue_wait_seconds": self.queue_wait_histogram.snapshot(),
+            "provider_latency_seconds": self.provider_latency_histogram.snapshot(),
+            "stream_first_token_seconds": self.first_token_histogram.snapshot(),
+        }
@@ -1,14 +1,50 @@
-from fastapi import FastAPI
+from shared.startup import StartupState, readiness_response
+
+startup = StartupState("LLM Service")
+
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
 from shared.schema import LLMServiceRequest, LLMServiceResponse
-from shared.config import LLM_SERVICE_PORT
+from shared.config import LLM_BACKEND, LLM_SERVICE_PORT, STARTUP_RETRY_SECONDS
+from shared.deadline import install_deadlines
+from shared.instrumentation import install_instrumentation
 from shared.logger import get_logger
-from .inference import generate_response
+from . import inference
+from .inference import GenerationFailed, generate_response, stream_response
+from .limiter import ProviderOverloaded
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from shared.sse import SSE_HEADERS, SSE_MEDIA_TYPE, sse_event
 
-app = FastAPI(title="DivineGPT - LLM Service")
 logger = get_logger("LLM Service")
 
 
+async def warm_up():
+    while True:
+        try:
+            with startup.phase("generation backend import"):
+                await asyncio.to_thread(inference.warm_up)
+            startup.mark_ready()
+            return
+        except Exception as e:
+            startup.mark_failed(e)
+            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup.record("app import")
+    loader = asyncio.create_task(warm_up())
+    yield
+    loader.cancel()
+
+
+app = FastAPI(title="DivineGPT - LLM Service", lifespan=lifespan)
+
+
+# Deadlines come from the caller (X-Request-Budget-Ms); without one the configured timeouts apply
+install_deadlines(app)
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -17,16 +53,52 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+install_instrumentation(app, "llm")
 
 
 @app.post("/generate", response_model=LLMServiceResponse)
-def generate(request: LLMServiceRequest):
+async def generate(request: LLMServiceRequest):
     """
     Generate a response from the LLM model
     """
     logger.info(f"Received request: {request}")
-    response = generate_response(request.prompt)
-    return LLMServiceResponse(response=response)
+    try:
+        response, usage = await generate_response(request.prompt, request.prefix_chars or 0)
+    except ProviderOverloaded as e:
+        logger.warning(f"Shedding generation request: {e}")
+        raise HTTPException(status_code=503, detail="LLM service is overloaded, please retry.")
+    except GenerationFailed as e:
+        # A non-2xx status, so callers' circuit breakers see the provider failing
+        logger.error(str(e))
+        raise HTTPException(status_code=502, detail=f"Error: {e}")
+    if usage:
+        logger.info(f"Prompt tokens: {usage['cached_prefix_tokens']} reused from cached prefix, "
+                    f"{usage['fresh_prompt_tokens']} sent fresh")
+    return LLMServiceResponse(response=response, usage=usage or None)
+
+@app.post("/generate/stream")
+async def generate_stream(request: LLMServiceRequest):
+    """
+    Streams the generation as Server-Sent Events: `token` events with text chunks,
+    then `done` with token usage, or `error` if generation fails part-way.
+    """
+    logger.info(f"Received streaming request: {request.prompt[:100]}...")
+
+    async def events():
+        usage = {}
+        try:
+            async for text in stream_response(request.prompt, request.prefix_chars or 0, usage):
+                yield sse_event("token", {"text": text})
+            yield sse_event("done", {"usage": usage or None})
+        except ProviderOverloaded as e:
+            logger.warning(f"Shedding streaming request: {e}")
+            yield sse_event("error", {"detail": "LLM service is overloaded, please retry."})
+        except Exception as e:
+            inference.generation_errors.inc(backend=LLM_BACKEND)
+            logger.error(f"Streaming generation failed: {e}")
+            yield sse_event("error", {"detail": f"Error: LLM generation failed ({LLM_BACKEND}). Details: {e}"})
+
+    return StreamingResponse(events(), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
 
 @app.get("/")
 def read_root():
@@ -37,9 +109,17 @@ async def get_status():
     return {
         "service": "LLM Service",
         "port": LLM_SERVICE_PORT,
-        "status": "running"
+        "status": "running",
+        "startup": startup.as_dict(),
+        "token_usage": inference.usage_stats(),
+        "provider": inference.limiter.stats(),
     }
 
 @app.get("/health")
+@app.get("/live")
 async def health_check():
-    return {"status": "ok", "service": "LLM Service", "port": LLM_SERVICE_PORT}
\ No newline at end of file
+    return {"status": "ok", "service": "LLM Service", "port": LLM_SERVICE_PORT}
+
+@app.get("/ready")
+async def readiness_check():
+    return readiness_response(startup, LLM_SERVICE_PORT)
\ No newline at end of file
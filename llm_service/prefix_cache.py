@@ -0,0 +1,127 @@
+"""
+Gemini context caching for the stable prompt prefix.
+
+The RAG service sends prompts as `<stable prefix><per-request content>` and says
+how many leading characters are the prefix. The first request with a given prefix
+uploads it as a CachedContent; later requests only send the per-request part and
+are billed the cached-token rate for the prefix.
+
+Explicit caching has a minimum size and is not offered for every model. A prefix
+below GEMINI_CONTEXT_CACHE_MIN_TOKENS is never uploaded. When creation fails, the
+prefix is retried after `retry_seconds`, and given up on for good after
+`max_attempts` failures. Either way the full prompt is sent, which still benefits
+from Gemini's implicit prefix caching.
+
+Only the request that creates a CachedContent waits for the upload. Requests that
+arrive meanwhile use the previous CachedContent while it is still live, or else
+send the full prompt.
+"""
+import datetime
+import hashlib
+import math
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+from shared.logger import get_logger
+
+logger = get_logger("Prefix Cache")
+
+
+def estimate_tokens(text: str) -> int:
+    # Same ~4 bytes per token estimate as the RAG prompt budgeting
+    return math.ceil(len(text.encode("utf-8")) / 4) if text else 0
+
+
+class GeminiPrefixCache:
+    def __init__(
+            self,
+            model_name: str,
+            ttl_seconds: int = 3600,
+            retry_seconds: int = 600,
+            min_tokens: int = 0,
+            max_attempts: int = 3,
+    ):
+        self.model_name = model_name
+        self.ttl_seconds = ttl_seconds
+        self.retry_seconds = retry_seconds
+        self.min_tokens = min_tokens
+        self.max_attempts = max(1, max_attempts)
+        # prefix hash -> (CachedContent, created_at) or (None, failed_at)
+        self._entries: Dict[str, tuple] = {}
+        # Guards the bookkeeping only; never held across a network call
+        self._lock = threading.Lock()
+        self._creating: Set[str] = set()
+        self._attempts: Dict[str, int] = {}
+        # Too small, or failed max_attempts times: sent in full for the life of the process
+        self._uncacheable: Set[str] = set()
+        self.created = 0
+        self.failures = 0
+
+    @staticmethod
+    def key(prefix: str) -> str:
+        return hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+
+    def get(self, genai, prefix: str) -> Optional[Any]:
+        """A live CachedContent holding `prefix`, created if needed; None if the prefix goes out uncached."""
+        key = self.key(prefix)
+        now = time.monotonic()
+        with self._lock:
+            if key in self._uncacheable:
+                return None
+            tokens = estimate_tokens(prefix)
+            if tokens < self.min_tokens:
+                self._uncacheable.add(key)
+                logger.info(f"Prompt prefix {key} is ~{tokens} tokens, below the {self.min_tokens} needed for "
+                            f"context caching on {self.model_name}; sending full prompts (implicit caching only)")
+                return None
+            cached, stamp = self._entries.get(key, (None, None))
+            # Renewed a little before the server-side TTL so requests never reference an expired cache
+            if cached is not None and now - stamp < self.ttl_seconds * 0.9:
+                return cached
+            if cached is None and stamp is not None and now - stamp < self.retry_seconds:
+                return None
+            if key in self._creating:
+                # Someone else is uploading it; the old cache is still live for the last 10% of its TTL
+                return cached if cached is not None and now - stamp < self.ttl_seconds else None
+            self._creating.add(key)
+
+        try:
+            created = genai.caching.CachedContent.create(
+                model=self.model_name,
+                display_name=f"divinegpt-prefix-{key}",
+                contents=[prefix],
+                ttl=datetime.timedelta(seconds=self.ttl_seconds),
+            )
+        except Exception as e:
+            with self._lock:
+                self._creating.discard(key)
+                self.failures += 1
+                attempts = self._attempts[key] = self._attempts.get(key, 0) + 1
+                if attempts >= self.max_attempts:
+                    self._uncacheable.add(key)
+                    self._entries.pop(key, None)
+                else:
+                    self._entries[key] = (None, time.monotonic())
+            if attempts >= self.max_attempts:
+                logger.warning(f"Giving up on context caching for prefix {key} on {self.model_name} after "
+                               f"{attempts} attempts, sending full prompts (implicit caching only): {e}")
+            else:
+                logger.warning(f"Context caching failed for prefix {key} on {self.model_name}, sending full "
+                               f"prompts and retrying in {self.retry_seconds}s: {e}")
+            return None
+
+        with self._lock:
+            self._creating.discard(key)
+            self._attempts.pop(key, None)
+            self._entries[key] = (created, time.monotonic())
+            self.created += 1
+        logger.info(f"Cached prompt prefix {key} as {created.name} for {self.ttl_seconds}s")
+        return created
+
+    def stats(self) -> Dict:
+        with self._lock:
+            live = sum(1 for cached, _ in self._entries.values() if cached is not None)
+            uncacheable = len(self._uncacheable)
+        return {"model": self.model_name, "live_prefixes": live, "uncacheable_prefixes": uncacheable,
+                "created": self.created, "failures": self.failures}
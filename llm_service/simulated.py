@@ -0,0 +1,227 @@
+"""
+Simulated LLM backend for offline load and throughput testing.
+
+Answers are built from the prompt itself: RAG prompts get a schema-valid
+LLMStructuredResponse JSON object quoting the shloka from the SCRIPTURE CONTEXT
+section, conversational prompts get a short plain-text reply. The same prompt
+always produces the same text, so response caches behave as they would in production.
+
+Timing follows a latency model:
+    fixed      - every call waits SIM_TTFT_MS, then decodes at SIM_TOKENS_PER_SECOND
+    lognormal  - time to first token is lognormal around the SIM_TTFT_MS median (SIM_TTFT_SIGMA)
+    trace      - replays timings recorded with LLM_TRACE_PATH, in order, looping
+
+Failures are injected with SIM_ERROR_RATE (the call fails before the first token)
+and SIM_STREAM_ABORT_RATE (a stream breaks off part-way). SIM_SEED makes runs repeatable.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from shared.config import (
+    SIM_LATENCY_MODEL, SIM_TTFT_MS, SIM_TTFT_SIGMA, SIM_TOKENS_PER_SECOND, SIM_CHUNK_TOKENS,
+    SIM_TRACE_PATH, SIM_ERROR_RATE, SIM_STREAM_ABORT_RATE, SIM_SEED,
+)
+from shared.logger import get_logger
+from shared.schema import LLMStructuredResponse
+from .backends import LLMBackend
+
+logger = get_logger("Simulated LLM")
+
+LATENCY_MODELS = ("fixed", "lognormal", "trace")
+
+_SHLOKA = re.compile(r"Shloka \(Sanskrit\): (.*)")
+_MEANING = re.compile(r"Meaning \(English\): (.*)")
+_QUESTION = re.compile(r"USER'S CURRENT (?:QUESTION|MESSAGE):\s*\"(.*)\"", re.DOTALL)
+_SUMMARY = re.compile(r"PREVIOUS SUMMARY:\s*\n(.*?)\n\s*\n", re.DOTALL)
+
+_FALLBACK_SHLOKA = "कर्मण्येवाधिकारस्ते मा फलेषु कदाचन। मा कर्मफलहेतुर्भूर्मा ते सङ्गोऽस्त्वकर्मणि॥"
+_FALLBACK_MEANING = ("You have a right to perform your duty, but never to its fruits. "
+                     "Let not the fruits of action be your motive, nor be attached to inaction.")
+_EMOTIONS = ("Anxious", "Confused", "Hopeful", "Sad", "Curious", "Restless", "Calm", "Grateful")
+_SENTENCES = (
+    "Dear friend, what you are feeling is human, and it is not a sign that you are lost.",
+    "Krishna reminds Arjuna that the mind settles through steady practice, not through force.",
+    "Do the work in front of you with full attention, and let go of the need to control the outcome.",
+    "The self that watches your worries is untouched by them; return to it, again and again.",
+    "Small, sincere actions repeated every day carry more strength than one grand resolution.",
+    "When the noise around you grows loud, your duty is simply the next right step.",
+    "You are not your failures, nor your successes; you are the one who keeps walking.",
+    "Offer your effort as a gift, and the weight of expectation becomes lighter.",
+)
+_REFLECTIONS = (
+    "What is one small thing you could do today without worrying about how it turns out?",
+    "When did you last feel completely present, and what were you doing?",
+    "Which of your worries is about the result rather than the action itself?",
+    "What would change if you treated this challenge as practice rather than a test?",
+)
+
+
+class SimulatedBackendError(Exception):
+    """An injected provider failure."""
+
+
+def estimate_tokens(text: str) -> int:
+    # Same ~4 bytes per token estimate as the RAG prompt budgeting
+    return math.ceil(len(text.encode("utf-8")) / 4) if text else 0
+
+
+def load_trace(path: str) -> List[Dict]:
+    """Timings recorded with LLM_TRACE_PATH: one JSON object per line."""
+    with open(path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    if not entries:
+        raise ValueError(f"Latency trace {path} is empty")
+    return entries
+
+
+class SimulatedBackend(LLMBackend):
+    name = "simulated"
+
+    def __init__(
+            self,
+            latency_model: str = SIM_LATENCY_MODEL,
+            ttft_ms: float = SIM_TTFT_MS,
+            ttft_sigma: float = SIM_TTFT_SIGMA,
+            tokens_per_second: float = SIM_TOKENS_PER_SECOND,
+            chunk_tokens: int = SIM_CHUNK_TOKENS,
+            trace_path: str = SIM_TRACE_PATH,
+            error_rate: float = SIM_ERROR_RATE,
+            stream_abort_rate: float = SIM_STREAM_ABORT_RATE,
+            seed: int = SIM_SEED,
+    ):
+        if latency_model not in LATENCY_MODELS:
+            raise ValueError(f"Unknown latency model '{latency_model}', expected one of {LATENCY_MODELS}")
+        if latency_model == "trace" and not trace_path:
+            raise ValueError("SIM_LATENCY_MODEL=trace needs SIM_TRACE_PATH")
+        self.latency_model = latency_model
+        self.ttft_ms = ttft_ms
+        self.ttft_sigma = ttft_sigma
+        self.tokens_per_second = tokens_per_second
+        # 0 (or less) means unthrottled, as for trace entries without a decode time
+        self._decode_rate = tokens_per_second if tokens_per_second > 0 else math.inf
+        self.chunk_tokens = max(1, chunk_tokens)
+        self.trace_path = trace_path
+        self.error_rate = error_rate
+        self.stream_abort_rate = stream_abort_rate
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._trace: Optional[List[Dict]] = None
+        self._trace_position = 0
+        self.calls = 0
+        self.injected_errors = 0
+        self.aborted_streams = 0
+
+    def warm_up(self):
+        if self.latency_model == "trace":
+            self._trace = load_trace(self.trace_path)
+        logger.info(f"Simulated backend: {self.latency_model} latency, TTFT {self.ttft_ms}ms, "
+                    f"{self.tokens_per_second} tokens/s, error rate {self.error_rate}, seed {self.seed}")
+
+    def sample_timing(self) -> Tuple[float, float]:
+        """(seconds to first token, output tokens per second) for the next call."""
+        if self.latency_model == "fixed":
+            return self.ttft_ms / 1000, self._decode_rate
+        if self.latency_model == "lognormal":
+            return self.ttft_ms / 1000 * math.exp(self._rng.gauss(0, self.ttft_sigma)), self._decode_rate
+        if self._trace is None:
+            self._trace = load_trace(self.trace_path)
+        entry = self._trace[self._trace_position % len(self._trace)]
+        self._trace_position += 1
+        # Non-streamed recordings have no first-token time: the whole answer arrived at once
+        duration = entry["duration_ms"] / 1000
+        ttft = entry.get("ttft_ms", entry["duration_ms"]) / 1000
+        decode = duration - ttft
+        tokens_per_second = entry.get("output_tokens", 0) / decode if decode > 0 else math.inf
+        return ttft, tokens_per_second or math.inf
+
+    def _answer(self, prompt: str) -> str:
+        # Seeded by the prompt so identical prompts get identical answers
+        rng = random.Random(int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16], 16) ^ self.seed)
+        question = _QUESTION.search(prompt)
+        question = " ".join(question.group(1).split()) if question else "your question"
+        if "SCRIPTURE CONTEXT" not in prompt:
+            return f"{rng.choice(_SENTENCES)} You said: \"{question[:200]}\". {rng.choice(_REFLECTIONS)}"
+
+        shloka, meaning = _SHLOKA.search(prompt), _MEANING.search(prompt)
+        shloka = shloka.group(1).strip() if shloka and shloka.group(1).strip() not in ("", "N/A") else _FALLBACK_SHLOKA
+        meaning = meaning.group(1).strip() if meaning and meaning.group(1).strip() not in ("", "N/A") \
+            else _FALLBACK_MEANING
+        summary = _SUMMARY.search(prompt)
+        summary = summary.group(1).strip() if summary else ""
+        if summary.startswith("No previous summary"):
+            summary = ""
+        # ~200 words, like the prompt asks for
+        sentences = rng.sample(_SENTENCES, len(_SENTENCES)) * 2
+        answer = LLMStructuredResponse(
+            shloka=shloka,
+            meaning=meaning,
+            shloka_summary=f"This verse speaks to what you asked: \"{question[:120]}\".",
+            response=" ".join(sentences[:12]),
+            reflection=rng.choice(_REFLECTIONS),
+            emotion=rng.choice(_EMOTIONS),
+            new_summary=f"{summary} The user asked: \"{question[:120]}\".".strip(),
+        )
+        return json.dumps(answer.model_dump(), ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def _usage(prompt: str, prefix_chars: int, text: str) -> Dict[str, int]:
+        prompt_tokens = estimate_tokens(prompt)
+        # Reported as if the stable prefix were served from a context cache
+        cached = min(estimate_tokens(prompt[:prefix_chars]), prompt_tokens)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "cached_prefix_tokens": cached,
+            "fresh_prompt_tokens": prompt_tokens - cached,
+            "output_tokens": estimate_tokens(text),
+        }
+
+    async def _first_token(self) -> float:
+        """Waits out the time to first token (or fails, if an error is injected); returns the decode speed."""
+        self.calls += 1
+        ttft, tokens_per_second = self.sample_timing()
+        failing = self._rng.random() < self.error_rate
+        await asyncio.sleep(ttft)
+        if failing:
+            self.injected_errors += 1
+            raise SimulatedBackendError("Injected provider error (SIM_ERROR_RATE)")
+        return tokens_per_second
+
+    async def generate(self, prompt: str, prefix_chars: int = 0) -> Tuple[str, Dict[str, int]]:
+        tokens_per_second = await self._first_token()
+        text = self._answer(prompt)
+        await asyncio.sleep(estimate_tokens(text) / tokens_per_second)
+        return text, self._usage(prompt, prefix_chars, text)
+
+    async def stream(self, prompt: str, prefix_chars: int = 0, usage: Dict[str, int] = None) -> AsyncIterator[str]:
+        tokens_per_second = await self._first_token()
+        text = self._answer(prompt)
+        chunk_chars = self.chunk_tokens * 4
+        chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+        abort_at = self._rng.randrange(len(chunks)) if self._rng.random() < self.stream_abort_rate else None
+        for index, chunk in enumerate(chunks):
+            if index == abort_at:
+                self.aborted_streams += 1
+                raise SimulatedBackendError("Injected stream abort (SIM_STREAM_ABORT_RATE)")
+            if index:
+                await asyncio.sleep(estimate_tokens(chunk) / tokens_per_second)
+            yield chunk
+        if usage is not None:
+            usage.update(self._usage(prompt, prefix_chars, text))
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.name,
+            "latency_model": self.latency_model,
+            "ttft_ms": self.ttft_ms,
+            "tokens_per_second": self.tokens_per_second,
+            "error_rate": self.error_rate,
+            "stream_abort_rate": self.stream_abort_rate,
+            "calls": self.calls,
+            "injected_errors": self.injected_errors,
+            "aborted_streams": self.aborted_streams,
+        }
@@ -1,71 +1,351 @@
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-from sentence_transformers import SentenceTransformer
+from qdrant_client.models import Distance, VectorParams, PointStruct, PointIdsList
+from rag_service.embedding_backends import load_embedding_model
 import pandas as pd
-from shared.config import DATASET_DIR, QDRANT_URL, QDRANT_API_KEY, EMBEDDING_MODEL
+from shared.config import (
+    QDRANT_URL, QDRANT_API_KEY, EMBEDDING_MODEL, LOCAL_INDEX_DIR,
+    INDEX_CHUNK_SIZE, INDEX_UPLOAD_WORKERS, INDEX_CHECKPOINT_DIR, INDEX_EMBEDDING_STORE_PATH,
+)
+from rag_service.local_index import (
+    LocalGitaIndex, MODEL_PROBE_MIN_SIMILARITY, model_fingerprint, model_probe, probe_similarity,
+)
+from rag_service.embedding_cache import ContentEmbeddingStore
+from rag_service.corpus import GITA_DATASET_PATH, build_payload, load_gita_dataframe
+from concurrent.futures import ThreadPoolExecutor, ALL_COMPLETED, FIRST_COMPLETED, wait
+from pathlib import Path
+import argparse
+import hashlib
+import json
 import os
+import time
+import uuid
+
+# Point IDs are derived from the verse ID so they survive row insertions/deletions in the CSV.
+# Collections indexed before this used integer row IDs; migrate them once with either a fresh
+# full upload (which drops the collection) or --incremental (which deletes the old integer IDs).
+POINT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "divinegpt/bhagwad_gita")
 
 class QdrantGitaIndexer:
     def __init__(
             self,
             collection_name: str = "divinegpt-gita",
-            dataset_path: str = str(DATASET_DIR / 'bhagwad_gita.csv').replace("/", os.sep),
+            dataset_path: str = GITA_DATASET_PATH,
             embedding_model_name:str = EMBEDDING_MODEL,
+            chunk_size: int = INDEX_CHUNK_SIZE,
+            upload_workers: int = INDEX_UPLOAD_WORKERS,
     ):
         self.client = QdrantClient(
             url=QDRANT_URL,
             api_key=QDRANT_API_KEY,
             timeout=180,
         )
-        self.embedding_model = SentenceTransformer(embedding_model_name)
+        self.embedding_model = load_embedding_model(embedding_model_name)
+        self.embedding_model_name = embedding_model_name
+        self.model_id = f"{embedding_model_name}@{model_fingerprint(self.embedding_model)}"
+        self.embedding_store = ContentEmbeddingStore(INDEX_EMBEDDING_STORE_PATH, self.model_id)
         self.collection_name = collection_name
         self.dataset_path = dataset_path
+        self.chunk_size = max(1, chunk_size)
+        self.upload_workers = max(1, upload_workers)
+        self.checkpoint_path = Path(INDEX_CHECKPOINT_DIR) / f"{collection_name}.checkpoint.json"
 
-    def recreate_collection(self):
+    def ensure_collection(self):
         if not self.client.collection_exists(self.collection_name):
-            self.client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=VectorParams(
-                    size=self.embedding_model.get_sentence_embedding_dimension(),
-                    distance=Distance.COSINE
-                )
-            )
-            print(f"✅ Collection {self.collection_name} created!")
+            self.create_collection()
         else:
             print(f"✅ Collection {self.collection_name} already exists!")
 
+    def recreate_collection(self):
+        """Drops the collection if it exists, so no stale points survive a full upload."""
+        if self.client.collection_exists(self.collection_name):
+            self.client.delete_collection(collection_name=self.collection_name)
+            print(f"🗑️ Collection {self.collection_name} dropped.")
+        self.create_collection()
+
+    def create_collection(self):
+        self.client.create_collection(
+            collection_name=self.collection_name,
+            vectors_config=VectorParams(
+                size=self.embedding_model.get_sentence_embedding_dimension(),
+                distance=Distance.COSINE
+            )
+        )
+        print(f"✅ Collection {self.collection_name} created!")
+
     def load_data(self):
-        df = pd.read_csv(self.dataset_path)
-        df = df.dropna(subset=["EngMeaning", "Shloka"])
-        return df
+        return load_gita_dataframe(self.dataset_path)
+
+    @staticmethod
+    def point_id(row) -> str:
+        return str(uuid.uuid5(POINT_ID_NAMESPACE, row["ID"]))
+
+    @staticmethod
+    def build_payload(row) -> dict:
+        return build_payload(row)
+
+    def embed_rows(self, df: pd.DataFrame):
+        """Embeds `EngMeaning` for each row, reusing stored vectors for unchanged text."""
+        return self.embedding_store.embed(
+            df["EngMeaning"].tolist(),
+            lambda texts: self.embedding_model.encode(texts, batch_size=len(texts), convert_to_numpy=True),
+        )
 
     def prepare_points(self, df: pd.DataFrame):
+        """Embeds a chunk of rows in one batched call and builds its points."""
+        vectors = self.embed_rows(df)
         points = []
-        for idx, row in df.iterrows():
-            vector = self.embedding_model.encode(row["EngMeaning"]).tolist()
-            payload = {
-                "id": row["ID"],
-                "chapter": int(row["Chapter"]),
-                "verse": int(row["Verse"]),
-                "shloka": row["Shloka"],
-                "transliteration": row["Transliteration"],
-                "hin_meaning": row["HinMeaning"],
-                "eng_meaning": row["EngMeaning"],
-                "word_meaning": row["WordMeaning"]
-            }
-            points.append(PointStruct(id=idx, vector=vector, payload=payload))
+        for (_, row), vector in zip(df.iterrows(), vectors):
+            payload = self.build_payload(row)
+            payload["embedding_model"] = self.model_id
+            points.append(PointStruct(id=self.point_id(row), vector=vector.tolist(), payload=payload))
         return points
 
-    def upload_to_qdrant(self):
+    def _run_signature(self) -> str:
+        """Identifies dataset + model + chunking, so a stale checkpoint is never resumed."""
+        digest = hashlib.sha256()
+        with open(self.dataset_path, "rb") as f:
+            digest.update(f.read())
+        digest.update(f"{self.collection_name}|{self.embedding_model_name}|{self.chunk_size}".encode())
+        return digest.hexdigest()
+
+    def _load_checkpoint(self, signature: str) -> set:
+        if not self.checkpoint_path.exists():
+            return set()
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        if checkpoint.get("signature") != signature:
+            print("[♻️] Checkpoint belongs to a different dataset/model; starting over.")
+            return set()
+        return set(checkpoint.get("completed_chunks", []))
+
+    def _save_checkpoint(self, signature: str, completed: set):
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"signature": signature, "completed_chunks": sorted(completed)}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def upload_to_qdrant(self, resume: bool = True):
+        """
+        Streams the dataset into Qdrant chunk by chunk: each chunk is batch-encoded
+        and upserted on a bounded pool while the next chunk encodes. Completed chunks
+        are checkpointed so an interrupted run picks up where it stopped. A run that
+        is not resuming starts from a freshly recreated collection.
+        """
+        print("[📖] Loading Bhagavad Gita data...")
+        df = self.load_data()
+        signature = self._run_signature()
+        completed = self._load_checkpoint(signature) if resume else set()
+        chunks = [
+            (i, df.iloc[start:start + self.chunk_size])
+            for i, start in enumerate(range(0, len(df), self.chunk_size))
+        ]
+        pending_chunks = [(i, chunk) for i, chunk in chunks if i not in completed]
+        resumed = bool(completed)
+        if resumed:
+            self.ensure_collection()
+            print(f"[⏩] Resuming: {len(completed)}/{len(chunks)} chunks already uploaded.")
+        else:
+            self.recreate_collection()
+        print(f"[🧠] Embedding & uploading {len(pending_chunks)} chunks of up to {self.chunk_size} verses "
+              f"with {self.upload_workers} upload workers...")
+
+        started = time.perf_counter()
+        uploaded = 0
+        in_flight = {}
+
+        def drain(return_when):
+            nonlocal uploaded
+            done, _ = wait(in_flight, return_when=return_when)
+            errors = []
+            for future in done:
+                chunk_id, count = in_flight.pop(future)
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                    continue
+                completed.add(chunk_id)
+                uploaded += count
+                self._save_checkpoint(signature, completed)
+                rate = uploaded / (time.perf_counter() - started)
+                print(f"[📦] Chunk {chunk_id + 1}/{len(chunks)} uploaded ({uploaded} verses, {rate:.1f} verses/s)")
+            if errors:
+                # Finished chunks are already checkpointed; a re-run resumes from here
+                raise errors[0]
+
+        with ThreadPoolExecutor(max_workers=self.upload_workers, thread_name_prefix="upsert") as pool:
+            for chunk_id, chunk in pending_chunks:
+                points = self.prepare_points(chunk)
+                if len(in_flight) >= self.upload_workers:
+                    drain(FIRST_COMPLETED)
+                future = pool.submit(
+                    self.client.upsert, collection_name=self.collection_name, points=points, wait=True
+                )
+                in_flight[future] = (chunk_id, len(points))
+            if in_flight:
+                drain(ALL_COMPLETED)
+
+        elapsed = time.perf_counter() - started
+        rate = uploaded / elapsed if elapsed else 0.0
+        print(f"[✅] Uploaded {uploaded} shlokas into Qdrant in {elapsed:.1f}s ({rate:.1f} verses/s)")
+        if resumed:
+            # The collection was not dropped, so it may still hold points from an older layout
+            self.delete_stale_points(df)
+        self.checkpoint_path.unlink(missing_ok=True)
+        self.embedding_store.save()
+
+    def fetch_indexed_state(self) -> dict:
+        """Returns {point_id: payload} for every point, with only the fields needed for a diff."""
+        state, offset = {}, None
+        if not self.client.collection_exists(self.collection_name):
+            return state
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=256,
+                offset=offset,
+                with_payload=["id", "content_hash", "embedding_model"],
+                with_vectors=False,
+            )
+            for point in points:
+                state[str(point.id)] = point.payload or {}
+            if offset is None:
+                return state
+
+    def delete_stale_points(self, df: pd.DataFrame):
+        """Deletes points whose ID matches no verse in the dataset."""
+        desired = {self.point_id(row) for _, row in df.iterrows()}
+        stale = [pid for pid in self.fetch_indexed_state() if pid not in desired]
+        if stale:
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=PointIdsList(points=stale),
+                wait=True,
+            )
+            print(f"[🗑️] Deleted {len(stale)} stale points.")
+
+    def compatible_model_ids(self, indexed: dict) -> set:
+        """
+        Model IDs in the collection that count as the current model. The fingerprint in a model ID
+        hashes float output, so the same weights on another machine or backend may carry another
+        one: an ID naming this model counts if re-embedding one of its verses gives the stored vector.
+        """
+        compatible = {self.model_id}
+        samples = {}
+        for pid, payload in indexed.items():
+            model_id = payload.get("embedding_model") or ""
+            if model_id not in compatible and model_id.rsplit("@", 1)[0] == self.embedding_model_name:
+                samples.setdefault(model_id, int(pid) if pid.isdigit() else pid)
+        for model_id, pid in samples.items():
+            point = self.client.retrieve(
+                collection_name=self.collection_name, ids=[pid], with_payload=["eng_meaning"], with_vectors=True,
+            )[0]
+            similarity = probe_similarity(point.vector, self.embedding_model.encode(point.payload["eng_meaning"]))
+            if similarity >= MODEL_PROBE_MIN_SIMILARITY:
+                compatible.add(model_id)
+            else:
+                print(f"[♻️] Points embedded with {model_id} differ from this model (similarity {similarity:.4f}).")
+        return compatible
+
+    def diff(self, df: pd.DataFrame) -> dict:
+        """Compares the dataset against the collection: new, changed and deleted verses."""
+        indexed = self.fetch_indexed_state()
+        current_models = self.compatible_model_ids(indexed)
+        desired = {self.point_id(row): row for _, row in df.iterrows()}
+        new, changed = [], []
+        for pid, row in desired.items():
+            current = indexed.get(pid)
+            if current is None:
+                new.append(pid)
+            elif (current.get("content_hash") != self.build_payload(row)["content_hash"]
+                  or current.get("embedding_model") not in current_models):
+                changed.append(pid)
+        deleted = [pid for pid in indexed if pid not in desired]
+        return {
+            "new": new,
+            "changed": changed,
+            "deleted": deleted,
+            "unchanged": len(desired) - len(new) - len(changed),
+            "verse_ids": {pid: desired[pid]["ID"] for pid in new + changed},
+            "deleted_verse_ids": {pid: indexed[pid].get("id", pid) for pid in deleted},
+        }
+
+    def reindex(self, dry_run: bool = False) -> dict:
+        """Applies only the diff between the dataset and the collection."""
         print("[📖] Loading Bhagavad Gita data...")
         df = self.load_data()
-        print("[🧠] Data loaded. Embedding & preparing vectors...")
-        points = self.prepare_points(df)
-        print("[📦] Uploading to Qdrant vector DB...")
-        self.client.upsert(collection_name=self.collection_name, points=points)
-        print(f"[✅] Uploaded {len(points)} shlokas into Qdrant successfully!")
+        print("[🔍] Comparing dataset with the indexed collection...")
+        report = self.diff(df)
+        ids = report["verse_ids"]
+        print(f"[🧾] new: {len(report['new'])}, changed: {len(report['changed'])}, "
+              f"deleted: {len(report['deleted'])}, unchanged: {report['unchanged']}")
+        def preview(verse_ids, limit=20):
+            verse_ids = [str(v) for v in verse_ids]
+            more = f" ... and {len(verse_ids) - limit} more" if len(verse_ids) > limit else ""
+            return ", ".join(verse_ids[:limit]) + more
+
+        for label in ("new", "changed"):
+            if report[label]:
+                print(f"    {label}: {preview(ids[pid] for pid in report[label])}")
+        if report["deleted"]:
+            print(f"    deleted: {preview(report['deleted_verse_ids'].values())}")
+        if dry_run:
+            print("[🌵] Dry run: nothing was written.")
+            return report
+
+        started = time.perf_counter()
+        misses_before = self.embedding_store.misses
+        to_upsert = set(report["new"]) | set(report["changed"])
+        rows = df[[self.point_id(row) in to_upsert for _, row in df.iterrows()]]
+        for start in range(0, len(rows), self.chunk_size):
+            points = self.prepare_points(rows.iloc[start:start + self.chunk_size])
+            self.client.upsert(collection_name=self.collection_name, points=points, wait=True)
+        if report["deleted"]:
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=PointIdsList(points=report["deleted"]),
+                wait=True,
+            )
+        self.embedding_store.save()
+        print(f"[✅] Re-indexed {len(rows)} and deleted {len(report['deleted'])} shlokas in "
+              f"{time.perf_counter() - started:.1f}s ({self.embedding_store.misses - misses_before} verses re-embedded)")
+        return report
+
+    def export_local_index(self, index_dir: str = LOCAL_INDEX_DIR):
+        """Writes the in-process index bundle used by the "numpy" retriever backend."""
+        print("[📖] Loading Bhagavad Gita data...")
+        df = self.load_data()
+        print("[🧠] Data loaded. Embedding verses...")
+        embeddings = self.embed_rows(df)
+        payloads = [self.build_payload(row) for _, row in df.iterrows()]
+        LocalGitaIndex.write(
+            index_dir,
+            embeddings,
+            payloads,
+            model_name=self.embedding_model_name,
+            model_hash=model_fingerprint(self.embedding_model),
+            model_probe=model_probe(self.embedding_model),
+        )
+        self.embedding_store.save()
+        print(f"[✅] Wrote local index with {len(payloads)} shlokas to {index_dir}")
 
 if __name__ == "__main__":
-    indexer = QdrantGitaIndexer()
-    indexer.recreate_collection()
-    indexer.upload_to_qdrant()
+    parser = argparse.ArgumentParser(description="Index the Bhagavad Gita dataset.")
+    parser.add_argument("--local-index", nargs="?", const=LOCAL_INDEX_DIR, default=None, metavar="DIR",
+                        help="write an in-process index bundle instead of uploading to Qdrant")
+    parser.add_argument("--chunk-size", type=int, default=INDEX_CHUNK_SIZE, help="verses embedded and upserted per chunk")
+    parser.add_argument("--workers", type=int, default=INDEX_UPLOAD_WORKERS, help="concurrent upsert requests")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint, drop the collection and re-upload everything")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only upsert new/changed verses and delete removed ones")
+    parser.add_argument("--dry-run", action="store_true", help="with --incremental, only report what would change")
+    args = parser.parse_args()
+
+    indexer = QdrantGitaIndexer(chunk_size=args.chunk_size, upload_workers=args.workers)
+    if args.local_index:
+        indexer.export_local_index(args.local_index)
+    elif args.incremental or args.dry_run:
+        if not args.dry_run:
+            indexer.ensure_collection()
+        indexer.reindex(dry_run=args.dry_run)
+    else:
+        indexer.upload_to_qdrant(resume=not args.restart)
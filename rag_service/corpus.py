@@ -0,0 +1,56 @@
+"""
+Loading the Gita dataset and turning rows into verse payloads.
+
+Shared by the indexer (rag_service/client.py) and the in-process lexical index,
+so both see exactly the same payloads.
+"""
+import hashlib
+import json
+import os
+from typing import Dict, List
+
+import pandas as pd
+
+from shared.config import DATASET_DIR
+
+GITA_DATASET_PATH = str(DATASET_DIR / 'bhagwad_gita.csv').replace("/", os.sep)
+
+
+def load_gita_dataframe(dataset_path: str = GITA_DATASET_PATH) -> pd.DataFrame:
+    df = pd.read_csv(dataset_path)
+    df = df.dropna(subset=["EngMeaning", "Shloka"])
+    return df
+
+
+def build_payload(row) -> Dict:
+    def text(value):
+        return None if pd.isna(value) else value
+
+    payload = {
+        "id": row["ID"],
+        "chapter": int(row["Chapter"]),
+        "verse": int(row["Verse"]),
+        "shloka": row["Shloka"],
+        "transliteration": text(row["Transliteration"]),
+        "hin_meaning": text(row["HinMeaning"]),
+        "eng_meaning": row["EngMeaning"],
+        "word_meaning": text(row["WordMeaning"])
+    }
+    payload["content_hash"] = hashlib.sha256(
+        json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return payload
+
+
+def load_gita_payloads(dataset_path: str = GITA_DATASET_PATH) -> List[Dict]:
+    return [build_payload(row) for _, row in load_gita_dataframe(dataset_path).iterrows()]
+
+
+def corpus_version(payloads: List[Dict], model_name: str) -> str:
+    """Short hash of the indexed verses and embedding model; changes whenever a re-index would."""
+    digest = hashlib.sha256(model_name.encode("utf-8"))
+    for payload in sorted(payloads, key=lambda p: str(p["id"])):
+        content = payload.get("content_hash") or json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        # Points in a Qdrant collection also name the model (and its weights) they were embedded with
+        digest.update(f"{payload['id']}:{content}:{payload.get('embedding_model', '')}".encode("utf-8"))
+    return digest.hexdigest()[:12]
@@ -0,0 +1,112 @@
+"""
+Selectable CPU runtimes for the sentence embedding model.
+
+    torch       - stock PyTorch eager mode (reference)
+    torch-int8  - PyTorch with nn.Linear layers dynamically quantised to int8
+    onnx        - ONNX Runtime graph exported by sentence-transformers
+    onnx-int8   - ONNX Runtime graph with dynamically quantised int8 weights
+
+All backends return a SentenceTransformer, so callers keep using `.encode()`.
+The ONNX backends need `optimum[onnxruntime]` (rag_service/requirements-onnx.txt).
+The int8 graph is quantised for EMBEDDING_ONNX_QUANTIZATION, by default the best
+instruction set this host's CPU supports.
+"""
+import platform
+from pathlib import Path
+
+from sentence_transformers import SentenceTransformer
+
+from shared.config import EMBEDDING_BACKEND, EMBEDDING_THREADS, EMBEDDING_ONNX_QUANTIZATION, MODEL_CACHE_DIR
+from shared.logger import get_logger
+
+logger = get_logger("Embedding Backends")
+
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+ONNX_QUANTIZATION_CONFIGS = ("arm64", "avx2", "avx512", "avx512_vnni")
+
+
+def _cpu_flags() -> set:
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return set(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+
+def onnx_quantization_config(setting: str = EMBEDDING_ONNX_QUANTIZATION) -> str:
+    """The configured int8 target, or for "auto" the best one this CPU runs."""
+    if setting != "auto":
+        if setting not in ONNX_QUANTIZATION_CONFIGS:
+            raise ValueError(f"Unknown EMBEDDING_ONNX_QUANTIZATION '{setting}', "
+                             f"expected auto or one of {ONNX_QUANTIZATION_CONFIGS}")
+        return setting
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    flags = _cpu_flags()
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags:
+        return "avx512"
+    # avx2 kernels are the most portable x86 choice; also used when the flags cannot be read
+    return "avx2"
+
+
+def _set_torch_threads(threads: int):
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def _onnx_model_kwargs(threads: int) -> dict:
+    model_kwargs = {"provider": "CPUExecutionProvider"}
+    if threads > 0:
+        import onnxruntime
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = threads
+        session_options.inter_op_num_threads = 1
+        model_kwargs["session_options"] = session_options
+    return model_kwargs
+
+
+def _quantized_onnx_dir(model_name: str, threads: int, config: str) -> Path:
+    """Exports and quantises the ONNX graph once per target, caching it under MODEL_CACHE_DIR."""
+    target = Path(MODEL_CACHE_DIR) / "onnx-int8" / model_name.replace("/", "__")
+    if not (target / "onnx" / f"model_qint8_{config}.onnx").exists():
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        logger.info(f"Exporting int8 ONNX model ({config}) for {model_name} to {target}...")
+        model = SentenceTransformer(model_name, backend="onnx", model_kwargs=_onnx_model_kwargs(threads))
+        model.save(str(target))
+        export_dynamic_quantized_onnx_model(model, config, str(target))
+    return target
+
+
+def load_embedding_model(
+        model_name: str,
+        backend: str = EMBEDDING_BACKEND,
+        threads: int = EMBEDDING_THREADS,
+) -> SentenceTransformer:
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+    try:
+        if backend == "torch":
+            _set_torch_threads(threads)
+            return SentenceTransformer(model_name, device="cpu")
+        if backend == "torch-int8":
+            import torch
+            _set_torch_threads(threads)
+            model = SentenceTransformer(model_name, device="cpu")
+            return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        if backend == "onnx":
+            return SentenceTransformer(model_name, backend="onnx", model_kwargs=_onnx_model_kwargs(threads))
+        config = onnx_quantization_config()
+        model_kwargs = {**_onnx_model_kwargs(threads), "file_name": f"onnx/model_qint8_{config}.onnx"}
+        return SentenceTransformer(
+            str(_quantized_onnx_dir(model_name, threads, config)), backend="onnx", model_kwargs=model_kwargs
+        )
+    except ImportError as e:
+        raise ImportError(f"Embedding backend '{backend}' needs extra packages "
+                          f"(pip install -r rag_service/requirements-onnx.txt): {e}") from e
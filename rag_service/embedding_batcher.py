@@ -0,0 +1,143 @@
+"""
+Cross-request micro-batching for query embeddings.
+
+Concurrent callers enqueue single queries; one worker drains the queue into
+batches (up to `max_batch_size`, waiting at most `max_wait_ms` after the first
+item) and runs a single batched encode.
+"""
+import asyncio
+import time
+from concurrent.futures import Executor
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from shared.logger import get_logger
+from shared.metrics import Histogram
+
+logger = get_logger("Embedding Batcher")
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+QUEUE_WAIT_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+
+class BatcherOverloaded(Exception):
+    """Raised when the batch queue is full."""
+
+
+class EmbeddingBatcher:
+    def __init__(
+            self,
+            encode_batch: Callable[[List[str]], np.ndarray],
+            max_batch_size: int = 16,
+            max_wait_ms: float = 5,
+            max_queue_depth: int = 256,
+            executor: Optional[Executor] = None,
+    ):
+        self.encode_batch = encode_batch
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_depth = max_queue_depth
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.batch_size_histogram = Histogram(BATCH_SIZE_BUCKETS)
+        self.queue_wait_histogram = Histogram(QUEUE_WAIT_BUCKETS)
+        self.rejected = 0
+        self.worker_restarts = 0
+
+    def _ensure_worker(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_depth)
+        if self._worker is None or self._worker.done():
+            if self._worker is not None:
+                # Queries already queued stay in the queue for the new worker
+                self.worker_restarts += 1
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+            self._worker.add_done_callback(self._worker_done)
+
+    def _worker_done(self, task: asyncio.Task):
+        if task.cancelled() or task.exception() is None:
+            return
+        logger.error(f"Embedding batch worker died, restarting it: {task.exception()!r}")
+        # Right away, so queries already queued are not stuck until the next one arrives
+        self._ensure_worker()
+
+    async def encode(self, text: str) -> np.ndarray:
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((text, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise BatcherOverloaded(f"Embedding queue is full ({self.max_queue_depth} pending)")
+        return await future
+
+    async def _collect(self, batch: list):
+        """Fills `batch` in place, so the caller still holds what was dequeued if this is interrupted."""
+        batch.append(await self._queue.get())
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = []
+                await self._collect(batch)
+                started = time.perf_counter()
+                for _, _, enqueued_at in batch:
+                    self.queue_wait_histogram.observe(started - enqueued_at)
+                self.batch_size_histogram.observe(len(batch))
+
+                texts = [text for text, _, _ in batch]
+                try:
+                    vectors = await loop.run_in_executor(self.executor, self.encode_batch, texts)
+                except Exception as e:
+                    logger.error(f"Batched encode of {len(texts)} queries failed: {e}")
+                    for _, future, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, future, _), vector in zip(batch, vectors):
+                    if not future.done():  # caller may have been cancelled
+                        future.set_result(vector)
+        except BaseException as e:
+            # The batch this worker had dequeued would otherwise be awaited forever
+            for _, future, _ in batch:
+                if future.done():
+                    continue
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                else:
+                    future.cancel()
+            raise
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_queue_depth": self.max_queue_depth,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "rejected": self.rejected,
+            "worker_restarts": self.worker_restarts,
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "queue_wait_seconds": self.queue_wait_histogram.snapshot(),
+        }
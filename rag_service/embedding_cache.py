@@ -0,0 +1,185 @@
+"""
+Embedding caches: a bounded LRU for query embeddings (TTL eviction, optional disk
+persistence) and a content-addressed store used by the indexer.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from shared.logger import get_logger
+
+logger = get_logger("Embedding Cache")
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Folds case, punctuation and whitespace so near-identical questions share a key."""
+    query = _PUNCTUATION.sub(" ", query.casefold())
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+class QueryEmbeddingCache:
+    def __init__(self, max_size: int = 2048, ttl_seconds: float = 86400, persist_path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = Path(persist_path) if persist_path else None
+        # key -> (vector, inserted_at); wall-clock time so persisted entries age correctly
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expired(self, inserted_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - inserted_at > self.ttl_seconds
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            vector, inserted_at = entry
+            if self._expired(inserted_at, now):
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, query: str, vector: np.ndarray):
+        if self.max_size <= 0:
+            return
+        key = normalize_query(query)
+        vector = np.asarray(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        with self._lock:
+            self._entries[key] = (vector, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def save(self):
+        """Writes live entries to `persist_path` (no-op when persistence is disabled)."""
+        if not self.persist_path:
+            return
+        now = time.time()
+        with self._lock:
+            live = [(k, v, t) for k, (v, t) in self._entries.items() if not self._expired(t, now)]
+        if not live:
+            return
+        self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+        keys, vectors, inserted = zip(*live)
+        # np.savez appends .npz to names without it, so write through a file handle
+        with open(self.persist_path, "wb") as f:
+            np.savez(f, keys=np.array(keys), vectors=np.stack(vectors), inserted_at=np.array(inserted))
+        logger.info(f"Persisted {len(live)} query embeddings to {self.persist_path}")
+
+    def load(self):
+        """Warms the cache from `persist_path`, keeping LRU order and dropping expired entries."""
+        if not self.persist_path or not self.persist_path.exists():
+            return
+        try:
+            with np.load(self.persist_path) as data:
+                keys, vectors, inserted = data["keys"], data["vectors"], data["inserted_at"]
+        except Exception as e:
+            logger.warning(f"Could not load embedding cache from {self.persist_path}: {e}")
+            return
+        now = time.time()
+        with self._lock:
+            for key, vector, inserted_at in zip(keys.tolist(), vectors, inserted.tolist()):
+                if self._expired(inserted_at, now):
+                    continue
+                vector = np.array(vector, dtype=np.float32)
+                vector.setflags(write=False)
+                self._entries[key] = (vector, inserted_at)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        logger.info(f"Loaded {len(self._entries)} query embeddings from {self.persist_path}")
+
+
+class ContentEmbeddingStore:
+    """
+    On-disk embedding cache for the indexer, keyed by (model identity, text hash),
+    so unchanged verses are never re-embedded.
+    """
+
+    def __init__(self, path: Optional[str], model_id: str):
+        self.path = Path(path) if path else None
+        self.model_id = model_id
+        self._vectors: Dict[str, np.ndarray] = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._load()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _key(self, text: str) -> str:
+        return f"{self.model_id}:{self.text_hash(text)}"
+
+    def _load(self):
+        if not self.path or not self.path.exists():
+            return
+        try:
+            with np.load(self.path) as data:
+                self._vectors = dict(zip(data["keys"].tolist(), data["vectors"]))
+        except Exception as e:
+            logger.warning(f"Could not load embedding store from {self.path}: {e}")
+
+    def embed(self, texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Returns one vector per text, encoding only the texts not already stored."""
+        keys = [self._key(t) for t in texts]
+        missing_keys = {}  # key -> index of the first text with that key
+        for i, key in enumerate(keys):
+            if key not in self._vectors:
+                missing_keys.setdefault(key, i)
+        self.hits += len(texts) - len(missing_keys)
+        self.misses += len(missing_keys)
+        if missing_keys:
+            vectors = encode([texts[i] for i in missing_keys.values()])
+            for key, vector in zip(missing_keys, vectors):
+                self._vectors[key] = np.asarray(vector, dtype=np.float32)
+            self._dirty = True
+        return np.stack([self._vectors[k] for k in keys])
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        keys = list(self._vectors)
+        with open(self.path, "wb") as f:
+            np.savez(f, keys=np.array(keys), vectors=np.stack([self._vectors[k] for k in keys]))
+        self._dirty = False
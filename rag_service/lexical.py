@@ -0,0 +1,141 @@
+"""
+Lexical retrieval over the Gita corpus.
+
+- VerseReferenceResolver: constant-time lookup for explicit references
+  ("BG 2.47", "verse 2:47", "chapter 3 verse 19"). A bare "2.47" only counts
+  when the query is little more than the reference; elsewhere in a query about
+  scripture it is a candidate to fuse with the other rankings, since "3.5 hours"
+  or "10:30" are far more common than verse numbers.
+- BM25Index: inverted index over EngMeaning, Transliteration and WordMeaning.
+  Longer query terms also match as prefixes, since Sanskrit compounds and
+  inflections ("sthitaprajnasya") rarely appear in their bare form.
+- reciprocal_rank_fusion: merges lexical and dense rankings.
+"""
+import bisect
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+LEXICAL_FIELDS = ("eng_meaning", "transliteration", "word_meaning")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i if in into is it its me my no not of on or our
+she so that the their them then there these they this to was we were what when where which who why will
+with you your how do does did can should would could am been being about
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+_REFERENCE_PATTERNS = (
+    # BG2.47, BG 2.47, gita 2:47, bhagavad gita 2.47, verse 2.47
+    re.compile(r"\b(?:bg|gita|bhagavad\s*gita|bhagwad\s*gita|verse|shloka|sloka)\s*(\d{1,2})\s*[.:]\s*(\d{1,3})\b"),
+    # chapter 3 verse 19, ch. 3 v. 19, chapter 3, shloka 19
+    re.compile(r"\b(?:chapter|ch)\.?\s*(\d{1,2})\s*[,:]?\s*(?:and\s+)?(?:verse|shloka|sloka|v)\.?\s*(\d{1,3})\b"),
+)
+# Bare 2.47 / 2:47: trusted when the query is little more than the reference, a candidate when it is about scripture
+_BARE_REFERENCE = re.compile(r"(?<![\d.])(\d{1,2})\s*[.:]\s*(\d{1,3})(?![\d.])")
+_SCRIPTURE_CONTEXT = re.compile(r"\b(?:verse|shloka|sloka|gita|bg|chapter)\b")
+MAX_WORDS_AROUND_BARE_REFERENCE = 3
+MIN_PREFIX_LENGTH = 5
+MAX_PREFIX_EXPANSIONS = 20
+
+
+def fold(text: str) -> str:
+    """Lowercases and strips diacritics so "sthitaprajña" matches "sthitaprajna"."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [t for t in _TOKEN.findall(fold(text)) if t not in STOPWORDS]
+
+
+class VerseReferenceResolver:
+    def __init__(self, payloads: Iterable[Dict]):
+        self._by_ref: Dict[Tuple[int, int], Dict] = {
+            (int(p["chapter"]), int(p["verse"])): p for p in payloads
+        }
+
+    def resolve(self, query: str) -> List[Dict]:
+        """Returns the verses a query names explicitly, in order of mention."""
+        text = query.casefold()
+        matches = [m for pattern in _REFERENCE_PATTERNS for m in pattern.finditer(text)]
+        if len(_BARE_REFERENCE.sub(" ", text).split()) <= MAX_WORDS_AROUND_BARE_REFERENCE:
+            matches.extend(_BARE_REFERENCE.finditer(text))
+        return self._lookup(matches)
+
+    def resolve_candidates(self, query: str) -> List[Dict]:
+        """
+        Verses a bare "2.47" in a longer query about scripture may name. Only candidates for
+        fusion: "I slept 3.5 hours, what does the gita say?" must not turn into BG 3.5.
+        """
+        text = query.casefold()
+        if not _SCRIPTURE_CONTEXT.search(text):
+            return []
+        return self._lookup(list(_BARE_REFERENCE.finditer(text)))
+
+    def _lookup(self, matches) -> List[Dict]:
+        found, seen = [], set()
+        for match in sorted(matches, key=lambda m: m.start()):
+            ref = (int(match.group(1)), int(match.group(2)))
+            payload = self._by_ref.get(ref)
+            if payload is not None and ref not in seen:
+                seen.add(ref)
+                found.append(payload)
+        return found
+
+
+class BM25Index:
+    def __init__(self, payloads: Sequence[Dict], fields: Sequence[str] = LEXICAL_FIELDS, k1: float = 1.5, b: float = 0.75):
+        self.payloads = list(payloads)
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths: List[int] = []
+        for doc_id, payload in enumerate(self.payloads):
+            tokens = [t for field in fields for t in tokenize(payload.get(field))]
+            self.doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self.postings[term].append((doc_id, tf))
+        n_docs = len(self.payloads)
+        self.avg_doc_length = (sum(self.doc_lengths) / n_docs) if n_docs else 0.0
+        self.idf = {
+            term: math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+        self.vocabulary = sorted(self.postings)
+
+    def expand(self, term: str) -> List[str]:
+        """The term itself plus, for longer terms, indexed words it is a prefix of."""
+        if len(term) < MIN_PREFIX_LENGTH:
+            return [term] if term in self.idf else []
+        start = bisect.bisect_left(self.vocabulary, term)
+        end = bisect.bisect_left(self.vocabulary, term + "\uffff")
+        return self.vocabulary[start:min(end, start + MAX_PREFIX_EXPANSIONS)]
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[Dict, float]]:
+        scores: Dict[int, float] = defaultdict(float)
+        terms = {expanded for term in set(tokenize(query)) for expanded in self.expand(term)}
+        for term in terms:
+            idf = self.idf[term]
+            for doc_id, tf in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_doc_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.payloads[doc_id], score) for doc_id, score in ranked]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Dict]], k: int = 60, key: str = "id") -> List[Dict]:
+    """Fuses ranked payload lists: score(d) = sum over lists of 1 / (k + rank)."""
+    scores: Dict[str, float] = defaultdict(float)
+    first_seen: Dict[str, Dict] = {}
+    for ranking in rankings:
+        for rank, payload in enumerate(ranking, start=1):
+            doc_key = payload[key]
+            scores[doc_key] += 1.0 / (k + rank)
+            first_seen.setdefault(doc_key, payload)
+    return [first_seen[doc_key] for doc_key in sorted(scores, key=scores.get, reverse=True)]
@@ -0,0 +1,217 @@
+"""
+In-process vector index for the Gita corpus.
+
+A bundle is a directory holding:
+    embeddings.npy  - L2-normalised float32 matrix (n_verses x dim), memory-mappable
+    payloads.json   - verse payloads, row-aligned with the matrix
+    meta.json       - embedding model name, dimension, fingerprint and probe embedding
+
+The index can also keep a compressed copy of the vectors for the first pass:
+  int8    - per-dimension symmetric scalar quantisation (4x smaller)
+  binary  - sign bits packed 8 per byte, scanned by Hamming distance (32x smaller)
+optionally truncated to the leading `truncate_dim` dimensions. The best
+`top_k * rescore_multiplier` candidates are then rescored exactly against the
+float32 matrix, which stays memory-mapped so only those rows are paged in.
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from shared.logger import get_logger
+
+logger = get_logger("Local Index")
+
+EMBEDDINGS_FILE = "embeddings.npy"
+PAYLOADS_FILE = "payloads.json"
+META_FILE = "meta.json"
+
+QUANTIZATIONS = ("none", "int8", "binary")
+
+# Fixed sentence used to fingerprint an embedding model
+FINGERPRINT_PROBE = "You have a right to perform your prescribed duties."
+# Two embeddings of the same text count as the same model at or above this cosine similarity. Float
+# noise across CPUs, BLAS builds and the torch/onnx backends stays far above it, int8 backends land
+# around 0.99; a different checkpoint falls well below.
+MODEL_PROBE_MIN_SIMILARITY = 0.98
+
+
+def model_fingerprint(embedding_model) -> str:
+    """
+    Short hash of the model's output on a fixed probe. A label, not an identity: float noise
+    between machines or backends changes it, so models are compared with `probe_similarity`.
+    """
+    probe = np.asarray(embedding_model.encode(FINGERPRINT_PROBE), dtype=np.float32)
+    return hashlib.sha256(np.round(probe, 3).tobytes()).hexdigest()[:16]
+
+
+def model_probe(embedding_model) -> np.ndarray:
+    """The model's embedding of the fixed probe sentence."""
+    return np.asarray(embedding_model.encode(FINGERPRINT_PROBE), dtype=np.float32)
+
+
+def probe_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Cosine similarity of two embeddings of the same text."""
+    return float(normalize_rows(a) @ normalize_rows(b))
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    # argpartition is O(n); only the k winners get sorted
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class LocalGitaIndex:
+    def __init__(
+            self,
+            embeddings: np.ndarray,
+            payloads: List[Dict],
+            meta: Optional[Dict] = None,
+            quantization: str = "none",
+            truncate_dim: Optional[int] = None,
+            rescore_multiplier: int = 4,
+    ):
+        if len(embeddings) != len(payloads):
+            raise ValueError(f"Index is inconsistent: {len(embeddings)} vectors vs {len(payloads)} payloads")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATIONS}")
+        self.embeddings = embeddings
+        self.payloads = payloads
+        self.meta = meta or {}
+        self.quantization = quantization
+        self.truncate_dim = min(truncate_dim, self.dimension) if truncate_dim else self.dimension
+        self.rescore_multiplier = rescore_multiplier
+        self.codes = None
+        self.scales = None
+        if quantization != "none" or self.truncate_dim < self.dimension:
+            self._build_codes()
+
+    def _truncate(self, vectors: np.ndarray) -> np.ndarray:
+        if self.truncate_dim == self.dimension:
+            return vectors
+        return normalize_rows(vectors[..., :self.truncate_dim])
+
+    def _build_codes(self):
+        vectors = self._truncate(np.asarray(self.embeddings, dtype=np.float32))
+        if self.quantization == "int8":
+            self.scales = np.abs(vectors).max(axis=0) / 127.0
+            self.scales[self.scales == 0] = 1.0
+            self.codes = np.clip(np.rint(vectors / self.scales), -127, 127).astype(np.int8)
+        elif self.quantization == "binary":
+            self.codes = np.packbits(vectors > 0, axis=1)
+        else:
+            # Truncation only: a smaller float32 copy
+            self.codes = np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """Bytes held by the first-pass codes vs the full-precision matrix."""
+        codes = 0
+        if self.codes is not None:
+            codes = self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+        return {"full_precision": int(self.embeddings.nbytes), "codes": int(codes)}
+
+    def _coarse_scores(self, query: np.ndarray) -> np.ndarray:
+        """Approximate similarity of every verse to a normalised query, higher is better."""
+        q = self._truncate(query)
+        if self.quantization == "int8":
+            return self.codes @ (q * self.scales)
+        if self.quantization == "binary":
+            q_bits = np.packbits(q > 0)
+            hamming = np.bitwise_count(self.codes ^ q_bits).sum(axis=1, dtype=np.int32)
+            return -hamming.astype(np.float32)
+        return self.codes @ q
+
+    def __len__(self) -> int:
+        return len(self.payloads)
+
+    @property
+    def dimension(self) -> int:
+        return int(self.embeddings.shape[1])
+
+    @classmethod
+    def load(cls, index_dir: Union[str, Path], mmap: bool = True, **options) -> "LocalGitaIndex":
+        index_dir = Path(index_dir)
+        embeddings = np.load(index_dir / EMBEDDINGS_FILE, mmap_mode="r" if mmap else None)
+        with open(index_dir / PAYLOADS_FILE, encoding="utf-8") as f:
+            payloads = json.load(f)
+        with open(index_dir / META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(embeddings, payloads, meta, **options)
+
+    @staticmethod
+    def write(
+            index_dir: Union[str, Path],
+            embeddings: np.ndarray,
+            payloads: List[Dict],
+            model_name: str,
+            model_hash: str = "",
+            model_probe: Optional[np.ndarray] = None,
+    ) -> Path:
+        """Writes a bundle; embeddings are normalised so search is a plain dot product."""
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        embeddings = normalize_rows(embeddings)
+        np.save(index_dir / EMBEDDINGS_FILE, embeddings)
+        with open(index_dir / PAYLOADS_FILE, "w", encoding="utf-8") as f:
+            json.dump(payloads, f, ensure_ascii=False)
+        meta = {
+            "embedding_model": model_name,
+            "model_hash": model_hash,
+            "model_probe": None if model_probe is None else [float(x) for x in np.asarray(model_probe).ravel()],
+            "dimension": int(embeddings.shape[1]),
+            "count": len(payloads),
+        }
+        with open(index_dir / META_FILE, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        return index_dir
+
+    def check_model(self, model_name: str, dimension: int, probe: Optional[np.ndarray] = None,
+                    model_hash: Optional[str] = None):
+        """
+        Raises if the bundle was built with a different embedding model, or different weights under
+        the same name: the bundle's probe embedding must match the loaded model's `probe`.
+        """
+        indexed_model = self.meta.get("embedding_model")
+        if indexed_model and indexed_model != model_name:
+            raise ValueError(f"Index built with '{indexed_model}' but retriever uses '{model_name}'")
+        if self.dimension != dimension:
+            raise ValueError(f"Index dimension {self.dimension} does not match model dimension {dimension}")
+        indexed_probe = self.meta.get("model_probe")
+        if indexed_probe and probe is not None:
+            similarity = probe_similarity(np.asarray(indexed_probe, dtype=np.float32), probe)
+            if similarity < MODEL_PROBE_MIN_SIMILARITY:
+                raise ValueError(f"Index built with different '{model_name}' weights (probe similarity "
+                                 f"{similarity:.4f} < {MODEL_PROBE_MIN_SIMILARITY}); rebuild the bundle with "
+                                 f"`python -m rag_service.client --local-index`")
+            return
+        # Older bundles carry only the exact hash, which float noise alone can change
+        indexed_hash = self.meta.get("model_hash")
+        if indexed_hash and model_hash and indexed_hash != model_hash:
+            logger.warning(f"Index fingerprint {indexed_hash} differs from the loaded model's {model_hash}; "
+                           f"if search quality is off, rebuild the bundle")
+
+    def search_ids(self, query_vector: np.ndarray, top_k: int = 3, rescore: bool = True) -> np.ndarray:
+        query = normalize_rows(query_vector)
+        if self.codes is None:
+            return top_k_indices(self.embeddings @ query, top_k)
+        if not rescore:
+            return top_k_indices(self._coarse_scores(query), top_k)
+        # Sorted so the memmap reads candidate rows in file order; only those pages are touched
+        candidates = np.sort(top_k_indices(self._coarse_scores(query), top_k * self.rescore_multiplier))
+        exact = np.asarray(self.embeddings[candidates], dtype=np.float32) @ query
+        return candidates[top_k_indices(exact, top_k)]
+
+    def search(self, query_vector: np.ndarray, top_k: int = 3) -> List[Dict]:
+        return [self.payloads[i] for i in self.search_ids(query_vector, top_k=top_k)]
@@ -1,27 +1,118 @@
-from typing import Optional
+from shared.startup import StartupState, readiness_response
+
+startup = StartupState("RAG Service")
+
+import asyncio
+import importlib
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 import httpx
 import json
-import re
-import demjson3
 import requests
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 
 # import shared.config
 from shared.schema import RAGServiceQuery, RAGServiceResponse, LLMStructuredResponse, RetrievedShloka
-from shared.config import RAG_SERVICE_PORT, LLM_SERVICE_URL, QDRANT_URL, QDRANT_API_KEY, EMBEDDING_MODEL
+from shared.config import (
+    RAG_SERVICE_PORT, LLM_SERVICE_URL, QDRANT_URL, QDRANT_API_KEY, EMBEDDING_MODEL, STARTUP_RETRY_SECONDS,
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_THRESHOLD, LLM_UPSTREAM_TIMEOUT, LLM_MAX_IN_FLIGHT,
+    LLM_MIN_BUDGET_SECONDS, INDEX_VERSION_REFRESH_SECONDS,
+)
+from shared import deadline
+from shared.deadline import install_deadlines
 from shared.logger import get_logger
-from rag_service.retriever import GitaRetriever
-from rag_service.prompt_builder import build_prompt, format_shloka_for_context
+from shared.http_clients import UpstreamClients
+from shared.instrumentation import install_instrumentation, record_stage, stage
+from shared.metrics import REGISTRY
+from shared.resilience import UpstreamGuard, UpstreamUnavailable, guard_stats
+from shared.sse import SSE_HEADERS, SSE_MEDIA_TYPE, iter_sse, sse_event
+from rag_service.embedding_batcher import BatcherOverloaded
+from rag_service.response_cache import SemanticResponseCache
+from rag_service.structured_output import StructuredOutputParser, parse_structured_output
+from rag_service.prompt_builder import build_prompt, assemble_context, stable_prefix_length
 from fastapi.middleware.cors import CORSMiddleware
 from rag_service.prompt_builder import build_simple_prompt
 
+# Long-lived pooled clients, started in lifespan()
+upstreams = UpstreamClients()
+# While the LLM service is failing or saturated, answers fall back in microseconds instead of queueing
+llm_guard = UpstreamGuard("llm", LLM_MAX_IN_FLIGHT)
+
+response_cache = SemanticResponseCache(
+    max_size=RESPONSE_CACHE_SIZE, ttl_seconds=RESPONSE_CACHE_TTL, threshold=RESPONSE_CACHE_THRESHOLD,
+)
+response_cache_requests = REGISTRY.counter("rag_response_cache_requests_total", "Semantic cache lookups by outcome")
+fallback_responses = REGISTRY.counter(
+    "rag_fallback_responses_total", "Answers filled in from FALLBACK_RESPONSE_DATA, by reason",
+)
+
+# Set by load_retriever() once the model is loaded and a warm-up search succeeded
+shloka_retriever = None
+WARM_UP_QUERY = "How do I find peace when I am anxious about the future?"
+
+
+async def load_retriever():
+    """Loads torch/sentence-transformers and the index off the event loop, then warms up."""
+    global shloka_retriever
+    retriever = None
+    while True:
+        try:
+            if retriever is None:
+                with startup.phase("retriever import"):
+                    retriever_module = await asyncio.to_thread(importlib.import_module, "rag_service.retriever")
+                with startup.phase("retriever init"):
+                    retriever = await asyncio.to_thread(retriever_module.GitaRetriever)
+            with startup.phase("warm-up encode + search"):
+                await retriever.aget_relevant_shloka(WARM_UP_QUERY, top_k=1)
+            shloka_retriever = retriever
+            startup.mark_ready()
+            return
+        except Exception as e:
+            startup.mark_failed(e)
+            logger.info(f"Retrying retriever startup in {STARTUP_RETRY_SECONDS}s...")
+            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+
+
+async def refresh_index_version():
+    """Re-reads the collection's version so a re-index under a running service drops cached answers."""
+    while True:
+        await asyncio.sleep(INDEX_VERSION_REFRESH_SECONDS)
+        if shloka_retriever is None:
+            continue
+        try:
+            await shloka_retriever.arefresh_index_version()
+        except Exception as e:
+            logger.warning(f"Could not refresh the index version: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup.record("app import")
+    upstreams.start("llm", timeout=LLM_UPSTREAM_TIMEOUT)
+    # Not awaited: uvicorn binds only after startup returns, so liveness answers immediately
+    loader = asyncio.create_task(load_retriever())
+    refresher = asyncio.create_task(refresh_index_version()) if INDEX_VERSION_REFRESH_SECONDS > 0 else None
+    yield
+    loader.cancel()
+    if refresher is not None:
+        refresher.cancel()
+    await upstreams.aclose()
+    if shloka_retriever:
+        await shloka_retriever.aclose()
+        shloka_retriever.embedding_cache.save()
+
 app = FastAPI(
     title="DivineGPT - RAG Service",
     description="Provides answers based on Gita context using Retrieval-Augmented Generation.",
+    lifespan=lifespan,
 )
 logger = get_logger("RAG Service")
 logger.info("Starting RAG Service...")
 
+# Deadlines come from the caller (X-Request-Budget-Ms); without one the configured timeouts apply
+install_deadlines(app)
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -30,6 +121,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+install_instrumentation(app, "rag")
 
 
 # # Define a fallback response
@@ -43,14 +135,6 @@ logger.debug(f"QDRANT_URL: {QDRANT_URL}")
 logger.debug(f"QDRANT_API_KEY: {QDRANT_API_KEY[:5]}****")
 logger.debug(f"EMBEDDING_MODEL: {EMBEDDING_MODEL}")
 
-# --- Dependency Injection ---
-try:
-    shloka_retriever = GitaRetriever()
-    logger.info("GitaRetriever initialized successfully.")
-except Exception as e:
-    logger.error(f"Error initializing GitaRetriever: {e}")
-    shloka_retriever = None
-
 # --- Constants ---
 CONVERSATIONAL_KEYWORDS = ["hello", "hi", "hey", "morning", "afternoon", "evening", "how are you", "thanks", "thank you", "ok", "bye", "good", "great", "cool", "yo", "bro", "sister", "friend", "dude", "mate", "pal", "buddy", "fam", "squad", "team", "gang", "crew", "homie", "chill", "peace", "vibe", "lit", "fire", "bless", "blessed", "grateful", "appreciate", "respect", "love", "heart", "soul"]
 # Update FALLBACK_RESPONSE to include new_summary
@@ -87,29 +171,78 @@ def is_conversational(query: str) -> bool:
     # If it's just a greeting or very short, it's conversational
     return any(keyword in query_lower for keyword in GREETING_KEYWORDS) or len(query_lower.split()) < 3
 
+async def stream_llm_service(prompt: str) -> AsyncIterator[str]:
+    """Yields LLM output chunks from the LLM service's SSE endpoint; raises if the stream fails."""
+    if deadline.skip_stage("llm", LLM_MIN_BUDGET_SECONDS):
+        raise RuntimeError("not enough of the request's time budget left for the LLM")
+    async with llm_guard.call(), upstreams["llm"].stream(
+        "POST",
+        f"{LLM_SERVICE_URL}/generate/stream",
+        json={"prompt": prompt, "prefix_chars": stable_prefix_length(prompt)},
+    ) as response:
+        response.raise_for_status()
+        async for event, data in iter_sse(response):
+            if event == "token":
+                yield data["text"]
+            elif event == "error":
+                raise RuntimeError(data["detail"])
+            elif event == "done" and data.get("usage"):
+                logger.info(f"LLM token usage: {data['usage']}")
+
 async def call_llm_service(prompt: str) -> str:
     """Calls the LLM service asynchronously."""
-    async with httpx.AsyncClient(timeout=180) as client:
-        try:
-            logger.debug(f"Sending prompt to LLM: {prompt[:300]}...") # Log start of prompt
+    client = upstreams["llm"]
+    # Too little time left for an answer: fall back now rather than time out later
+    if deadline.skip_stage("llm", LLM_MIN_BUDGET_SECONDS):
+        return "Error: not enough of the request's time budget left for the LLM."
+    try:
+        logger.debug(f"Sending prompt to LLM: {prompt[:300]}...") # Log start of prompt
+        async with llm_guard.call():
             response = await client.post(
                 f"{LLM_SERVICE_URL}/generate",
-                json={"prompt": prompt},
+                json={"prompt": prompt, "prefix_chars": stable_prefix_length(prompt)},
             )
             response.raise_for_status()
             llm_data = response.json()
-            llm_output = llm_data.get("response", "Error: LLM service returned no response")
-            logger.debug(f"Received response from LLM: {llm_output[:300]}...") # Log start of response
-            return llm_output
-        except httpx.RequestError as e:
-            logger.error(f"Error calling LLM service: {e}")
-            return "Error: Could not connect to LLM service."
-        except httpx.HTTPStatusError as e:
-            logger.error(f"LLM service returned error {e.response.status_code}: {e.response.text}")
-            return f"Error: LLM service failed ({e.response.status_code})."
-        except Exception as e:
-            logger.error(f"Unexpected error during LLM call: {e}")
-            return "Error: Unexpected error processing LLM response."
+        llm_output = llm_data.get("response", "Error: LLM service returned no response")
+        if llm_data.get("usage"):
+            logger.info(f"LLM token usage: {llm_data['usage']}")
+        logger.debug(f"Received response from LLM: {llm_output[:300]}...") # Log start of response
+        return llm_output
+    except UpstreamUnavailable as e:
+        logger.warning(f"LLM call failed fast: {e}")
+        return f"Error: LLM service unavailable ({e.reason})."
+    except httpx.RequestError as e:
+        logger.error(f"Error calling LLM service: {e}")
+        return "Error: Could not connect to LLM service."
+    except httpx.HTTPStatusError as e:
+        logger.error(f"LLM service returned error {e.response.status_code}: {e.response.text}")
+        return f"Error: LLM service failed ({e.response.status_code})."
+    except Exception as e:
+        logger.error(f"Unexpected error during LLM call: {e}")
+        return "Error: Unexpected error processing LLM response."
+
+def structured_response(parsed: dict, previous_summary: Optional[str] = None) -> LLMStructuredResponse:
+    """Builds the response model from parsed fields, filling anything missing from the fallback."""
+    fallback_data = FALLBACK_RESPONSE_DATA.copy()
+    fallback_data["new_summary"] = previous_summary or "" # Use previous summary as fallback
+    # Ensure all required fields are present, including new_summary
+    if all(k in parsed for k in LLMStructuredResponse.model_fields.keys()):
+        logger.info("Successfully parsed structured response from LLM.")
+    else:
+        fallback_responses.inc(reason="missing_fields")
+        logger.warning(f"Parsed JSON missing required keys. Found: {parsed.keys()}. Required: {LLMStructuredResponse.model_fields.keys()}")
+    # Try to fill missing keys with fallback, keeping existing ones
+    merged_data = fallback_data.copy()
+    for key in LLMStructuredResponse.model_fields:
+        value = parsed.get(key)
+        if value is not None:
+            merged_data[key] = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    # Ensure new_summary is present
+    if not merged_data["new_summary"]:
+        merged_data["new_summary"] = previous_summary or ""
+    return LLMStructuredResponse(**merged_data)
+
 
 def parse_llm_response(llm_output_str: str, previous_summary: Optional[str] = None) -> LLMStructuredResponse:
     """Safely parses JSON from LLM output, ensuring LLMStructuredResponse format."""
@@ -117,41 +250,20 @@ def parse_llm_response(llm_output_str: str, previous_summary: Optional[str] = No
     fallback_data["new_summary"] = previous_summary or "" # Use previous summary as fallback
 
     if not llm_output_str or llm_output_str.startswith("Error"):
+        fallback_responses.inc(reason="llm_error")
         logger.warning(f"LLM returned an error or empty string: {llm_output_str}")
         return LLMStructuredResponse(**fallback_data)
 
-    try:
-        # Find the JSON part (more robustly)
-        match = re.search(r'\{.*\}', llm_output_str, re.DOTALL)
-        if match:
-            json_str = match.group(0)
-            parsed = json.loads(json_str)
-            # Ensure all required fields are present, including new_summary
-            if all(k in parsed for k in LLMStructuredResponse.model_fields.keys()):
-                 logger.info("Successfully parsed structured response from LLM.")
-                 return LLMStructuredResponse(**parsed)
-            else:
-                 logger.warning(f"Parsed JSON missing required keys. Found: {parsed.keys()}. Required: {LLMStructuredResponse.model_fields.keys()}")
-                 # Try to fill missing keys with fallback, keeping existing ones
-                 merged_data = fallback_data.copy()
-                 merged_data.update(parsed) # Overwrite defaults with parsed values
-                 # Ensure new_summary is present
-                 if "new_summary" not in merged_data or not merged_data["new_summary"]:
-                     merged_data["new_summary"] = previous_summary or ""
-                 return LLMStructuredResponse(**merged_data)
-
-        else:
-            logger.warning(f"Could not find JSON block in LLM output: {llm_output_str[:200]}...")
-            # If no JSON, assume it's a simple response (e.g., from simple_prompt)
-            # Use fallback structure but fill the 'response' field
-            fallback_data["response"] = llm_output_str.strip()
-            return LLMStructuredResponse(**fallback_data)
-
-    except Exception as e:
-        logger.error(f"JSON parsing failed: {e}. LLM output: {llm_output_str[:200]}...")
-        # Use fallback but try to keep the raw response
+    # Tolerates fences, trailing/missing commas and truncation in a single pass
+    parsed, found = parse_structured_output(llm_output_str)
+    if not found:
+        fallback_responses.inc(reason="no_json")
+        logger.warning(f"Could not find JSON block in LLM output: {llm_output_str[:200]}...")
+        # If no JSON, assume it's a simple response (e.g., from simple_prompt)
+        # Use fallback structure but fill the 'response' field
         fallback_data["response"] = llm_output_str.strip()
         return LLMStructuredResponse(**fallback_data)
+    return structured_response(parsed, previous_summary)
 
 
 
@@ -198,52 +310,60 @@ def parse_llm_response(llm_output_str: str, previous_summary: Optional[str] = No
 #     return all(key in data for key in ["shloka", "meaning", "shloka_summary", "response", "reflection", "emotion"])
 
 
-@app.post("/ask", response_model=RAGServiceResponse)
-async def ask_question(user_query: RAGServiceQuery):
+async def prepare_answer(user_query: RAGServiceQuery) -> dict:
     """
-    Receives query, history, and previous summary. Determines if RAG is needed,
-    calls LLM, generates new summary (if applicable), and returns structured response.
+    Everything before the LLM call: small-talk detection, the semantic cache,
+    retrieval and prompt assembly. Shared by /ask and /ask/stream.
     """
     logger.info(f"Received query: {user_query.query}")
     logger.info(f"History Length: {len(user_query.history or [])}")
     logger.info(f"Prev. Summary: {'Yes' if user_query.previous_summary else 'No'}")
 
-    if is_conversational(user_query.query):
+    # A bare verse reference ("BG 2.47") is short, but it is not small talk
+    with stage("conversational_check"):
+        names_verse = bool(shloka_retriever and shloka_retriever.resolve_reference(user_query.query))
+        conversational = is_conversational(user_query.query) and not names_verse
+    if conversational:
         logger.info("Conversational query detected, skipping RAG.")
-        simple_prompt = build_simple_prompt(
-            user_query=user_query.query,
-            user_type=user_query.user_type,
-            history=user_query.history,
-            previous_summary=user_query.previous_summary # Pass summary for context
-        )
-        llm_response_str = await call_llm_service(simple_prompt)
-
-        # For conversational, use fallback structure, fill response, keep previous summary
-        conversational_response_data = FALLBACK_RESPONSE_DATA.copy()
-        conversational_response_data["response"] = llm_response_str.strip()
-        conversational_response_data["new_summary"] = user_query.previous_summary or "" # Keep old summary
-
-        return RAGServiceResponse(
-            user_query=user_query.query,
-            retrieved_shlokas=[],
-            llm_response=LLMStructuredResponse(**conversational_response_data),
-            context="N/A (Conversational)",
-            prompt="N/A (Conversational)"
-        )
+        with stage("prompt"):
+            simple_prompt = build_simple_prompt(
+                user_query=user_query.query,
+                user_type=user_query.user_type,
+                history=user_query.history,
+                previous_summary=user_query.previous_summary # Pass summary for context
+            )
+        return {"conversational": True, "prompt": simple_prompt, "shlokas": [], "cached": None}
 
     if not shloka_retriever:
-         raise HTTPException(status_code=503, detail="Retriever service is not available.")
+         raise HTTPException(status_code=503, detail="Retriever service is not available yet, please retry.")
 
+    # Only first-turn questions are answered from the semantic cache: later turns depend on the conversation
+    query_vector = None
+    cacheable = response_cache.enabled and not names_verse and not user_query.history and not user_query.previous_summary
     logger.info("Performing RAG.")
     try:
-        retrieved_payloads = shloka_retriever.get_relevant_shloka(user_query.query, top_k=1)
+        if cacheable:
+            query_vector = await shloka_retriever.aencode_query(user_query.query)
+            with stage("cache_lookup"):
+                cached = response_cache.lookup(query_vector, user_query.user_type, shloka_retriever.index_version)
+            response_cache_requests.inc(outcome="miss" if cached is None else "hit")
+            if cached is not None:
+                return {"cached": RAGServiceResponse(user_query=user_query.query, **cached)}
+        retrieved_payloads = await shloka_retriever.aget_relevant_shloka(
+            user_query.query, top_k=1, query_vector=query_vector)
+    except BatcherOverloaded as e:
+        logger.warning(f"Shedding query: {e}")
+        raise HTTPException(status_code=503, detail="Retriever is overloaded, please retry.")
     except Exception as e:
         logger.error(f"Error retrieving shlokas: {e}")
         raise HTTPException(status_code=500, detail="Error retrieving shlokas.")
 
-    if not retrieved_payloads:
-        logger.warning("No relevant shlokas found.")
-        context_string = "No relevant shlokas found."
+    with stage("prompt"):
+        if not retrieved_payloads:
+            logger.warning("No relevant shlokas found.")
+            context_string = "No relevant shlokas found."
+        else:
+            context_string = assemble_context(retrieved_payloads)
         final_prompt = build_prompt(
             context=context_string,
             user_query=user_query.query,
@@ -251,62 +371,151 @@ async def ask_question(user_query: RAGServiceQuery):
             history=user_query.history,
             previous_summary=user_query.previous_summary
         )
-        # return RAGServiceResponse(
-        #     user_query=user_query.query,
-        #     retrieved_shlokas=[],
-        #     llm_response=LLMStructuredResponse(
-        #         shloka="",
-        #         meaning="",
-        #         shloka_summary="No shloka found for this query.",
-        #         response="Please try asking differently",
-        #         reflection="",
-        #         emotion="neutral",
-        #     )
-        # )
-    else:
-        context_string = "\n\n---\n\n".join([format_shloka_for_context(p) for p in retrieved_payloads])
-        final_prompt = build_prompt(context=context_string, user_query=user_query.query, user_type=user_query.user_type)
-
-    # response = requests.post(
-    #     f"{LLM_SERVICE_URL}/generate",
-    #     json={"prompt": final_prompt},
-    #     timeout=180,
-    # ).json()
-    
-    llm_response_str = await call_llm_service(final_prompt)
-    # Parse the response, passing previous summary for fallback use
-    parsed_llm_response = parse_llm_response(llm_response_str, user_query.previous_summary)
 
     # Ensure retrieved_payloads is a list of RetrievedShloka models if needed downstream
     # This might require converting dicts if retriever returns dicts
     validated_shlokas = [RetrievedShloka(**p) if isinstance(p, dict) else p for p in retrieved_payloads]
+    return {
+        "conversational": False,
+        "prompt": final_prompt,
+        "context": context_string,
+        "shlokas": validated_shlokas,
+        "query_vector": query_vector,
+        "cached": None,
+    }
+
+
+def build_answer(
+        user_query: RAGServiceQuery,
+        prepared: dict,
+        llm_response_str: str,
+        parsed_fields: Optional[dict] = None,
+        failed: bool = False,
+) -> RAGServiceResponse:
+    """
+    Turns the raw LLM output into the structured response and caches it when it is a first-turn answer.
+    `failed` marks output cut off by a broken stream: it is returned, flagged degraded, but never cached.
+    """
+    llm_failed = failed or llm_response_str.startswith("Error")
+    if prepared["conversational"]:
+        # For conversational, use fallback structure, fill response, keep previous summary
+        conversational_response_data = FALLBACK_RESPONSE_DATA.copy()
+        conversational_response_data["response"] = llm_response_str.strip()
+        conversational_response_data["new_summary"] = user_query.previous_summary or "" # Keep old summary
+
+        return RAGServiceResponse(
+            user_query=user_query.query,
+            retrieved_shlokas=[],
+            llm_response=LLMStructuredResponse(**conversational_response_data),
+            context="N/A (Conversational)",
+            prompt="N/A (Conversational)",
+            degraded=llm_failed,
+        )
 
+    # Parse the response, passing previous summary for fallback use; a streamed answer was parsed as it arrived
+    with stage("parse"):
+        if parsed_fields:
+            parsed_llm_response = structured_response(parsed_fields, user_query.previous_summary)
+        else:
+            parsed_llm_response = parse_llm_response(llm_response_str, user_query.previous_summary)
+
+    # Fallback answers are not worth repeating to the next person who asks
+    degraded = llm_failed or parsed_llm_response.response == FALLBACK_RESPONSE_DATA["response"]
+    if prepared["query_vector"] is not None and not degraded:
+        response_cache.store(prepared["query_vector"], user_query.user_type, shloka_retriever.index_version, {
+            "retrieved_shlokas": prepared["shlokas"],
+            "llm_response": parsed_llm_response,
+            "context": prepared["context"],
+            "prompt": prepared["prompt"],
+        })
 
     return RAGServiceResponse(
         user_query=user_query.query,
-        retrieved_shlokas=validated_shlokas,
+        retrieved_shlokas=prepared["shlokas"],
         llm_response=parsed_llm_response, # This now includes new_summary
-        context=context_string,
-        prompt=final_prompt
+        context=prepared["context"],
+        prompt=prepared["prompt"],
+        degraded=degraded,
     )
 
 
-    # llm_response = response.get("response", "Error: LLM service returned no response")
-    # response = parse_llm_response(llm_response)
-    # llm_response=response.get("response", llm_response)
+@app.post("/ask", response_model=RAGServiceResponse)
+async def ask_question(user_query: RAGServiceQuery):
+    """
+    Receives query, history, and previous summary. Determines if RAG is needed,
+    calls LLM, generates new summary (if applicable), and returns structured response.
+    """
+    prepared = await prepare_answer(user_query)
+    if prepared["cached"] is not None:
+        return prepared["cached"]
 
-    # return RAGServiceResponse(
-    #     user_query=user_query.query,
-    #     retrieved_shlokas=retrieved_payloads,
-    #     llm_response=LLMStructuredResponse(**response),
-    # )
+    # response = requests.post(
+    #     f"{LLM_SERVICE_URL}/generate",
+    #     json={"prompt": final_prompt},
+    #     timeout=180,
+    # ).json()
 
-    return RAGServiceResponse(
-        user_query=user_query.query,
-        retrieved_shlokas=retrieved_payloads,
-        context=context_string,
-        prompt=final_prompt
-    )
+    with stage("llm"):
+        llm_response_str = await call_llm_service(prepared["prompt"])
+    return build_answer(user_query, prepared, llm_response_str)
+
+
+@app.post("/ask/stream")
+async def ask_question_stream(user_query: RAGServiceQuery):
+    """
+    Same as /ask, streamed as Server-Sent Events:
+      shlokas - the retrieved verses, as soon as retrieval finishes
+      token   - raw LLM output chunks (conversational replies, which are plain text)
+      delta   - {"field", "text"}: new text of the JSON string field being generated
+      field   - {"field", "value"}: a field of the structured answer, once complete
+      error   - {"detail"}: the LLM stream broke off; the final answer that follows is degraded
+      final   - the complete RAGServiceResponse
+    Failures before streaming starts are plain HTTP errors, as with /ask.
+    """
+    prepared = await prepare_answer(user_query)
+
+    async def events():
+        if prepared["cached"] is not None:
+            cached = prepared["cached"]
+            yield sse_event("shlokas", [s.model_dump() for s in cached.retrieved_shlokas])
+            yield sse_event("final", cached.model_dump())
+            return
+        yield sse_event("shlokas", [s.model_dump() for s in prepared["shlokas"]])
+        parser = None if prepared["conversational"] else StructuredOutputParser()
+        streamed = 0  # characters of the in-progress field already sent as deltas
+        started = time.perf_counter()
+        chunks = []
+        failed = False
+        try:
+            async for text in stream_llm_service(prepared["prompt"]):
+                if not chunks:
+                    record_stage("llm_first_token", time.perf_counter() - started)
+                    logger.info(f"Time to first token: {time.perf_counter() - started:.2f}s")
+                chunks.append(text)
+                if parser is None:
+                    yield sse_event("token", {"text": text})
+                    continue
+                for name, value in parser.feed(text):
+                    if isinstance(value, str) and len(value) > streamed:
+                        yield sse_event("delta", {"field": name, "text": value[streamed:]})
+                    streamed = 0
+                    yield sse_event("field", {"field": name, "value": value})
+                name, delta = parser.take_delta()
+                if delta:
+                    yield sse_event("delta", {"field": name, "text": delta})
+                    streamed += len(delta)
+            llm_response_str = "".join(chunks)
+        except Exception as e:
+            logger.error(f"LLM stream failed after {len(chunks)} chunks: {e}")
+            failed = True
+            llm_response_str = "".join(chunks) if chunks else f"Error: LLM stream failed ({e})."
+            yield sse_event("error", {"detail": f"LLM stream failed after {len(chunks)} chunks: {e}"})
+        record_stage("llm", time.perf_counter() - started)
+        parsed_fields = parser.finish() if parser is not None and parser.started else None
+        answer = build_answer(user_query, prepared, llm_response_str, parsed_fields, failed=failed)
+        yield sse_event("final", answer.model_dump())
+
+    return StreamingResponse(events(), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
 
 
 @app.get("/")
@@ -315,14 +524,33 @@ async def read_root():
 
 @app.get("/status")
 async def get_status():
-    retriever_status = "initialized" if shloka_retriever else "initialization_failed"
+    if shloka_retriever:
+        retriever_status = "initialized"
+    else:
+        retriever_status = "initialization_failed" if startup.error else "loading"
     return {
         "service": "RAG Service",
         "port": RAG_SERVICE_PORT,
         "status": "running",
-        "retriever_status": retriever_status
+        "retriever_status": retriever_status,
+        "retriever_backend": shloka_retriever.backend if shloka_retriever else None,
+        "local_index": {
+            "quantization": shloka_retriever.local_index.quantization,
+            "memory_bytes": shloka_retriever.local_index.memory_bytes(),
+        } if shloka_retriever and shloka_retriever.local_index is not None else None,
+        "embedding_cache": shloka_retriever.embedding_cache.stats() if shloka_retriever else None,
+        "embedding_batcher": shloka_retriever.batcher.stats() if shloka_retriever else None,
+        "response_cache": response_cache.stats(),
+        "startup": startup.as_dict(),
+        "upstream_pools": upstreams.stats(),
+        "resilience": guard_stats({"llm": llm_guard}),
         }
 
 @app.get("/health")
+@app.get("/live")
 async def health_check():
     return {"status": "ok", "service": "RAG Service", "port": RAG_SERVICE_PORT}
+
+@app.get("/ready")
+async def readiness_check():
+    return readiness_response(startup, RAG_SERVICE_PORT)
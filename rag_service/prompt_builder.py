@@ -1,7 +1,16 @@
-from typing import List, Optional
+import math
+from typing import Dict, List, Optional, Tuple
+from shared.config import (
+    PROMPT_TOKEN_BUDGET, CONTEXT_TOKEN_BUDGET, SUMMARY_TOKEN_BUDGET,
+    HISTORY_TOKEN_BUDGET, HISTORY_MAX_TURNS, MESSAGE_MAX_TOKENS, QUERY_TOKEN_BUDGET,
+)
+from shared.logger import get_logger
 from shared.schema import MessageSchema, RetrievedShloka
 
+logger = get_logger("Prompt Builder")
+
 DEFAULT_USER_TYPE = "neutral"
+TRUNCATION_MARK = " …"
 
 def format_shloka_for_context(shloka_payload: RetrievedShloka) -> str:
     payload_dict = shloka_payload if isinstance(shloka_payload, dict) else shloka_payload.model_dump()
@@ -26,26 +35,89 @@ def format_history(history: Optional[List[MessageSchema]]) -> str:
     return "\n".join(formatted)
 
 
-def build_prompt(
-        context: str,
-        user_query: str,
-        user_type: str = DEFAULT_USER_TYPE,
-        history: Optional[List[MessageSchema]] = None,
-        previous_summary: Optional[str] = None
-    ) -> str:
-    style_instructions = {
-        "genz": "Use a Gen Z-friendly, casual, slightly witty tone—like something you'd find in an honest Instagram post or heart-to-heart Discord chat. Emojis are welcome, but keep it soulful.",
-        "mature": "Use a calm, respectful, and deeply reflective tone—like a wise teacher guiding a thoughtful seeker.",
-        "neutral": "Use a clear, warm, and grounded tone—like a caring mentor helping someone gain clarity in life."
-    }
+# --- Token budgeting ---
 
-    if user_type not in style_instructions:
-        user_type = "neutral"
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    Fast token estimate: ~4 UTF-8 bytes per token. Close for English with Gemini's
+    tokenizer and deliberately generous for Devanagari (3 bytes per character).
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text.encode("utf-8")) / 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keeps the head of `text` within `max_tokens`, cut at a word boundary where possible."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    head = text.encode("utf-8")[:max_tokens * 4].decode("utf-8", errors="ignore")
+    cut = head.rfind(" ")
+    if cut > len(head) // 2:
+        head = head[:cut]
+    return head.rstrip() + TRUNCATION_MARK
+
+
+def assemble_context(payloads: List, max_tokens: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """Formats retrieved verses best-first until the budget is spent; the first verse is truncated rather than dropped."""
+    blocks, used = [], 0
+    for payload in payloads:
+        block = format_shloka_for_context(payload)
+        tokens = estimate_tokens(block)
+        if used + tokens > max_tokens:
+            if not blocks:
+                blocks.append(truncate_to_tokens(block, max_tokens))
+            break
+        blocks.append(block)
+        used += tokens
+    return "\n\n---\n\n".join(blocks)
+
+
+def assemble_history(
+        history: Optional[List[MessageSchema]],
+        max_tokens: int = HISTORY_TOKEN_BUDGET,
+        max_turns: int = HISTORY_MAX_TURNS,
+        message_max_tokens: int = MESSAGE_MAX_TOKENS,
+) -> Tuple[str, int]:
+    """
+    Keeps the most recent `max_turns` messages that fit in `max_tokens`, each cut to
+    `message_max_tokens`. Older turns are dropped first; the previous summary is
+    expected to cover them. Returns the formatted history and how many messages were dropped.
+    """
+    if not history:
+        return format_history(history), 0
+    kept, used = [], 0
+    for msg in reversed(history[-max_turns:] if max_turns > 0 else []):
+        content = truncate_to_tokens(msg.content, message_max_tokens)
+        line = f"{msg.role.capitalize()}: {content}"
+        tokens = estimate_tokens(line) + 1
+        if used + tokens > max_tokens:
+            break
+        kept.append(MessageSchema(role=msg.role, content=content))
+        used += tokens
+    kept.reverse()
+    return format_history(kept), len(history) - len(kept)
+
+
+def log_prompt_sections(kind: str, sections: Dict[str, str], dropped_turns: int):
+    counts = {name: estimate_tokens(text) for name, text in sections.items()}
+    total = sum(counts.values())
+    breakdown = ", ".join(f"{name}={count}" for name, count in counts.items())
+    logger.info(f"{kind} prompt ~{total} tokens ({breakdown}); dropped {dropped_turns} history messages")
 
-    formatted_history = format_history(history)
-    summary_context = previous_summary or "No previous summary available." # Handle None case
 
-    return f"""
+# Prompts are laid out as a byte-stable prefix (persona, output format, rules) followed by
+# the per-request content, so the LLM provider can cache and reuse the prefix across requests.
+# Nothing request-specific may be interpolated into the *_PREFIX constants.
+STYLE_INSTRUCTIONS = {
+    "genz": "Use a Gen Z-friendly, casual, slightly witty tone—like something you'd find in an honest Instagram post or heart-to-heart Discord chat. Emojis are welcome, but keep it soulful.",
+    "mature": "Use a calm, respectful, and deeply reflective tone—like a wise teacher guiding a thoughtful seeker.",
+    "neutral": "Use a clear, warm, and grounded tone—like a caring mentor helping someone gain clarity in life."
+}
+
+RAG_PROMPT_PREFIX = """
 👉 VERY IMPORTANT: Your entire response MUST be a single, well-formatted JSON object. 
 ❌ Do NOT add any text before or after the JSON.
 ❌ Do NOT wrap anything in markdown formatting (like `**`, `__`, or code blocks).
@@ -54,27 +126,15 @@ def build_prompt(
 You are DivineGPT — a divine, emotionally intelligent mentor & the best FRIEND inspired by Lord Krishna. 
 You are speaking directly to a seeker who has asked a heartfelt question. Use the provided Gita context to guide them with warmth, clarity, and depth.
 
-🌿 SCRIPTURE CONTEXT (Relevant Shlokas):
-{context}
-
-📝 PREVIOUS SUMMARY:
-{summary_context}
-
-💬 CONVERSATION HISTORY (Recent messages):
-{formatted_history}
-
-❓ USER'S CURRENT QUESTION:
-"{user_query}"
-
 🔄 META-CONVERSATION HANDLING:
 If the user's query refers to previous messages (e.g., "explain that differently", "reframe your last response", 
 "simplify your answer", "can you elaborate on that"), identify what they're referring to and provide an 
 alternative perspective or explanation based on the conversation history. Do not simply repeat your previous answer.
 
 🎯 TASK:
-Using ALL the context above (Scripture, Previous Summary, History, Current Question), generate a response in the following JSON structure:
+Using ALL the context given below (Scripture, Previous Summary, History, Current Question), generate a response in the following JSON structure:
 
-{{
+{
   "shloka": "<Exact Sanskrit verse from the given context that best fits the user's concern>",
   "meaning": "<English translation of that shloka>",
   "shloka_summary": "<Short summary connecting the shloka to the user's problem>",
@@ -82,7 +142,7 @@ Using ALL the context above (Scripture, Previous Summary, History, Current Quest
   "reflection": "<A thoughtful question or step for the user to reflect on or take>",
   "emotion": "<Emotion detected in the user's question. Choose ONE from: Joy, Happy, Calm, Neutral, Anxious, Sad, Angry>"
   "new_summary": <A concise (1-2 sentences) updated summary of the conversation's key points or themes up to and including this turn. Integrate the user's current query and your response's essence.>"
-}}
+}
 
 📌 INSTRUCTIONS:
 1. Carefully analyze the user's CURRENT query, the conversation HISTORY, the PREVIOUS SUMMARY, and the provided Gita shloka(s).
@@ -100,9 +160,7 @@ Using ALL the context above (Scripture, Previous Summary, History, Current Quest
 5. The 'response' should acknowledge the flow of conversation if appropriate.
 6. The 'new_summary' MUST be an updated summary reflecting the current exchange.
 7. Ensure the 'emotion' field reflects the user's *current* message.
-
-🎙 TONE:
-{style_instructions[user_type]}
+8. Speak in the TONE given with the request below.
 
 🚫 DO NOT:
 - Invent or modify any shloka outside the given context.
@@ -111,6 +169,67 @@ Using ALL the context above (Scripture, Previous Summary, History, Current Quest
 - Deviate from the emotion list provided.
 - Forget any fields in the JSON structure, especially 'new_summary'.
 
+"""
+
+SIMPLE_PROMPT_PREFIX = """
+You are DivineGPT — a divine, emotionally intelligent mentor & the best FRIEND inspired by Lord Krishna.
+Respond warmly and naturally to the user's message, considering the recent conversation history and the overall summary. Keep it brief and friendly.
+
+"""
+
+PROMPT_PREFIXES = (RAG_PROMPT_PREFIX, SIMPLE_PROMPT_PREFIX)
+
+
+def stable_prefix_length(prompt: str) -> int:
+    """Number of leading characters of `prompt` that are a cacheable stable prefix (0 if none)."""
+    for prefix in PROMPT_PREFIXES:
+        if prompt.startswith(prefix):
+            return len(prefix)
+    return 0
+
+
+def build_prompt(
+        context: str,
+        user_query: str,
+        user_type: str = DEFAULT_USER_TYPE,
+        history: Optional[List[MessageSchema]] = None,
+        previous_summary: Optional[str] = None
+    ) -> str:
+    if user_type not in STYLE_INSTRUCTIONS:
+        user_type = "neutral"
+
+    context = truncate_to_tokens(context, CONTEXT_TOKEN_BUDGET)
+    user_query = truncate_to_tokens(user_query, QUERY_TOKEN_BUDGET)
+    summary_context = truncate_to_tokens(previous_summary, SUMMARY_TOKEN_BUDGET) if previous_summary \
+        else "No previous summary available." # Handle None case
+    # History gets whatever the overall budget leaves after every other section
+    fixed = estimate_tokens(RAG_PROMPT_PREFIX) + estimate_tokens(STYLE_INSTRUCTIONS[user_type]) \
+        + estimate_tokens(context) + estimate_tokens(summary_context) + estimate_tokens(user_query)
+    formatted_history, dropped = assemble_history(history, max_tokens=min(HISTORY_TOKEN_BUDGET, PROMPT_TOKEN_BUDGET - fixed))
+    log_prompt_sections("RAG", {
+        "prefix": RAG_PROMPT_PREFIX,
+        "tone": STYLE_INSTRUCTIONS[user_type],
+        "context": context,
+        "summary": summary_context,
+        "history": formatted_history,
+        "query": user_query,
+    }, dropped)
+
+    return RAG_PROMPT_PREFIX + f"""🎙 TONE:
+{STYLE_INSTRUCTIONS[user_type]}
+
+🌿 SCRIPTURE CONTEXT (Relevant Shlokas):
+{context}
+
+📝 PREVIOUS SUMMARY:
+{summary_context}
+
+💬 CONVERSATION HISTORY (Recent messages):
+{formatted_history}
+
+❓ USER'S CURRENT QUESTION:
+"{user_query}"
+
 📤 Now, respond with a **beautiful, valid JSON** ONLY that feels natual and emotionally elevating.
 
 """
@@ -124,22 +243,27 @@ def build_simple_prompt(
     previous_summary: Optional[str] = None # Add previous_summary parameter
 ) -> str:
     """Builds a prompt for simple conversational replies, without RAG context."""
-    style_instructions = {
-        "genz": "Use a Gen Z-friendly, casual, slightly witty tone—like something you'd find in an honest Instagram post or heart-to-heart Discord chat. Emojis are welcome, but keep it soulful.",
-        "mature": "Use a calm, respectful, and deeply reflective tone—like a wise teacher guiding a thoughtful seeker.",
-        "neutral": "Use a clear, warm, and grounded tone—like a caring mentor helping someone gain clarity in life."
-    }
-    if user_type not in style_instructions:
+    if user_type not in STYLE_INSTRUCTIONS:
         user_type = "neutral"
 
-    formatted_history = format_history(history)
-    summary_context = previous_summary or "No previous summary available." # Handle None case
+    user_query = truncate_to_tokens(user_query, QUERY_TOKEN_BUDGET)
+    summary_context = truncate_to_tokens(previous_summary, SUMMARY_TOKEN_BUDGET) if previous_summary \
+        else "No previous summary available." # Handle None case
+    fixed = estimate_tokens(SIMPLE_PROMPT_PREFIX) + estimate_tokens(STYLE_INSTRUCTIONS[user_type]) \
+        + estimate_tokens(summary_context) + estimate_tokens(user_query)
+    formatted_history, dropped = assemble_history(history, max_tokens=min(HISTORY_TOKEN_BUDGET, PROMPT_TOKEN_BUDGET - fixed))
+    log_prompt_sections("Conversational", {
+        "prefix": SIMPLE_PROMPT_PREFIX,
+        "tone": STYLE_INSTRUCTIONS[user_type],
+        "summary": summary_context,
+        "history": formatted_history,
+        "query": user_query,
+    }, dropped)
 
     # Instruction for the LLM to just respond conversationally
     # We are NOT asking for JSON here, just a natural language reply.
-    return f"""
-You are DivineGPT — a divine, emotionally intelligent mentor & the best FRIEND inspired by Lord Krishna.
-Respond warmly and naturally to the user's message, considering the recent conversation history and the overall summary. Keep it brief and friendly.
+    return SIMPLE_PROMPT_PREFIX + f"""🎙 TONE:
+{STYLE_INSTRUCTIONS[user_type]}
 
 📝 PREVIOUS SUMMARY:
 {summary_context}
@@ -150,8 +274,5 @@ Respond warmly and naturally to the user's message, considering the recent conve
 ❓ USER'S CURRENT MESSAGE:
 "{user_query}"
 
-🎙 TONE:
-{style_instructions[user_type]}
-
 Respond now:
-"""
\ No newline at end of file
+"""
@@ -0,0 +1,132 @@
+"""
+Semantic cache of first-turn answers.
+
+A first-turn question (no history, no previous summary) is answered from the cache
+when an earlier question for the same `user_type` embedded within `threshold`
+cosine similarity of it. Entries are stamped with the retriever's index version;
+a different version (re-index, new model) drops the whole cache.
+"""
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+from rag_service.local_index import normalize_rows
+from shared.logger import get_logger
+from shared.metrics import Histogram
+
+logger = get_logger("Response Cache")
+
+SIMILARITY_BUCKETS = (0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 0.99, 1.0)
+
+
+class SemanticResponseCache:
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600, threshold: float = 0.95):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.index_version: Optional[str] = None
+        # entry id -> (user_type, unit query vector, cached value, inserted_at)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        # Stacked view of the entries for one matrix-vector product per lookup, rebuilt after writes
+        self._matrix = None
+        self._matrix_ids = None
+        self._matrix_user_types = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # Best similarity seen on every lookup, to tune the threshold against real traffic
+        self.best_similarity = Histogram(SIMILARITY_BUCKETS)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _check_version(self, index_version: str):
+        """Drops every entry when the index changed underneath the cache. Caller holds the lock."""
+        if index_version == self.index_version:
+            return
+        if self._entries:
+            logger.info(f"Index version {self.index_version} -> {index_version}, dropping {len(self._entries)} answers")
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._matrix = None
+        self.index_version = index_version
+
+    def _rebuild(self):
+        ids = list(self._entries)
+        self._matrix_ids = np.array(ids, dtype=np.int64)
+        self._matrix_user_types = np.array([self._entries[i][0] for i in ids], dtype=object)
+        self._matrix = np.stack([self._entries[i][1] for i in ids]) if ids else None
+
+    def lookup(self, query_vector: np.ndarray, user_type: str, index_version: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        query = normalize_rows(query_vector)
+        now = time.time()
+        with self._lock:
+            self._check_version(index_version)
+            if self._entries and self._matrix is None:
+                self._rebuild()
+            if self._matrix is None:
+                self.misses += 1
+                return None
+            similarities = self._matrix @ query
+            similarities[self._matrix_user_types != user_type] = -1.0
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            self.best_similarity.observe(max(similarity, 0.0))
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+            entry_id = int(self._matrix_ids[best])
+            _, _, value, inserted_at = self._entries[entry_id]
+            if self.ttl_seconds > 0 and now - inserted_at > self.ttl_seconds:
+                del self._entries[entry_id]
+                self._matrix = None
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+        logger.info(f"Semantic cache hit (similarity {similarity:.3f})")
+        return value
+
+    def store(self, query_vector: np.ndarray, user_type: str, index_version: str, value: Dict):
+        if not self.enabled:
+            return
+        vector = normalize_rows(query_vector)
+        with self._lock:
+            self._check_version(index_version)
+            self._entries[next(self._ids)] = (user_type, vector, value, time.time())
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "threshold": self.threshold,
+            "index_version": self.index_version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "best_similarity": self.best_similarity.snapshot(),
+        }
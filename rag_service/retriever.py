@@ -1,6 +1,35 @@
-from qdrant_client import QdrantClient
-from sentence_transformers import SentenceTransformer
-from shared.config import EMBEDDING_MODEL, QDRANT_URL, QDRANT_API_KEY
+import asyncio
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from rag_service.embedding_backends import load_embedding_model
+from shared.config import (
+    EMBEDDING_MODEL, QDRANT_URL, QDRANT_API_KEY, RETRIEVER_BACKEND, LOCAL_INDEX_DIR,
+    EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL, EMBEDDING_CACHE_PATH,
+    EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WAIT_MS, EMBEDDING_QUEUE_DEPTH,
+    EMBEDDING_ENCODE_WORKERS, RETRIEVER_SEARCH_CONCURRENCY,
+    RETRIEVER_HYBRID, HYBRID_CANDIDATES, RRF_K,
+    LOCAL_INDEX_QUANTIZATION, LOCAL_INDEX_TRUNCATE_DIM, LOCAL_INDEX_RESCORE_MULTIPLIER, QDRANT_TIMEOUT,
+)
+from rag_service.local_index import LocalGitaIndex, model_fingerprint, model_probe
+from rag_service.embedding_cache import QueryEmbeddingCache
+from rag_service.embedding_batcher import EmbeddingBatcher
+from rag_service.corpus import corpus_version, load_gita_payloads
+from rag_service.lexical import BM25Index, VerseReferenceResolver, reciprocal_rank_fusion
+from shared import deadline
+from shared.instrumentation import stage
+from shared.logger import get_logger
+from shared.metrics import REGISTRY
+
+logger = get_logger("Gita Retriever")
+
+embedding_cache_requests = REGISTRY.counter(
+    "rag_embedding_cache_requests_total", "Query embedding cache lookups by outcome",
+)
+
+# Written by the indexer on every point; enough to tell when the collection changed
+INDEX_STATE_FIELDS = ["id", "content_hash", "embedding_model"]
 
 
 class GitaRetriever:
@@ -9,30 +38,214 @@ class GitaRetriever:
         collection_name: str = "divinegpt-gita",
         # embedding_model_name: str = "all-MiniLM-L6-v2",
         embedding_model_name: str = EMBEDDING_MODEL,
+        backend: str = RETRIEVER_BACKEND,
+        local_index_dir: str = LOCAL_INDEX_DIR,
+        hybrid: bool = RETRIEVER_HYBRID,
     ):
-        self.client=QdrantClient(
-            # host="localhost",
-            # port=6333
-            url=QDRANT_URL,
-            api_key=QDRANT_API_KEY,
-            timeout=60,
-        )
-        self.embedding_model = SentenceTransformer(embedding_model_name)
+        if backend not in ("qdrant", "numpy"):
+            raise ValueError(f"Unknown retriever backend: {backend}")
+        self.backend = backend
+        self.client = None
+        self.async_client = None
+        self.local_index = None
+        if backend == "numpy":
+            self.local_index = LocalGitaIndex.load(
+                local_index_dir,
+                quantization=LOCAL_INDEX_QUANTIZATION,
+                truncate_dim=LOCAL_INDEX_TRUNCATE_DIM or None,
+                rescore_multiplier=LOCAL_INDEX_RESCORE_MULTIPLIER,
+            )
+        else:
+            self.client=QdrantClient(
+                # host="localhost",
+                # port=6333
+                url=QDRANT_URL,
+                api_key=QDRANT_API_KEY,
+                timeout=int(QDRANT_TIMEOUT),
+            )
+            self.async_client = AsyncQdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, timeout=int(QDRANT_TIMEOUT))
+        self.embedding_model = load_embedding_model(embedding_model_name)
+        self.embedding_model_name = embedding_model_name
         self.collection_name = collection_name
+        if self.local_index is not None:
+            self.local_index.check_model(
+                embedding_model_name,
+                self.embedding_model.get_sentence_embedding_dimension(),
+                probe=model_probe(self.embedding_model),
+                model_hash=model_fingerprint(self.embedding_model),
+            )
+        self.embedding_cache = QueryEmbeddingCache(
+            max_size=EMBEDDING_CACHE_SIZE,
+            ttl_seconds=EMBEDDING_CACHE_TTL,
+            persist_path=EMBEDDING_CACHE_PATH or None,
+        )
+        self.embedding_cache.load()
+        # Encoding is CPU-bound: keep it off the event loop on a small, bounded pool
+        self.encode_executor = ThreadPoolExecutor(max_workers=EMBEDDING_ENCODE_WORKERS, thread_name_prefix="encode")
+        self.batcher = EmbeddingBatcher(
+            self.encode_batch,
+            max_batch_size=EMBEDDING_BATCH_SIZE,
+            max_wait_ms=EMBEDDING_BATCH_WAIT_MS,
+            max_queue_depth=EMBEDDING_QUEUE_DEPTH,
+            executor=self.encode_executor,
+        )
+        self.search_semaphore = asyncio.Semaphore(RETRIEVER_SEARCH_CONCURRENCY)
 
-    def get_relevant_shloka(self, user_query: str, top_k: int = 3):
-        query_vector = self.embedding_model.encode(user_query).tolist()
+        self.reference_resolver = None
+        self.bm25 = None
+        # Stamped on cached answers; without the corpus, fall back to the model name alone
+        self.index_version = embedding_model_name
+        try:
+            payloads = self.local_index.payloads if self.local_index is not None else load_gita_payloads()
+            self.index_version = corpus_version(payloads, embedding_model_name)
+        except Exception as e:
+            payloads = None
+            logger.warning(f"Could not load verse payloads: {e}")
+        if hybrid and payloads:
+            try:
+                self.reference_resolver = VerseReferenceResolver(payloads)
+                self.bm25 = BM25Index(payloads)
+            except Exception as e:
+                logger.warning(f"Hybrid retrieval disabled, could not build lexical index: {e}")
+        elif hybrid:
+            logger.warning("Hybrid retrieval disabled, no verse payloads to index.")
+        if self.client is not None:
+            # The collection, not the local CSV, is what answers are built from
+            try:
+                self.index_version = corpus_version(self._collection_state(), embedding_model_name)
+            except Exception as e:
+                logger.warning(f"Could not read the collection's index version: {e}")
+
+    def _collection_state(self) -> List[Dict]:
+        payloads, offset = [], None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name, limit=256, offset=offset,
+                with_payload=INDEX_STATE_FIELDS, with_vectors=False,
+            )
+            payloads.extend(point.payload or {} for point in points)
+            if offset is None:
+                return payloads
+
+    async def arefresh_index_version(self) -> bool:
+        """Re-derives `index_version` from the Qdrant collection; True if it changed."""
+        if self.async_client is None:
+            # The "numpy" bundle is loaded once, so its version cannot change underneath us
+            return False
+        payloads, offset = [], None
+        while True:
+            points, offset = await self.async_client.scroll(
+                collection_name=self.collection_name, limit=256, offset=offset,
+                with_payload=INDEX_STATE_FIELDS, with_vectors=False,
+            )
+            payloads.extend(point.payload or {} for point in points)
+            if offset is None:
+                break
+        version = corpus_version(payloads, self.embedding_model_name)
+        if version == self.index_version:
+            return False
+        logger.info(f"Collection {self.collection_name} changed: index version {self.index_version} -> {version}")
+        self.index_version = version
+        return True
+
+    def encode_batch(self, texts):
+        return self.embedding_model.encode(texts, batch_size=len(texts), convert_to_numpy=True)
+
+    def encode_query(self, user_query: str):
+        query_vector = self.embedding_cache.get(user_query)
+        if query_vector is None:
+            query_vector = self.embedding_model.encode(user_query)
+            self.embedding_cache.put(user_query, query_vector)
+        return query_vector
+
+    async def aencode_query(self, user_query: str):
+        """Like `encode_query`, but cache misses are batched with concurrent requests."""
+        query_vector = self.embedding_cache.get(user_query)
+        embedding_cache_requests.inc(outcome="miss" if query_vector is None else "hit")
+        if query_vector is None:
+            with stage("encode"):
+                query_vector = await self.batcher.encode(user_query)
+            self.embedding_cache.put(user_query, query_vector)
+        return query_vector
+
+    def search(self, query_vector, top_k: int = 3):
+        if self.local_index is not None:
+            return self.local_index.search(query_vector, top_k=top_k)
         search_result = self.client.query_points(
             collection_name=self.collection_name,
-            query=query_vector,
+            query=query_vector.tolist(),
             limit=top_k,
             with_payload=True,
         )
         return [hit.payload for hit in search_result.points]
 
+    async def asearch(self, query_vector, top_k: int = 3):
+        if self.local_index is not None:
+            # In-process search is microseconds; not worth a thread hop
+            with stage("search"):
+                return self.local_index.search(query_vector, top_k=top_k)
+        async with self.search_semaphore:
+            with stage("search"):
+                search_result = await self.async_client.query_points(
+                    collection_name=self.collection_name,
+                    query=query_vector.tolist(),
+                    limit=top_k,
+                    with_payload=True,
+                    # Whole seconds only; the request is cancelled at its deadline regardless
+                    timeout=math.ceil(deadline.timeout_for(QDRANT_TIMEOUT)),
+                )
+        return [hit.payload for hit in search_result.points]
+
+    def resolve_reference(self, user_query: str):
+        """Verses named outright in the query ("BG 2.47", "chapter 3 verse 19"), if any."""
+        if self.reference_resolver is None:
+            return []
+        return self.reference_resolver.resolve(user_query)
+
+    def fuse(self, user_query: str, dense_payloads, top_k: int):
+        rankings = [dense_payloads]
+        if self.bm25 is not None:
+            rankings.append([p for p, _ in self.bm25.search(user_query, top_k=HYBRID_CANDIDATES)])
+        if self.reference_resolver is not None:
+            # A bare "2.47" in a longer question may or may not be a verse; let it compete, not win outright
+            candidates = self.reference_resolver.resolve_candidates(user_query)
+            if candidates:
+                rankings.append(candidates)
+        if len(rankings) == 1:
+            return dense_payloads[:top_k]
+        return reciprocal_rank_fusion(rankings, k=RRF_K)[:top_k]
+
+    def get_relevant_shloka(self, user_query: str, top_k: int = 3):
+        referenced = self.resolve_reference(user_query)
+        if referenced:
+            return referenced[:top_k]
+        query_vector = self.encode_query(user_query)
+        candidates = max(top_k, HYBRID_CANDIDATES) if self.bm25 else top_k
+        return self.fuse(user_query, self.search(query_vector, top_k=candidates), top_k)
+
+    async def aget_relevant_shloka(self, user_query: str, top_k: int = 3, query_vector=None):
+        """Non-blocking counterpart of `get_relevant_shloka` for use inside the event loop.
+
+        Pass `query_vector` when the caller has already embedded `user_query`.
+        """
+        referenced = self.resolve_reference(user_query)
+        if referenced:
+            # Explicit verse references skip the embedding model entirely
+            return referenced[:top_k]
+        if query_vector is None:
+            query_vector = await self.aencode_query(user_query)
+        candidates = max(top_k, HYBRID_CANDIDATES) if self.bm25 else top_k
+        return self.fuse(user_query, await self.asearch(query_vector, top_k=candidates), top_k)
+
+    async def aclose(self):
+        await self.batcher.close()
+        self.encode_executor.shutdown(wait=False)
+        if self.async_client is not None:
+            await self.async_client.close()
+
 if __name__ == "__main__":
     retriever = GitaRetriever()
     query = "I'm feeling hopeless and stuck in life. What should I do?"
     shlokas = retriever.get_relevant_shloka(query)
     for s in shlokas:
-        print(f"\n🔮 {s['shloka']}\n📜 {s['eng_meaning']}")
\ No newline at end of file
+        print(f"\n🔮 {s['shloka']}\n📜 {s['eng_meaning']}")
@@ -0,0 +1,231 @@
+"""
+Incremental parser for the JSON object the LLM is asked to return.
+
+Output is fed chunk by chunk as it streams in; every character is examined once.
+Each top-level field is reported as soon as its value is complete, and the
+string value currently being written is exposed so it can be streamed on.
+
+Tolerated, because the model produces all of these in practice:
+  - prose or markdown fences (```json) around the object
+  - trailing commas and missing commas between fields
+  - raw newlines inside strings, unquoted values (`"emotion": Calm`)
+  - truncation: `finish()` returns whatever was complete, plus the cut-off value
+"""
+import json
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Runs of characters that need no attention inside a string / an unquoted value
+_STRING_RUN = re.compile(r'[^"\\]+')
+_BARE_RUN = re.compile(r'[^,}\n"{\[]+')
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+# Parser states
+SEEK_OBJECT, SEEK_KEY, SEEK_COLON, SEEK_VALUE, STRING, BARE, NESTED, DONE = range(8)
+
+
+class StructuredOutputParser:
+    def __init__(self):
+        self.state = SEEK_OBJECT
+        self.fields: Dict[str, object] = {}
+        self._key: Optional[str] = None
+        self._parts: List[str] = []
+        # Escape sequence after a backslash, possibly split across chunks
+        self._in_escape = False
+        self._escape = ""
+        self._has_surrogates = False
+        self._in_key = False
+        self._sent_parts = 0  # parts of the current value already handed out by take_delta()
+        self._depth = 0
+        self._nested_in_string = False
+        self._nested_escape = False
+
+    @property
+    def done(self) -> bool:
+        return self.state == DONE
+
+    @property
+    def started(self) -> bool:
+        return self.state != SEEK_OBJECT
+
+    def take_delta(self) -> Tuple[Optional[str], str]:
+        """(field, text added since the last call) for the string value being written, or (None, "")."""
+        if self.state != STRING or self._in_key:
+            return None, ""
+        delta = "".join(self._parts[self._sent_parts:])
+        self._sent_parts = len(self._parts)
+        return self._key, delta
+
+    def _complete(self, value, completed: List[Tuple[str, object]]):
+        self.fields[self._key] = value
+        completed.append((self._key, value))
+        self._key = None
+        self._parts = []
+        self._sent_parts = 0
+        self.state = SEEK_KEY
+
+    def _text(self) -> str:
+        text = "".join(self._parts)
+        if self._has_surrogates:
+            # \ud83d\ude4f-style escaped emoji: recombine the surrogate pair
+            text = text.encode("utf-16", "surrogatepass").decode("utf-16", errors="replace")
+        return text
+
+    def _end_string(self, completed):
+        text = self._text()
+        self._has_surrogates = False
+        if self._in_key:
+            self._key = text
+            self._parts = []
+            self._sent_parts = 0
+            self.state = SEEK_COLON
+        else:
+            self._complete(text, completed)
+
+    def _decode_escape(self) -> Optional[str]:
+        """Decodes `self._escape` (without the backslash) once it is complete, else None."""
+        if not self._escape:
+            return None
+        kind = self._escape[0]
+        if kind != "u":
+            return _ESCAPES.get(kind, kind)
+        if len(self._escape) < 5:
+            return None
+        try:
+            code = int(self._escape[1:5], 16)
+        except ValueError:
+            return self._escape
+        if 0xD800 <= code <= 0xDFFF:
+            self._has_surrogates = True
+        return chr(code)
+
+    def feed(self, chunk: str) -> List[Tuple[str, object]]:
+        """Consumes the next piece of output; returns the fields completed by it, in order."""
+        completed: List[Tuple[str, object]] = []
+        i, n = 0, len(chunk)
+        while i < n and self.state != DONE:
+            state = self.state
+            if state == STRING:
+                if self._in_escape:
+                    self._escape += chunk[i]
+                    i += 1
+                    decoded = self._decode_escape()
+                    if decoded is not None:
+                        self._parts.append(decoded)
+                        self._in_escape, self._escape = False, ""
+                    continue
+                run = _STRING_RUN.match(chunk, i)
+                if run:
+                    self._parts.append(run.group())
+                    i = run.end()
+                    continue
+                char = chunk[i]
+                i += 1
+                if char == "\\":
+                    # Whole escape within this chunk (the common case): decode it in place
+                    length = 5 if chunk.startswith("u", i) else 1
+                    if i + length <= n:
+                        self._escape = chunk[i:i + length]
+                        i += length
+                        self._parts.append(self._decode_escape())
+                        self._escape = ""
+                    else:
+                        self._in_escape = True
+                else:
+                    self._end_string(completed)  # closing quote
+                continue
+            char = chunk[i]
+            if state == SEEK_OBJECT:
+                i += 1
+                if char == "{":
+                    self.state = SEEK_KEY
+            elif state == SEEK_KEY:
+                i += 1
+                if char == '"':
+                    self._in_key = True
+                    self.state = STRING
+                elif char == "}":
+                    self.state = DONE
+            elif state == SEEK_COLON:
+                i += 1
+                if char == ":":
+                    self.state = SEEK_VALUE
+            elif state == SEEK_VALUE:
+                if char.isspace():
+                    i += 1
+                elif char == '"':
+                    i += 1
+                    self._in_key = False
+                    self.state = STRING
+                elif char in "{[":
+                    i += 1
+                    self._parts = [char]
+                    self._depth = 1
+                    self._nested_in_string = False
+                    self._nested_escape = False
+                    self.state = NESTED
+                else:
+                    self.state = BARE
+            elif state == BARE:
+                run = _BARE_RUN.match(chunk, i)
+                if run:
+                    self._parts.append(run.group())
+                    i = run.end()
+                    continue
+                i += 1
+                if char == '"':
+                    # `<text>"`: the model dropped the opening quote; the quote ends the value
+                    self._complete(self._bare_value(), completed)
+                    continue
+                self._complete(self._bare_value(), completed)
+                if char == "}":
+                    self.state = DONE
+            elif state == NESTED:
+                i += 1
+                self._parts.append(char)
+                if self._nested_escape:
+                    self._nested_escape = False
+                elif self._nested_in_string:
+                    if char == "\\":
+                        self._nested_escape = True
+                    elif char == '"':
+                        self._nested_in_string = False
+                elif char == '"':
+                    self._nested_in_string = True
+                elif char in "{[":
+                    self._depth += 1
+                elif char in "}]":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        raw = "".join(self._parts)
+                        try:
+                            value = json.loads(raw)
+                        except ValueError:
+                            value = raw
+                        self._complete(value, completed)
+        return completed
+
+    def _bare_value(self):
+        text = "".join(self._parts).strip()
+        try:
+            return json.loads(text)
+        except ValueError:
+            return text.strip("<>").strip()
+
+    def finish(self) -> Dict[str, object]:
+        """All fields parsed so far; a value cut off by truncation is kept as far as it got."""
+        if self._key is not None and not self._in_key and self.state in (STRING, BARE, NESTED):
+            if self.state == STRING:
+                self.fields[self._key] = self._text()
+            elif self.state == BARE:
+                self.fields[self._key] = self._bare_value()
+            else:
+                self.fields[self._key] = "".join(self._parts)
+        return self.fields
+
+
+def parse_structured_output(text: str) -> Tuple[Dict[str, object], bool]:
+    """One-shot helper: (fields, whether a JSON object was found at all)."""
+    parser = StructuredOutputParser()
+    parser.feed(text)
+    return parser.finish(), parser.started
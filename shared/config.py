@@ -10,6 +10,11 @@ DATASET_DIR = SHARED_ROOT / "datasets"
 
 # EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "thenlper/gte-small")
+# torch | torch-int8 | onnx | onnx-int8 (see rag_service/embedding_backends.py); 0 threads = library default
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", 0))
+# Int8 ONNX kernels to quantise for: auto (from this host's CPU flags) | arm64 | avx2 | avx512 | avx512_vnni
+EMBEDDING_ONNX_QUANTIZATION = os.getenv("EMBEDDING_ONNX_QUANTIZATION", "auto").lower()
 
 # Hosts
 LLM_SERVICE_HOST = os.getenv("LLM_SERVICE_HOST", "localhost")
@@ -37,8 +42,136 @@ GATEWAY_SERVICE_URL = os.getenv("GATEWAY_SERVICE_URL", f"http://{GATEWAY_SERVICE
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY","")
 USE_GEMINI = os.getenv("USE_GEMINI","True").lower() == "true"
 GEMINI_MODEL = "gemini-2.0-flash-lite"
+# Explicit context caching of the stable prompt prefix (falls back to full prompts when the model refuses it)
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "True").lower() == "true"
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", 3600))
+# Smallest prefix (estimated tokens) the model accepts for explicit caching; shorter ones are never uploaded
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", 4096))
+# In-flight Gemini calls per worker; further requests wait in FIFO order, up to LLM_MAX_QUEUE of them
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 64))
+
+# LLM backend: gemini | simulated (see llm_service/backends.py); simulated needs no network or API key and
+# is only ever used when asked for by name. With USE_GEMINI false and no LLM_BACKEND there is none: every call fails.
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini" if USE_GEMINI else "").lower()
+# Appends one JSON line of timings per generation, replayable with SIM_LATENCY_MODEL=trace (empty disables)
+LLM_TRACE_PATH = os.getenv("LLM_TRACE_PATH", "")
+
+# Simulated backend: latency model (fixed | lognormal | trace), time to first token, decode speed, injected failures
+SIM_LATENCY_MODEL = os.getenv("SIM_LATENCY_MODEL", "lognormal").lower()
+SIM_TTFT_MS = float(os.getenv("SIM_TTFT_MS", 400))
+SIM_TTFT_SIGMA = float(os.getenv("SIM_TTFT_SIGMA", 0.5))  # lognormal shape; SIM_TTFT_MS is the median
+SIM_TOKENS_PER_SECOND = float(os.getenv("SIM_TOKENS_PER_SECOND", 80))  # 0 = no decode delay
+SIM_CHUNK_TOKENS = int(os.getenv("SIM_CHUNK_TOKENS", 16))
+SIM_TRACE_PATH = os.getenv("SIM_TRACE_PATH", "")
+SIM_ERROR_RATE = float(os.getenv("SIM_ERROR_RATE", 0))
+SIM_STREAM_ABORT_RATE = float(os.getenv("SIM_STREAM_ABORT_RATE", 0))
+SIM_SEED = int(os.getenv("SIM_SEED", 0))
 
 # Qdrant CONFIG
 QDRANT_URL = "https://aa5d2ed6-4c67-432c-99c0-8094cf311275.us-east-1-0.aws.cloud.qdrant.io:6333"
 QDRANT_PATH = os.getenv("QDRANT_URL", QDRANT_URL)
-QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", "")
\ No newline at end of file
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", "")
+
+# Retriever CONFIG
+# "qdrant" queries the remote collection, "numpy" serves an in-process index bundle
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "qdrant").lower()
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", str(DATASET_DIR / "index" / "divinegpt-gita"))
+
+# Query embedding cache (size 0 disables it; empty path disables persistence)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 2048))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", 86400))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+
+# Query embedding micro-batching
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 16))
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", 5))
+EMBEDDING_QUEUE_DEPTH = int(os.getenv("EMBEDDING_QUEUE_DEPTH", 256))
+
+# Retrieval concurrency (encoding threads and in-flight vector searches per worker)
+EMBEDDING_ENCODE_WORKERS = int(os.getenv("EMBEDDING_ENCODE_WORKERS", 2))
+RETRIEVER_SEARCH_CONCURRENCY = int(os.getenv("RETRIEVER_SEARCH_CONCURRENCY", 8))
+
+# Bulk indexing
+INDEX_CHUNK_SIZE = int(os.getenv("INDEX_CHUNK_SIZE", 64))
+INDEX_UPLOAD_WORKERS = int(os.getenv("INDEX_UPLOAD_WORKERS", 4))
+INDEX_CHECKPOINT_DIR = os.getenv("INDEX_CHECKPOINT_DIR", str(DATASET_DIR / "index"))
+INDEX_EMBEDDING_STORE_PATH = os.getenv("INDEX_EMBEDDING_STORE_PATH", str(DATASET_DIR / "index" / "embedding-store.npz"))
+
+# Hybrid retrieval (verse-reference lookup + BM25 fused with dense results)
+RETRIEVER_HYBRID = os.getenv("RETRIEVER_HYBRID", "True").lower() == "true"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 10))
+RRF_K = int(os.getenv("RRF_K", 60))
+
+# Compressed first pass for the "numpy" backend: none | int8 | binary (0 = keep all dimensions)
+LOCAL_INDEX_QUANTIZATION = os.getenv("LOCAL_INDEX_QUANTIZATION", "none").lower()
+LOCAL_INDEX_TRUNCATE_DIM = int(os.getenv("LOCAL_INDEX_TRUNCATE_DIM", 0))
+LOCAL_INDEX_RESCORE_MULTIPLIER = int(os.getenv("LOCAL_INDEX_RESCORE_MULTIPLIER", 4))
+
+# Semantic cache of first-turn answers (size 0 disables it)
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1024))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 6 * 3600))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", 0.95))
+# How often the "qdrant" backend re-reads the collection's content hashes, so a re-index drops cached answers (0 = never)
+INDEX_VERSION_REFRESH_SECONDS = float(os.getenv("INDEX_VERSION_REFRESH_SECONDS", 60))
+
+# Gateway exact-match /ask cache (size or TTL 0 disables caching; identical in-flight requests are always coalesced)
+GATEWAY_CACHE_SIZE = int(os.getenv("GATEWAY_CACHE_SIZE", 2048))
+GATEWAY_CACHE_TTL = float(os.getenv("GATEWAY_CACHE_TTL", 300))
+
+# Prompt token budget (estimated tokens; the stable prefix counts towards PROMPT_TOKEN_BUDGET)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 4000))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1200))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", 300))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 1500))
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", 8))
+MESSAGE_MAX_TOKENS = int(os.getenv("MESSAGE_MAX_TOKENS", 400))
+QUERY_TOKEN_BUDGET = int(os.getenv("QUERY_TOKEN_BUDGET", 500))
+
+# Pooled HTTP clients between services (one long-lived client per upstream)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "False").lower() == "true"  # needs the h2 package
+RAG_UPSTREAM_TIMEOUT = float(os.getenv("RAG_UPSTREAM_TIMEOUT", 270))
+LLM_UPSTREAM_TIMEOUT = float(os.getenv("LLM_UPSTREAM_TIMEOUT", 180))
+T2S_UPSTREAM_TIMEOUT = float(os.getenv("T2S_UPSTREAM_TIMEOUT", 60))
+STATUS_PROBE_TIMEOUT = float(os.getenv("STATUS_PROBE_TIMEOUT", 5))
+
+# Startup
+STARTUP_RETRY_SECONDS = float(os.getenv("STARTUP_RETRY_SECONDS", 15))
+
+# Tracing: recent spans are kept in memory for /debug/traces and, if a path is set, appended as JSONL
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 4096))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+
+# Upstream replicas: comma-separated base URLs per service (defaults to the single *_SERVICE_URL above)
+RAG_SERVICE_URLS = os.getenv("RAG_SERVICE_URLS", RAG_SERVICE_URL)
+T2S_SERVICE_URLS = os.getenv("T2S_SERVICE_URLS", T2S_SERVICE_URL)
+LLM_SERVICE_URLS = os.getenv("LLM_SERVICE_URLS", LLM_SERVICE_URL)
+# Replica choice: least_outstanding | ewma (latency EWMA weighted by requests in flight)
+LB_POLICY = os.getenv("LB_POLICY", "least_outstanding").lower()
+LB_EWMA_DECAY_SECONDS = float(os.getenv("LB_EWMA_DECAY_SECONDS", 10))
+# Active health checks: GET /ready on every replica; ejected after N failed probes, restored after M good ones
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", 5))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", 2))
+HEALTH_UNHEALTHY_THRESHOLD = int(os.getenv("HEALTH_UNHEALTHY_THRESHOLD", 2))
+HEALTH_HEALTHY_THRESHOLD = int(os.getenv("HEALTH_HEALTHY_THRESHOLD", 2))
+
+# Circuit breakers: consecutive failed calls to an upstream that open its circuit, seconds before trial calls
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv("BREAKER_RECOVERY_TIMEOUT", 15))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", 1))
+# Bulkheads: concurrent calls per upstream and process; more wait up to BULKHEAD_MAX_WAIT seconds, then fail fast
+RAG_MAX_IN_FLIGHT = int(os.getenv("RAG_MAX_IN_FLIGHT", 64))
+T2S_MAX_IN_FLIGHT = int(os.getenv("T2S_MAX_IN_FLIGHT", 16))
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", 32))
+BULKHEAD_MAX_WAIT = float(os.getenv("BULKHEAD_MAX_WAIT", 0))
+
+# Deadlines: the gateway's end-to-end budget per request, passed downstream as X-Request-Budget-Ms
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", 120))
+# With less budget left than this, the RAG service answers from the fallback instead of calling the LLM
+LLM_MIN_BUDGET_SECONDS = float(os.getenv("LLM_MIN_BUDGET_SECONDS", 3))
+QDRANT_TIMEOUT = float(os.getenv("QDRANT_TIMEOUT", 60))
+T2S_CLIENT_TIMEOUT = float(os.getenv("T2S_CLIENT_TIMEOUT", 20))
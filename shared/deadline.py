@@ -0,0 +1,188 @@
+"""
+End-to-end request deadlines.
+
+The gateway gives every request a budget (REQUEST_DEADLINE_SECONDS; a client may ask
+for less with the X-Request-Budget-Ms header). The remaining budget rides along on
+every pooled upstream call as the same header, in milliseconds. Milliseconds left,
+rather than an absolute time, so clock skew between hosts does not matter. Each
+service then:
+
+  - caps its httpx timeouts (and Qdrant's, Gemini's) at what is left, via `timeout_for()`
+  - skips optional stages when too little is left (`has_budget()`, `skip_stage()`)
+  - cancels the request handler, and with it any in-flight upstream call, at the
+    deadline, answering 504 if nothing was sent yet
+
+Work cancelled at the deadline was paid for but thrown away. Its duration is added
+to `deadline_wasted_seconds_total`, per route, so abandoned work shows up as a number.
+Without a budget (a direct call to an internal service) nothing changes: the
+configured timeouts apply as before.
+"""
+import asyncio
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi import FastAPI
+
+from shared.logger import get_logger
+from shared.metrics import REGISTRY
+
+logger = get_logger("Deadlines")
+
+BUDGET_HEADER = "x-request-budget-ms"
+# Marks a 504 as "the caller's budget ran out", so breakers do not count it against the upstream
+EXCEEDED_HEADER = "x-deadline-exceeded"
+# Never hand httpx a zero or negative timeout; it would mean "no timeout"
+MIN_TIMEOUT = 0.001
+
+exceeded = REGISTRY.counter("deadline_exceeded_total", "Requests past their deadline, by route and when")
+wasted_seconds = REGISTRY.counter("deadline_wasted_seconds_total",
+                                  "Handler time spent on requests cancelled at their deadline, by route")
+skipped_stages = REGISTRY.counter("deadline_skipped_stages_total", "Optional stages skipped for lack of budget")
+
+# time.monotonic() at which the current request's budget runs out; None without a deadline
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current request's budget, or None if it has no deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def has_budget(seconds: float) -> bool:
+    left = remaining()
+    return left is None or left >= seconds
+
+
+def skip_stage(name: str, needs: float) -> bool:
+    """True (and counted) if fewer than `needs` seconds are left for an optional stage."""
+    if has_budget(needs):
+        return False
+    skipped_stages.inc(stage=name)
+    logger.info(f"Skipping '{name}': {remaining():.2f}s of budget left, needs {needs:.2f}s")
+    return True
+
+
+@contextmanager
+def budget(seconds: Optional[float]):
+    """
+    Runs the block under a budget of its own, whatever the caller's: for work done on behalf of
+    several requests, such as a coalesced upstream call, which must not die with the first caller.
+    """
+    token = _deadline.set(None if seconds is None else time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def timeout_for(default: Optional[float]) -> Optional[float]:
+    """`default` capped at the remaining budget."""
+    left = remaining()
+    if left is None:
+        return default
+    left = max(left, MIN_TIMEOUT)
+    return left if default is None else min(default, left)
+
+
+async def inject_headers(request):
+    """httpx request hook: passes the remaining budget on and caps the call's timeouts at it."""
+    left = remaining()
+    if left is None:
+        return
+    request.headers[BUDGET_HEADER] = str(max(0, int(left * 1000)))
+    timeouts = request.extensions.get("timeout", {})
+    request.extensions["timeout"] = {phase: timeout_for(value) for phase, value in timeouts.items()}
+
+
+def parse_budget(value: Optional[str]) -> Optional[float]:
+    """Seconds from an X-Request-Budget-Ms header value, or None if absent or malformed."""
+    try:
+        return int(value) / 1000 if value else None
+    except ValueError:
+        return None
+
+
+class DeadlineMiddleware:
+    """Plain ASGI middleware: sets the request's deadline and cancels the handler when it passes."""
+
+    def __init__(self, app, default_budget: Optional[float] = None):
+        self.app = app
+        self.default_budget = default_budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        budget = None
+        for key, value in scope.get("headers", []):
+            if key == BUDGET_HEADER.encode("latin-1"):
+                budget = parse_budget(value.decode("latin-1"))
+        if self.default_budget is not None:
+            # At the edge a client may shorten the budget, never extend it
+            budget = self.default_budget if budget is None else min(budget, self.default_budget)
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+        if budget <= 0:
+            # Not routed yet; raw paths would make an unbounded label set
+            exceeded.inc(route="unmatched", when="on_arrival")
+            await self._timeout_response(send)
+            return
+
+        started = time.monotonic()
+        token = _deadline.set(started + budget)
+        response_started = False
+
+        async def send_tracking(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        timeout = asyncio.timeout(budget)
+        try:
+            async with timeout:
+                await self.app(scope, receive, send_tracking)
+        except TimeoutError:
+            if not timeout.expired():
+                raise
+            elapsed = time.monotonic() - started
+            route = getattr(scope.get("route"), "path", "unmatched")
+            exceeded.inc(route=route, when="in_flight")
+            wasted_seconds.inc(elapsed, route=route)
+            logger.warning(f"Deadline of {budget:.2f}s exceeded on {route}; cancelled after {elapsed:.2f}s")
+            if not response_started:
+                await self._timeout_response(send)
+        finally:
+            _deadline.reset(token)
+
+    @staticmethod
+    async def _timeout_response(send):
+        body = json.dumps({"detail": "Deadline exceeded"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 504,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (EXCEEDED_HEADER.encode("latin-1"), b"true"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def install_deadlines(app: FastAPI, default_budget: Optional[float] = None):
+    """
+    Enforces X-Request-Budget-Ms on a service; `default_budget` also gives requests without
+    one a deadline (the gateway). Install before CORSMiddleware so 504s carry CORS headers.
+    """
+    app.add_middleware(DeadlineMiddleware, default_budget=default_budget)
@@ -0,0 +1,159 @@
+"""
+Long-lived, pooled HTTP clients for calls between the services.
+
+Each upstream (rag, llm, t2s, ...) gets one httpx.AsyncClient for the life of the
+app, created in the FastAPI lifespan, so requests reuse kept-alive connections
+instead of paying TCP setup and a fresh pool every time. Pool utilisation is
+reported by `stats()` for sizing pools under load.
+"""
+import threading
+from typing import Dict, Optional
+
+import httpx
+
+from shared.config import (
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY, HTTP_CONNECT_TIMEOUT, HTTP2_ENABLED,
+)
+from shared import deadline
+from shared.logger import get_logger
+from shared.tracing import inject_headers
+
+logger = get_logger("HTTP Clients")
+
+
+class _CountingStream(httpx.AsyncByteStream):
+    """Response body wrapper that reports when the body is closed (i.e. the connection is released)."""
+
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._on_close()
+
+
+class _InstrumentedTransport(httpx.AsyncHTTPTransport):
+    """Counts requests from send until their response body is closed."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            with self._lock:
+                self.in_flight -= 1
+                self.errors += 1
+            raise
+        response.stream = _CountingStream(response.stream, self._release)
+        return response
+
+    def pool_stats(self) -> Dict:
+        pool = self._pool
+        connections = list(pool.connections)
+        idle = sum(1 for c in connections if c.is_idle())
+        # httpcore keeps queued requests on the pool; not public API, so degrade gracefully
+        pending = getattr(pool, "_requests", None)
+        waiting = sum(1 for r in pending if r.is_queued()) if pending is not None else None
+        return {
+            "connections": len(connections),
+            "connections_in_use": len(connections) - idle,
+            "connections_idle": idle,
+            "waiting_acquisitions": waiting,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "requests": self.requests,
+            "transport_errors": self.errors,
+        }
+
+
+class UpstreamClients:
+    """One pooled AsyncClient per named upstream; `start()`/`aclose()` are called from the app lifespan."""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._transports: Dict[str, _InstrumentedTransport] = {}
+        self._timeouts: Dict[str, float] = {}
+        self._max_connections: Dict[str, int] = {}
+
+    def start(
+            self,
+            name: str,
+            timeout: float,
+            max_connections: int = HTTP_MAX_CONNECTIONS,
+            max_keepalive: int = HTTP_MAX_KEEPALIVE,
+            http2: bool = HTTP2_ENABLED,
+    ) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning(f"HTTP/2 requested for '{name}' but the h2 package is missing; using HTTP/1.1")
+                http2 = False
+        transport = _InstrumentedTransport(limits=limits, http2=http2)
+        client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(timeout, connect=min(HTTP_CONNECT_TIMEOUT, timeout)),
+            # Propagates the trace context, request ID and remaining deadline budget of the request being handled
+            event_hooks={"request": [inject_headers, deadline.inject_headers]},
+        )
+        self._clients[name] = client
+        self._transports[name] = transport
+        self._timeouts[name] = timeout
+        self._max_connections[name] = max_connections
+        logger.info(f"Upstream client '{name}': timeout {timeout}s, max {max_connections} connections, "
+                    f"{max_keepalive} keep-alive, http2={http2}")
+        return client
+
+    def __getitem__(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None:
+            raise RuntimeError(f"Upstream client '{name}' is not started (app lifespan not running?)")
+        return client
+
+    def get(self, name: str) -> Optional[httpx.AsyncClient]:
+        return self._clients.get(name)
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    def stats(self) -> Dict:
+        return {
+            name: {
+                "timeout_seconds": self._timeouts[name],
+                "max_connections": self._max_connections[name],
+                **transport.pool_stats(),
+            }
+            for name, transport in self._transports.items()
+        }
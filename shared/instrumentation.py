@@ -0,0 +1,140 @@
+"""
+Per-request stage timing, a Prometheus /metrics endpoint and a Server-Timing header.
+
+    with stage("search"):
+        hits = await retriever.asearch(vector)
+
+records the duration in the `stage_duration_seconds{stage="search"}` histogram,
+records a tracing span (shared/tracing.py) and, inside a request, adds it to that
+response's header:
+
+    Server-Timing: encode;dur=4.1, search;dur=11.8, llm;dur=2210.5, total;dur=2231.0
+
+The gateway copies the RAG service's entries into its own (`rag_llm;dur=...`), so
+one header breaks the whole request down across hops.
+
+Only the stages finished before the response headers go out are in the header
+(for streamed responses that is everything up to the first byte); the histograms
+get every stage. The cost per stage is two perf_counter() calls and one locked
+histogram update, so this stays on in production.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from fastapi import FastAPI
+from fastapi.responses import Response
+
+from shared import tracing
+from shared.metrics import REGISTRY
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+stage_seconds = REGISTRY.histogram("stage_duration_seconds", "Time spent in each request stage", STAGE_BUCKETS)
+request_seconds = REGISTRY.histogram(
+    "http_request_duration_seconds", "Time until the response headers were sent, by route", STAGE_BUCKETS,
+)
+requests_total = REGISTRY.counter("http_requests_total", "Requests by route, method and status code")
+
+# (stage, seconds) pairs of the current request; None outside a request
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+
+def note_timing(name: str, seconds: float):
+    """Adds a duration measured elsewhere to the current request's Server-Timing header."""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+def note_upstream_timings(prefix: str, header: Optional[str]):
+    """Copies an upstream response's Server-Timing entries into this request's, as `<prefix>_<name>`."""
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        if name and name != "total" and params.startswith("dur="):
+            try:
+                note_timing(f"{prefix}_{name}", float(params[len("dur="):]) / 1000)
+            except ValueError:
+                pass
+
+
+def record_stage(name: str, seconds: float):
+    stage_seconds.observe(seconds, stage=name)
+    note_timing(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        with tracing.span(name):
+            yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def server_timing(timings: List[Tuple[str, float]], total: float) -> str:
+    totals = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware: times each request and adds the Server-Timing header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = []
+        token = _request_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                route = scope.get("route")
+                # Route templates, not raw paths, keep the label set small
+                path = getattr(route, "path", "unmatched")
+                request_seconds.observe(elapsed, route=path)
+                requests_total.inc(route=path, method=scope["method"], status=message["status"])
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(timings, elapsed).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+
+
+async def metrics_endpoint():
+    return Response(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+async def traces_endpoint(limit: int = 20):
+    return tracing.debug_traces(limit=limit)
+
+
+async def trace_endpoint(trace_id: str):
+    return tracing.debug_traces(trace_id=trace_id)
+
+
+def install_instrumentation(app: FastAPI, service: str):
+    """Adds timing and tracing middleware, GET /metrics and GET /debug/traces to a service."""
+    tracing.configure(service)
+    app.add_middleware(MetricsMiddleware)
+    # Added last, so it is outermost: the request ID is set before anything else runs
+    app.add_middleware(tracing.TracingMiddleware)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/debug/traces", traces_endpoint, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/debug/traces/{trace_id}", trace_endpoint, methods=["GET"], include_in_schema=False)
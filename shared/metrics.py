@@ -0,0 +1,155 @@
+"""
+Lightweight in-process metrics shared by the services.
+"""
+import bisect
+import threading
+from typing import Callable, Dict, Sequence, Tuple
+
+
+class Histogram:
+    """Fixed-bucket histogram; `buckets` are inclusive upper bounds, sorted ascending."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative, running = {}, 0
+        for bound, c in zip(self.buckets, counts):
+            running += c
+            cumulative[str(bound)] = running
+        cumulative["+Inf"] = count
+        return {
+            "buckets": cumulative,
+            "count": count,
+            "sum": round(total, 6),
+            "mean": round(total / count, 6) if count else 0.0,
+        }
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic counter, split by label values (`inc(outcome="hit")`)."""
+
+    def __init__(self):
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> Dict[Tuple, float]:
+        with self._lock:
+            return dict(self._values)
+
+
+class LabeledHistogram:
+    """One Histogram per combination of label values, created on first use."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = sorted(buckets)
+        self._children: Dict[Tuple, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels) -> Histogram:
+        key = _label_key(labels)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, Histogram(self.buckets))
+        return child
+
+    def observe(self, value: float, **labels):
+        self.labels(**labels).observe(value)
+
+    def children(self) -> Dict[Tuple, Histogram]:
+        with self._lock:
+            return dict(self._children)
+
+
+class MetricsRegistry:
+    """Named metrics of one process, rendered in the Prometheus text format for /metrics."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Tuple[str, str, object]] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_add(self, name: str, kind: str, help_text: str, factory: Callable[[], object]):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = (kind, help_text, factory())
+            return self._metrics[name][2]
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get_or_add(name, "counter", help_text, Counter)
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float]) -> LabeledHistogram:
+        return self._get_or_add(name, "histogram", help_text, lambda: LabeledHistogram(buckets))
+
+    def register_histogram(self, name: str, help_text: str, histogram: Histogram):
+        """Exports a Histogram owned elsewhere (e.g. a cache's or a limiter's)."""
+        self._get_or_add(name, "histogram", help_text, lambda: {(): histogram})
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float], **labels):
+        """A value read when /metrics is scraped; register once per label set (`upstream="rag"`)."""
+        reads = self._get_or_add(name, "gauge", help_text, dict)
+        with self._lock:
+            reads[_label_key(labels)] = read
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+        lines = []
+        for name, (kind, help_text, metric) in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for key, value in sorted(metric.snapshot().items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            elif kind == "gauge":
+                with self._lock:
+                    reads = sorted(metric.items())
+                for key, read in reads:
+                    try:
+                        lines.append(f"{name}{_format_labels(key)} {float(read()):g}")
+                    except Exception:
+                        pass
+            else:
+                children = metric.children() if isinstance(metric, LabeledHistogram) else metric
+                for key, histogram in sorted(children.items()):
+                    snapshot = histogram.snapshot()
+                    for bound, count in snapshot["buckets"].items():
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', bound),))} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {snapshot['sum']:g}")
+                    lines.append(f"{name}_count{_format_labels(key)} {snapshot['count']}")
+        return "\n".join(lines) + "\n"
+
+
+# Each service runs in its own process, so one registry per process is enough
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,227 @@
+"""
+Circuit breaker and bulkhead for calls from one service to another.
+
+    async with guards["rag"].call():
+        response = await client.post(...)
+        response.raise_for_status()
+
+Each upstream gets an UpstreamGuard:
+
+  - the bulkhead caps concurrent calls (RAG_MAX_IN_FLIGHT, ...). A call that finds
+    it full waits at most BULKHEAD_MAX_WAIT seconds, then fails with BulkheadFull.
+  - the breaker counts consecutive failures: transport errors, timeouts, 429/5xx
+    responses. After BREAKER_FAILURE_THRESHOLD of them it opens, and calls fail
+    with CircuitOpen before touching the network. After BREAKER_RECOVERY_TIMEOUT
+    it goes half-open and lets BREAKER_HALF_OPEN_CALLS trial calls through; one
+    success closes it, one failure opens it again.
+
+Both errors are UpstreamUnavailable, with a `retry_after` hint in seconds, and are
+raised in microseconds, so a degraded upstream sheds load instead of tying up
+connections until the timeout. 4xx responses, cancelled calls (the client went
+away) and calls cut short by the request's deadline (shared/deadline.py) neither
+trip nor reset the breaker.
+"""
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+import httpx
+
+from shared import deadline
+from shared.config import (
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RECOVERY_TIMEOUT, BREAKER_HALF_OPEN_CALLS, BULKHEAD_MAX_WAIT,
+)
+from shared.logger import get_logger
+from shared.metrics import REGISTRY
+
+logger = get_logger("Resilience")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+transitions = REGISTRY.counter("circuit_breaker_transitions_total", "Circuit breaker state changes, by upstream")
+rejections = REGISTRY.counter("upstream_rejections_total", "Calls failed fast, by upstream and reason")
+
+
+class UpstreamUnavailable(Exception):
+    def __init__(self, upstream: str, reason: str, retry_after: float):
+        super().__init__(f"{upstream} {reason}")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+class BulkheadFull(UpstreamUnavailable):
+    pass
+
+
+def is_failure(exc: BaseException) -> Optional[bool]:
+    """True if the exception says the upstream is unhealthy, False if not, None if it says nothing."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        if exc.response.headers.get(deadline.EXCEEDED_HEADER):
+            # The caller's budget ran out, which says nothing about the upstream
+            return None
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    if isinstance(exc, httpx.TimeoutException) and deadline.expired():
+        return None
+    if isinstance(exc, Exception):
+        return True
+    # CancelledError, GeneratorExit: the caller gave up
+    return None
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker. Runs on the event loop only, so no locking."""
+
+    def __init__(
+            self,
+            name: str,
+            failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+            recovery_timeout: float = BREAKER_RECOVERY_TIMEOUT,
+            half_open_calls: int = BREAKER_HALF_OPEN_CALLS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trials = 0
+        self.times_opened = 0
+
+    def _move(self, state: str):
+        if state == self.state:
+            return
+        transitions.inc(upstream=self.name, **{"from": self.state, "to": state})
+        log = logger.warning if state == OPEN else logger.info
+        log(f"Circuit for '{self.name}' {self.state} -> {state}")
+        self.state = state
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+        self.trials = 0
+
+    def allow(self):
+        """Admits a call or raises CircuitOpen. Admitted calls must report back with `record()`."""
+        if self.state == OPEN:
+            remaining = self.opened_at + self.recovery_timeout - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpen(self.name, "circuit open", remaining)
+            self._move(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self.trials >= self.half_open_calls:
+                raise CircuitOpen(self.name, "circuit half-open, trial call in progress", 1.0)
+            self.trials += 1
+
+    def record(self, failed: Optional[bool]):
+        if self.state == HALF_OPEN:
+            self.trials = max(0, self.trials - 1)
+        if failed is None:
+            return
+        if not failed:
+            self.failures = 0
+            self._move(CLOSED)
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self._move(OPEN)
+
+    def stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+            "retry_in_seconds": round(max(0.0, self.opened_at + self.recovery_timeout - time.monotonic()), 1)
+            if self.state == OPEN else None,
+        }
+
+
+class Bulkhead:
+    """Caps concurrent calls; callers over the cap wait up to `max_wait` seconds for a slot."""
+
+    def __init__(self, name: str, max_in_flight: int, max_wait: float = BULKHEAD_MAX_WAIT):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_wait = max_wait
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def acquire(self):
+        if self._semaphore.locked() and self.max_wait <= 0:
+            raise BulkheadFull(self.name, f"bulkhead full ({self.max_in_flight} calls in flight)", 1.0)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.max_wait if self.max_wait > 0 else None)
+        except asyncio.TimeoutError:
+            raise BulkheadFull(self.name, f"bulkhead full ({self.max_in_flight} calls in flight)", 1.0) from None
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict:
+        return {"max_in_flight": self.max_in_flight, "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight}
+
+
+class UpstreamGuard:
+    """Breaker + bulkhead for one upstream. Use `call()`, or `enter()`/`exit()` when the call outlives a block."""
+
+    def __init__(self, name: str, max_in_flight: int):
+        self.name = name
+        self.breaker = CircuitBreaker(name)
+        self.bulkhead = Bulkhead(name, max_in_flight)
+        REGISTRY.gauge("circuit_breaker_state", "0 closed, 1 half-open, 2 open",
+                       lambda: STATE_VALUES[self.breaker.state], upstream=name)
+        REGISTRY.gauge("bulkhead_in_flight", "Calls holding a bulkhead slot", lambda: self.bulkhead.in_flight,
+                       upstream=name)
+
+    async def enter(self):
+        try:
+            self.breaker.allow()
+        except CircuitOpen:
+            rejections.inc(upstream=self.name, reason="circuit_open")
+            raise
+        try:
+            await self.bulkhead.acquire()
+        except BaseException as e:
+            # Never started, so it is no evidence either way; frees a half-open trial slot
+            self.breaker.record(None)
+            if isinstance(e, BulkheadFull):
+                rejections.inc(upstream=self.name, reason="bulkhead_full")
+            raise
+
+    def exit(self, failed: Optional[bool]):
+        self.bulkhead.release()
+        self.breaker.record(failed)
+
+    @asynccontextmanager
+    async def call(self):
+        await self.enter()
+        try:
+            yield
+        except BaseException as e:
+            self.exit(is_failure(e))
+            raise
+        self.exit(False)
+
+    def stats(self) -> Dict:
+        return {"circuit": self.breaker.stats(), "bulkhead": self.bulkhead.stats()}
+
+
+def guard_stats(guards: Dict[str, UpstreamGuard]) -> Dict:
+    return {name: guard.stats() for name, guard in guards.items()}
+
+
+def retry_after_headers(exc: UpstreamUnavailable) -> Dict[str, str]:
+    """Retry-After for the 503 a fast-failed call turns into."""
+    return {"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
@@ -27,9 +27,11 @@ class LLMServiceRequest(BaseModel):
     prompt: str
     temperature: Optional[float] = Field(0.7, ge=0.0, le=1.0)
     max_new_tokens: Optional[int] = Field(2048, gt=0)
+    prefix_chars: Optional[int] = Field(0, ge=0, description="Leading characters of the prompt that form a stable, cacheable prefix")
 
 class LLMServiceResponse(BaseModel):
     response: str
+    usage: Optional[Dict[str, int]] = Field(None, description="Prompt tokens reused from a cached prefix vs sent fresh, and output tokens")
 
 class RAGServiceQuery(BaseModel):
     query: str
@@ -57,6 +59,8 @@ class RAGServiceResponse(BaseModel):
     llm_response: LLMStructuredResponse
     context: str
     prompt: str
+    # A fallback answer (LLM unavailable, out of time budget, unparseable output); never cached
+    degraded: bool = False
 
 class ServiceStatus(BaseModel):
     service: str
@@ -0,0 +1,32 @@
+"""
+Server-Sent Events helpers for the streaming endpoints.
+
+Every hop (LLM service -> RAG service -> gateway -> browser) speaks the same
+framing: `event: <name>` plus one JSON `data:` line, separated by a blank line.
+"""
+import json
+from typing import Any, AsyncIterator, Tuple
+
+SSE_MEDIA_TYPE = "text/event-stream"
+# Stops nginx/Render-style proxies from buffering the stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def iter_sse(response) -> AsyncIterator[Tuple[str, Any]]:
+    """Yields (event, decoded data) pairs from a streaming httpx response."""
+    event, data_lines = "message", []
+    async for line in response.aiter_lines():
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].lstrip())
+    if data_lines:
+        yield event, json.loads("\n".join(data_lines))
@@ -0,0 +1,66 @@
+"""
+Startup bookkeeping shared by the services: per-phase timings and readiness.
+
+Each service creates a StartupState before its heavy imports, runs slow work
+(model loads, client setup, warm-up) in the background after binding, and
+exposes `/live` (process is up) separately from `/ready` (can serve traffic).
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from fastapi.responses import JSONResponse
+
+from shared.logger import get_logger
+
+
+class StartupState:
+    def __init__(self, service: str):
+        self.service = service
+        self.logger = get_logger(service)
+        self._created_at = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.ready = False
+        self.error: Optional[str] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.phases[name] = round(elapsed, 3)
+            self.logger.info(f"Startup phase '{name}' took {elapsed:.2f}s")
+
+    def record(self, name: str):
+        """Records the time elapsed since the state was created (e.g. module import)."""
+        elapsed = time.perf_counter() - self._created_at
+        self.phases[name] = round(elapsed, 3)
+        self.logger.info(f"Startup phase '{name}' took {elapsed:.2f}s")
+
+    def mark_ready(self):
+        self.ready = True
+        self.error = None
+        total = time.perf_counter() - self._created_at
+        self.phases["total_until_ready"] = round(total, 3)
+        self.logger.info(f"{self.service} ready after {total:.2f}s; phases: {self.phases}")
+
+    def mark_failed(self, error: Exception):
+        self.ready = False
+        self.error = str(error)
+        self.logger.error(f"{self.service} startup failed: {error}")
+
+    def as_dict(self) -> Dict:
+        return {"ready": self.ready, "error": self.error, "phases": self.phases}
+
+
+def readiness_response(state: StartupState, port: Optional[int] = None) -> JSONResponse:
+    """200 once the service can serve traffic, 503 while it is still loading or broken."""
+    body = {
+        "status": "ready" if state.ready else ("failed" if state.error else "starting"),
+        "service": state.service,
+        "port": port,
+        **state.as_dict(),
+    }
+    return JSONResponse(status_code=200 if state.ready else 503, content=body)
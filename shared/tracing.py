@@ -0,0 +1,233 @@
+"""
+Request IDs and spans across gateway -> RAG -> LLM, without an external tracing service.
+
+The first service a request reaches (normally the gateway) starts a trace; every
+upstream httpx call made while handling it carries the context on as a W3C
+`traceparent` header plus `X-Request-ID`, so all services share one trace ID.
+The request ID is also stamped on every log line (shared/logger.py) and returned
+in the `X-Request-ID` response header.
+
+Each service records a span per request and per stage (shared/instrumentation.py's
+`stage()` opens one). Finished spans go to an in-process ring buffer served at
+GET /debug/traces, and are appended to TRACE_EXPORT_PATH as JSONL when it is set.
+Point every service at the same file to rebuild whole requests offline:
+
+    python -m shared.tracing spans.jsonl --slowest 5
+"""
+import argparse
+import json
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional
+
+from shared.config import TRACE_BUFFER_SIZE, TRACE_EXPORT_PATH
+from shared.logger import current_request_id
+
+TRACEPARENT_HEADER = "traceparent"
+REQUEST_ID_HEADER = "x-request-id"
+# Probes and scrapes would crowd real requests out of the ring buffer
+UNTRACED_PATHS = ("/health", "/live", "/ready", "/metrics", "/debug/traces")
+
+
+class SpanContext:
+    __slots__ = ("trace_id", "span_id", "request_id")
+
+    def __init__(self, trace_id: str, span_id: str, request_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.request_id = request_id
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+_current: ContextVar[Optional[SpanContext]] = ContextVar("current_span", default=None)
+
+
+def parse_traceparent(value: Optional[str]):
+    """(trace_id, parent span_id) from a W3C traceparent header, or None if absent or malformed."""
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2]
+
+
+class SpanExporter:
+    """Keeps the most recent spans in memory; optionally appends each to a JSONL file."""
+
+    def __init__(self, size: int = TRACE_BUFFER_SIZE, path: str = TRACE_EXPORT_PATH):
+        self._spans = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1) if path else None
+
+    def export(self, span: Dict):
+        with self._lock:
+            self._spans.append(span)
+            if self._file is not None:
+                self._file.write(json.dumps(span, ensure_ascii=False) + "\n")
+
+    def spans(self, trace_id: Optional[str] = None) -> List[Dict]:
+        with self._lock:
+            spans = list(self._spans)
+        return [s for s in spans if trace_id is None or s["trace_id"] == trace_id]
+
+
+exporter = SpanExporter()
+# Set by configure() when the service installs instrumentation
+service_name = "service"
+
+
+def configure(service: str):
+    global service_name
+    service_name = service
+
+
+def current_context() -> Optional[SpanContext]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, parent: Optional[SpanContext] = None, request_id: Optional[str] = None, **attributes):
+    """
+    Records a span around the block; it is the parent of spans and upstream calls made inside it.
+    Without a current span (or `parent`) a new trace is started.
+    """
+    parent = parent or _current.get()
+    context = SpanContext(
+        trace_id=parent.trace_id if parent else secrets.token_hex(16),
+        span_id=secrets.token_hex(8),
+        request_id=request_id or (parent.request_id if parent else ""),
+    )
+    if not context.request_id:
+        context.request_id = context.trace_id
+    token = _current.set(context)
+    log_token = current_request_id.set(context.request_id)
+    started_at, started = time.time(), time.perf_counter()
+    record = {"status": "ok"}
+    try:
+        yield record
+    except BaseException as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        current_request_id.reset(log_token)
+        exporter.export({
+            "trace_id": context.trace_id,
+            "span_id": context.span_id,
+            "parent_id": parent.span_id if parent else None,
+            "request_id": context.request_id,
+            "service": service_name,
+            "name": name,
+            "start": round(started_at, 6),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            **attributes,
+            **record,
+        })
+
+
+async def inject_headers(request):
+    """httpx request hook: carries the current trace and request ID to the upstream service."""
+    context = _current.get()
+    if context is not None:
+        request.headers[TRACEPARENT_HEADER] = context.traceparent()
+        request.headers[REQUEST_ID_HEADER] = context.request_id
+
+
+class TracingMiddleware:
+    """Plain ASGI middleware: continues (or starts) the trace and wraps the request in a server span."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(UNTRACED_PATHS):
+            await self.app(scope, receive, send)
+            return
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        incoming = parse_traceparent(headers.get(TRACEPARENT_HEADER))
+        # Client-supplied IDs are kept short and printable, they end up in log lines
+        request_id = headers.get(REQUEST_ID_HEADER, "")[:64]
+        if not (request_id.isascii() and request_id.isprintable()):
+            request_id = ""
+        parent = SpanContext(incoming[0], incoming[1], request_id) if incoming else None
+
+        attributes = {"method": scope["method"], "path": scope["path"]}
+        with span(f"{scope['method']} {scope['path']}", parent=parent, request_id=request_id or None,
+                  **attributes) as record:
+            context = _current.get()
+
+            async def send_with_id(message):
+                if message["type"] == "http.response.start":
+                    record["status_code"] = message["status"]
+                    headers = list(message.get("headers", []))
+                    headers.append((REQUEST_ID_HEADER.encode("latin-1"), context.request_id.encode("latin-1")))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_with_id)
+
+
+def summarize_traces(spans: Iterable[Dict]) -> List[Dict]:
+    """One entry per trace: its root span, total duration and the services it crossed, slowest first."""
+    traces: Dict[str, List[Dict]] = {}
+    for s in spans:
+        traces.setdefault(s["trace_id"], []).append(s)
+    summaries = []
+    for trace_id, members in traces.items():
+        span_ids = {s["span_id"] for s in members}
+        roots = [s for s in members if s["parent_id"] not in span_ids] or members
+        root = min(roots, key=lambda s: s["start"])
+        end = max(s["start"] + s["duration_ms"] / 1000 for s in members)
+        summaries.append({
+            "trace_id": trace_id,
+            "request_id": root["request_id"],
+            "root": f"{root['service']}: {root['name']}",
+            "duration_ms": round((end - root["start"]) * 1000, 3),
+            "spans": len(members),
+            "services": sorted({s["service"] for s in members}),
+        })
+    return sorted(summaries, key=lambda t: t["duration_ms"], reverse=True)
+
+
+def span_tree(spans: List[Dict]) -> List[Dict]:
+    """Nests a trace's spans under their parents, children in start order."""
+    nodes = {s["span_id"]: {**s, "children": []} for s in sorted(spans, key=lambda s: s["start"])}
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node["parent_id"])
+        (parent["children"] if parent else roots).append(node)
+    return roots
+
+
+def debug_traces(trace_id: Optional[str] = None, limit: int = 20) -> Dict:
+    """Body of GET /debug/traces: recent traces, or one trace's span tree."""
+    if trace_id:
+        return {"service": service_name, "trace_id": trace_id, "spans": span_tree(exporter.spans(trace_id))}
+    return {"service": service_name, "traces": summarize_traces(exporter.spans())[:limit]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Slowest traces from TRACE_EXPORT_PATH files, as span trees.")
+    parser.add_argument("files", nargs="+", help="JSONL span files (one per service, or one shared file)")
+    parser.add_argument("--slowest", type=int, default=5)
+    args = parser.parse_args()
+
+    all_spans = []
+    for path in args.files:
+        with open(path, encoding="utf-8") as f:
+            all_spans += [json.loads(line) for line in f if line.strip()]
+    report = []
+    for summary in summarize_traces(all_spans)[:args.slowest]:
+        members = [s for s in all_spans if s["trace_id"] == summary["trace_id"]]
+        report.append({**summary, "tree": span_tree(members)})
+    print(json.dumps(report, indent=2, ensure_ascii=False))
@@ -1,5 +1,6 @@
 import requests
-from shared.config import T2S_SERVICE_URL
+from shared import deadline
+from shared.config import T2S_SERVICE_URL, T2S_CLIENT_TIMEOUT
 
 def request_tts_audio(text: str, lang: str = "en") -> bytes:
     """
@@ -12,11 +13,13 @@ def request_tts_audio(text: str, lang: str = "en") -> bytes:
     Returns:
         bytes: MP3 audio bytes.
     """
+    left = deadline.remaining()
     try:
         response = requests.post(
             T2S_SERVICE_URL,
             json={"text": text, "lang": lang},
-            timeout=20
+            headers={deadline.BUDGET_HEADER: str(max(0, int(left * 1000)))} if left is not None else None,
+            timeout=deadline.timeout_for(T2S_CLIENT_TIMEOUT)
         )
         response.raise_for_status()
         return response.content
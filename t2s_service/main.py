@@ -1,16 +1,35 @@
+from shared.startup import StartupState, readiness_response
+
+startup = StartupState("Text-2-Speech Service")
+
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field
 from gtts import gTTS
 from io import BytesIO
 from fastapi.responses import StreamingResponse
+import asyncio
+from shared import deadline
+from shared.deadline import install_deadlines
+from shared.instrumentation import install_instrumentation, stage
 from shared.logger import get_logger
 from shared.config import T2S_SERVICE_PORT
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="DivineGPT - Text to Speech Service")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # gTTS synthesises remotely per request, so there is nothing to warm up
+    startup.record("app import")
+    startup.mark_ready()
+    yield
+
+
+app = FastAPI(title="DivineGPT - Text to Speech Service", lifespan=lifespan)
 logger = get_logger("T2S Service")
 
 
+# Deadlines come from the caller (X-Request-Budget-Ms); without one the configured timeouts apply
+install_deadlines(app)
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -19,6 +38,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+install_instrumentation(app, "t2s")
 
 
 class T2SRequest(BaseModel):
@@ -34,9 +54,12 @@ async def speak(request: T2SRequest):
 
     try:
         logger.info(f"T2S: Generating audio for lang={request.lang} for text (first 100 chars): {request.text[:100]}")
-        tts = gTTS(text=request.text, lang=request.lang)
-        mp3_fp = BytesIO()
-        tts.write_to_fp(mp3_fp)
+        # gTTS blocks on its HTTP round trip: in a thread, the event loop stays free and the
+        # request can be cancelled at its deadline (the thread finishes, its audio is discarded)
+        with stage("synthesis"):
+            tts = gTTS(text=request.text, lang=request.lang, timeout=deadline.timeout_for(None))
+            mp3_fp = BytesIO()
+            await asyncio.to_thread(tts.write_to_fp, mp3_fp)
         mp3_fp.seek(0)
         return StreamingResponse(mp3_fp, media_type="audio/mpeg")
     except Exception as e:
@@ -57,5 +80,10 @@ async def get_status():
 
 
 @app.get("/health")
+@app.get("/live")
 async def health_check():
     return {"status": "ok", "service": "Text-2-Speech Service", "port": T2S_SERVICE_PORT}
+
+@app.get("/ready")
+async def readiness_check():
+    return readiness_response(startup, T2S_SERVICE_PORT)